@@ -0,0 +1,363 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import datetime
+import threading
+import collections
+from aiohttp import web
+import config
+from wled import WLEDController
+from notifier import TelegramNotifier, PRIORITY_COMMAND, PRIORITY_ALERT
+from occupancy import ENTER, EXIT
+from bus import encode, parse_address
+from metrics import REGISTRY
+
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+class _Room:
+    """Authoritative state of one room: count, lights and recently accepted events."""
+    def __init__(self, name, count=0):
+        self.name = name
+        self.count = count
+        self.recent = collections.deque(maxlen=64) # [time, kind, node, nodes already matched against it]
+        hosts = config.AGGREGATOR_ROOMS.get(name)
+        if hosts is None:
+            # Sharing a default would let rooms switch each other's lamps
+            logging.warning(f"Room '{name}' has no entry in AGGREGATOR_ROOMS. Its lights won't be switched.")
+            hosts = []
+        self.wled = WLEDController(hosts, name)
+        self.lights_on = False
+        self.lit_count = 0
+        self.empty_since = None
+
+        REGISTRY.gauge("aggregator_room_count", "People in the room, across every node.", fn=lambda: self.count, room=name)
+        REGISTRY.gauge("aggregator_wled_active", "1 while the room's lights are on.", fn=lambda: int(self.lights_on), room=name)
+
+    def duplicate_of(self, node, kind, event_time):
+        """
+        Matches an event against one another node already reported: the same
+        kind in the same room within AGGREGATOR_DEDUP_SECONDS. Each accepted
+        event absorbs at most one report per other node, so two people
+        entering together still count twice.
+        """
+        for entry in self.recent:
+            accepted_time, accepted_kind, accepted_node, matched = entry
+            if (accepted_kind == kind and accepted_node != node and node not in matched
+                    and abs(accepted_time - event_time) <= config.AGGREGATOR_DEDUP_SECONDS):
+                matched.add(node)
+                return True
+        return False
+
+class Aggregator:
+    """
+    Combines the entry/exit events of several detector nodes.
+    Nodes (bus.BusPublisher) send compact events; each is applied once, by
+    (node, boot, seq), and a report of the same movement from another node
+    (cameras with overlapping views of a door) is dropped as a duplicate.
+    The resulting per-room counts are the only thing driving WLED and
+    Telegram. Counts and sequence numbers are saved before an event is
+    acknowledged, so neither an aggregator nor a node restart loses or
+    double-counts anything.
+    All state changes go through handle() and tick(), which take the time
+    as an argument and do no I/O; persist() writes the state file off the
+    event loop before the connection acknowledges.
+    """
+    def __init__(self, state_file=None, notifier=None):
+        self.state_file = state_file if state_file is not None else config.AGGREGATOR_STATE_FILE
+        self.notifier = notifier
+        self.rooms = {}
+        self.nodes = {} # name -> {'boot', 'last_seq', 'last_seen', 'online', 'rooms'}
+        self._lock = threading.Lock() # The Telegram listener reads state from its own thread
+        self._connections = set() # Node stream writers
+        self._dirty = False # State changed since the last save
+        self._saving = None # asyncio.Lock serialising state file writes, created on the loop
+
+        # Stats
+        self.accepted = 0
+        self.duplicates = 0
+        self.repeats = 0 # Resent events that were already applied
+
+        REGISTRY.counter("aggregator_events_total", "Node events applied to a room count.", fn=lambda: self.accepted)
+        REGISTRY.counter("aggregator_duplicates_total", "Events dropped as another node's report of the same movement.",
+                         fn=lambda: self.duplicates)
+        REGISTRY.counter("aggregator_repeats_total", "Events resent by a node after a reconnect.", fn=lambda: self.repeats)
+        REGISTRY.gauge("aggregator_nodes_online", "Nodes that sent a heartbeat recently.",
+                       fn=lambda: sum(n['online'] for n in self.nodes.values()))
+
+        self._load()
+
+    # --- State ---
+
+    def room(self, name):
+        room = self.rooms.get(name)
+        if room is None:
+            room = self.rooms[name] = _Room(name)
+        return room
+
+    def _load(self):
+        if not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file) as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not read {self.state_file} ({e}). Starting with empty rooms.")
+            return
+        for name, count in state.get('rooms', {}).items():
+            room = self.rooms[name] = _Room(name, count)
+            if count > 0:
+                room.wled.turn_on(count)
+                room.lights_on = True
+                room.lit_count = count
+        for name, node in state.get('nodes', {}).items():
+            self.nodes[name] = {'boot': node['boot'], 'last_seq': node['last_seq'],
+                                'last_seen': None, 'online': False, 'rooms': {}}
+        logging.info(f"Restored {len(self.rooms)} rooms and {len(self.nodes)} nodes from {self.state_file}.")
+
+    def _save(self, state):
+        """
+        Written to a temporary file, synced and renamed, so neither a crash nor
+        a power cut leaves half a file or loses an acknowledged event.
+        """
+        tmp = self.state_file + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.state_file)
+
+    async def persist(self):
+        """
+        Saves the state if it changed, on an executor thread. Changes made
+        while a save is running are written by the next call, so under load
+        one write covers the events of several connections.
+        """
+        if self._saving is None:
+            self._saving = asyncio.Lock()
+        async with self._saving:
+            with self._lock:
+                if not self._dirty:
+                    return # An earlier save already included our change
+                state = {
+                    'rooms': {name: room.count for name, room in self.rooms.items()},
+                    'nodes': {name: {'boot': n['boot'], 'last_seq': n['last_seq']} for name, n in self.nodes.items()},
+                }
+                self._dirty = False
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self._save, state)
+            except OSError:
+                with self._lock:
+                    self._dirty = True # Retried by the next save; nothing is acknowledged meanwhile
+                raise
+
+    # --- Messages ---
+
+    def hello(self, name, boot, now):
+        """
+        A node (re)connected.
+        Returns:
+            The last sequence number applied for this boot, to acknowledge right away.
+        """
+        with self._lock:
+            node = self.nodes.get(name)
+            if node is None:
+                node = self.nodes[name] = {'boot': None, 'last_seq': 0, 'last_seen': None, 'online': False, 'rooms': {}}
+            if node['boot'] != boot:
+                # Restarted: its sequence numbers begin again
+                if node['boot'] is not None:
+                    logging.warning(f"Node {name} restarted.")
+                node['boot'] = boot
+                node['last_seq'] = 0
+                self._dirty = True
+            self._seen(name, node, now)
+            return node['last_seq']
+
+    def handle(self, name, message, now):
+        """
+        Applies one message from a node that has said hello.
+        Returns:
+            The sequence number to acknowledge, or None.
+        """
+        with self._lock:
+            node = self.nodes[name]
+            self._seen(name, node, now)
+            if message['type'] == 'heartbeat':
+                node['rooms'] = message.get('rooms', {})
+                return None
+            if message['type'] != 'event':
+                return None
+
+            seq = message['seq']
+            if seq <= node['last_seq']:
+                self.repeats += 1
+                return node['last_seq']
+            node['last_seq'] = seq
+
+            room = self.room(message['room'])
+            kind = message['kind']
+            if room.duplicate_of(name, kind, message['time']):
+                self.duplicates += 1
+                logging.info(f"Duplicate {kind} in {room.name} from {name} dropped.")
+            else:
+                room.recent.append([message['time'], kind, name, set()])
+                self.accepted += 1
+                self._apply(room, message, now)
+            self._dirty = True
+            return seq
+
+    def disconnected(self, name):
+        logging.info(f"Node {name} disconnected.")
+
+    def _seen(self, name, node, now):
+        node['last_seen'] = now
+        if not node['online']:
+            node['online'] = True
+            logging.info(f"Node {name} online.")
+
+    def _apply(self, room, message, now):
+        kind = message['kind']
+        if kind == ENTER:
+            room.count += 1
+            time_str = datetime.datetime.fromtimestamp(message['time']).strftime("%I:%M %p")
+            self._alert(f"[{room.name}] 🚪 Entry Detected at {time_str}\n👥 Room Count: {room.count}")
+        elif kind == EXIT:
+            room.count = max(0, room.count - 1) # A missed entry must not leave the room below zero
+            mins, secs = divmod(int(message.get('duration', 0)), 60)
+            self._alert(f"[{room.name}] 🏃 Exit Detected.\nDuration: {mins}m {secs}s\n👥 Room Count: {room.count}")
+
+        if room.count > 0:
+            room.empty_since = None
+            if not room.lights_on or room.count != room.lit_count:
+                room.wled.turn_on(room.count)
+                room.lights_on = True
+                room.lit_count = room.count
+        elif room.lights_on and room.empty_since is None:
+            room.empty_since = now
+
+    def tick(self, now):
+        """Switches off the lights of rooms empty for TIMEOUT_SECONDS and notices silent nodes."""
+        with self._lock:
+            for room in self.rooms.values():
+                if room.lights_on and room.count == 0 and room.empty_since is not None \
+                        and now - room.empty_since >= config.TIMEOUT_SECONDS:
+                    room.wled.turn_off()
+                    room.lights_on = False
+                    room.lit_count = 0
+                    room.empty_since = None
+            for name, node in self.nodes.items():
+                if node['online'] and now - node['last_seen'] > config.AGGREGATOR_NODE_TIMEOUT:
+                    node['online'] = False
+                    logging.warning(f"Node {name} silent for {config.AGGREGATOR_NODE_TIMEOUT:.0f}s.")
+                    self._alert(f"⚠️ Node {name} is offline.")
+
+    def _alert(self, text, priority=PRIORITY_ALERT):
+        if self.notifier is not None:
+            self.notifier.send_message(text, priority)
+
+    def to_json(self):
+        with self._lock:
+            return {
+                'rooms': {name: {'count': room.count, 'lights': room.lights_on} for name, room in self.rooms.items()},
+                'nodes': {name: {'online': n['online'], 'last_seq': n['last_seq'], 'rooms': n['rooms']}
+                          for name, n in self.nodes.items()},
+                'accepted': self.accepted,
+                'duplicates': self.duplicates,
+                'repeats': self.repeats,
+            }
+
+    # --- Telegram ---
+
+    def command(self, action, arg=""):
+        """Telegram commands; only /status makes sense without a camera."""
+        if action != 'status':
+            self._alert("⚠️ Not available on the aggregator. Ask a node directly.", PRIORITY_COMMAND)
+            return
+        state = self.to_json()
+        text = "📊 *System Status*"
+        for name, room in state['rooms'].items():
+            lights = "ON 💡" if room['lights'] else "OFF ⚫"
+            text += f"\n🏠 {name}: {room['count']} 👥, lights {lights}"
+        for name, node in state['nodes'].items():
+            text += f"\n🖥️ {name}: {'online 🟢' if node['online'] else 'offline 🔴'}"
+        self._alert(text, PRIORITY_COMMAND)
+
+    # --- Transport ---
+
+    async def _serve_node(self, reader, writer):
+        """One node connection: newline-delimited JSON in, cumulative acks out."""
+        name = None
+        self._connections.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if message.get('type') == 'hello':
+                    name = message['node']
+                    ack = self.hello(name, message['boot'], time.time())
+                elif name is None:
+                    logging.warning("Aggregator: message before hello. Closing connection.")
+                    break
+                else:
+                    ack = self.handle(name, message, time.time())
+                if ack is not None:
+                    await self.persist() # Acknowledged only once it is on disk
+                    writer.write(encode({'type': 'ack', 'seq': ack}))
+                    await writer.drain()
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Aggregator: dropping node {name or '?'} connection: {e}")
+        finally:
+            if name is not None:
+                self.disconnected(name)
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _tick_loop(self):
+        while True:
+            self.tick(time.time())
+            await asyncio.sleep(0.5)
+
+    async def serve(self, address=None, status_port=None):
+        """Runs the node listener, /status and /metrics until cancelled."""
+        host, port = parse_address(address or f"0.0.0.0:{config.AGGREGATOR_PORT}")
+        server = await asyncio.start_server(self._serve_node, host, port)
+
+        async def status(request):
+            return web.json_response(self.to_json())
+
+        async def metrics(request):
+            return web.Response(body=REGISTRY.render().encode(), headers={'Content-Type': "text/plain; version=0.0.4"})
+
+        app = web.Application()
+        app.router.add_get("/status", status)
+        app.router.add_get("/metrics", metrics)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, status_port or config.AGGREGATOR_STATUS_PORT).start()
+
+        logging.warning(f"Aggregator listening on {host}:{port}.")
+        try:
+            async with server:
+                await self._tick_loop()
+        finally:
+            for writer in list(self._connections):
+                writer.close() # Nodes reconnect and resend whatever wasn't acknowledged
+            await runner.cleanup()
+
+def main():
+    notifier = TelegramNotifier()
+    aggregator = Aggregator(notifier=notifier)
+    notifier.start_listening(aggregator.command)
+    try:
+        asyncio.run(aggregator.serve())
+    except KeyboardInterrupt:
+        logging.info("Interrupted.")
+    finally:
+        for room in aggregator.rooms.values():
+            room.wled.close()
+
+if __name__ == "__main__":
+    main()
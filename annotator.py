@@ -0,0 +1,65 @@
+import cv2
+import numpy as np
+from collections import namedtuple
+
+# Everything needed to draw a frame's overlay. Cheap to build every frame;
+# the actual drawing only happens when a consumer asks for it.
+Overlay = namedtuple('Overlay', ['tracks', 'zones', 'status_text', 'pending_exit_ids', 'drag_rect'])
+
+# BGR colour per zone type
+ZONE_COLORS = {'door': (255, 0, 0), 'exclude': (0, 0, 255), 'inside': (0, 255, 0)}
+
+def get_absolute_rect(rect, width, height):
+    dx1, dy1, dx2, dy2 = rect
+    x1, y1 = int(dx1 * width), int(dy1 * height)
+    x2, y2 = int(dx2 * width), int(dy2 * height)
+    return x1, y1, x2, y2
+
+class FrameAnnotator:
+    """
+    Draws the overlay (tracks, door, status) into a buffer that is reused
+    between frames. Each consumer owns its own annotator, so the returned
+    buffer is only valid until that consumer's next render() call.
+    """
+    def __init__(self):
+        self.buffer = None
+
+    def render(self, frame, overlay, out=None):
+        """Copies the frame into the reusable buffer (or `out`) and draws the overlay on it."""
+        if out is None:
+            if self.buffer is None or self.buffer.shape != frame.shape:
+                self.buffer = np.empty_like(frame, subok=False) # Plain array, even for pooled frames
+            out = self.buffer
+        np.copyto(out, frame)
+        if overlay is None:
+            return out
+
+        height, width = frame.shape[:2]
+
+        # Tracks
+        for trk in overlay.tracks:
+            x1, y1, x2, y2 = (int(v) for v in trk['box'])
+            cv2.rectangle(out, (x1, y1), (x2, y2), (0, 200, 255), 2)
+            cv2.putText(out, f"id:{trk['id']}", (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 200, 255), 1)
+
+        # Draw Zones
+        scale = np.array([width, height], dtype=np.float32)
+        for name, zone_type, points in overlay.zones:
+            color = ZONE_COLORS.get(zone_type, (255, 255, 255))
+            polygon = np.round(points * scale).astype(np.int32)
+            cv2.polylines(out, [polygon], True, color, 2)
+            x, y = polygon.min(axis=0)
+            cv2.putText(out, name.upper(), (int(x), int(y) - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+
+        # Draw drag rect (door being edited in the debug window)
+        if overlay.drag_rect:
+            dx1, dy1, dx2, dy2 = get_absolute_rect(overlay.drag_rect, width, height)
+            cv2.rectangle(out, (dx1, dy1), (dx2, dy2), (0, 255, 255), 2)
+
+        # Viz Pending Exits
+        for tid in overlay.pending_exit_ids:
+            cv2.putText(out, f"Wait Exit {tid}...", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 128, 255), 2)
+
+        cv2.putText(out, overlay.status_text, (10, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+        return out
@@ -0,0 +1,389 @@
+"""
+Load test for the streaming and notification I/O paths.
+
+A synthetic producer publishes frames to the stream server at a set rate,
+like main() does, while a separate client process opens N /video_feed
+viewers and M /snapshot pollers and runs a fake Telegram Bot API that a
+real TelegramNotifier sends alerts to. Reports delivered FPS per viewer,
+encode CPU, alert latency, producer lag, threads and memory.
+
+Examples:
+    python benchmark.py --viewers 20 --duration 30
+    python benchmark.py --viewers 50 --rendition small --viewer-fps 5 --alerts-per-minute 120 --json bench.json
+    python benchmark.py --viewers 30 --api-delay 0.3 --min-client-fps 15
+
+The fake Bot API and the clients run in their own process, so the CPU,
+thread and memory figures are the server's alone.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import re
+import sys
+import tempfile
+import threading
+import time
+import cv2
+import numpy as np
+import config
+import frames
+import metrics
+import streamer
+from annotator import Overlay
+from frames import FramePool
+from replay import percentiles, peak_rss_mb
+
+BOUNDARY = b'--frame\r\n'
+ALERT_TAG = re.compile(r"#a(\d+)")
+
+def rss_mb():
+    """Current resident memory, or None if it can't be read here."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        try:
+            import psutil
+            return psutil.Process().memory_info().rss / (1024 * 1024)
+        except ImportError:
+            return None
+
+def synthetic_frame(width, height):
+    """Smooth background with some structure, so JPEG sizes look like a real room."""
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[..., 0] = (0.6 * x + 0.4 * y).astype(np.uint8)
+    frame[..., 1] = (0.3 * x + 0.5 * y).astype(np.uint8)
+    frame[..., 2] = 255 - frame[..., 0]
+    for i in range(8):
+        cv2.rectangle(frame, (i * width // 8, height // 2), (i * width // 8 + width // 16, height - 1), (40 * i, 90, 160), -1)
+    return frame
+
+class Producer:
+    """Publishes synthetic frames with a moving 'person' to the streamer at a fixed rate."""
+    def __init__(self, fps, width, height):
+        self.fps = fps
+        self.width = width
+        self.height = height
+        self.background = synthetic_frame(width, height)
+        self.pool = FramePool()
+        self.frames = 0
+        self.lags = [] # Seconds each frame was published after its slot
+        self.elapsed = 0.0
+        self.latest = None
+        self._lock = threading.Lock()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="producer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._thread.join()
+        if self.latest is not None:
+            frames.release(self.latest)
+
+    def take(self):
+        """The latest frame with a reference held for the caller (release() it), or None."""
+        with self._lock:
+            if self.latest is not None:
+                frames.retain(self.latest)
+            return self.latest
+
+    def _run(self):
+        started = time.perf_counter()
+        while self._running:
+            self.elapsed = time.perf_counter() - started
+            slot = started + self.frames / self.fps
+            delay = slot - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self.lags.append(max(0.0, time.perf_counter() - slot))
+
+            # 1. Fill a recycled buffer, as the capture thread does
+            buf = self.pool.acquire() or self.pool.wrap(np.empty_like(self.background))
+            np.copyto(buf.array, self.background)
+            x = int((self.frames * 7) % (self.width - 120))
+            box = [x, self.height // 4, x + 120, self.height - 20]
+            cv2.rectangle(buf.array, tuple(box[:2]), tuple(box[2:]), (30, 30, 200), -1)
+
+            # 2. Publish with an overlay, so viewers pay for annotation too
+            tracks = [{'id': 1, 'box': box, 'center': ((box[0] + box[2]) / 2, (box[1] + box[3]) / 2)}]
+            overlay = Overlay(tracks, [], f"Count: 1 | ON | frame {self.frames}", set(), None)
+            streamer.update_frame(buf.view, overlay)
+
+            # 3. Keep one reference for alert photos, like the main loop's last frame
+            frames.retain(buf.view)
+            with self._lock:
+                previous, self.latest = self.latest, buf.view
+            if previous is not None:
+                frames.release(previous)
+            frames.release(buf.view)
+            self.frames += 1
+
+# --- Client process ---
+
+async def _viewer(session, url, deadline, result):
+    """One /video_feed client; counts frames by their multipart boundary."""
+    loop = asyncio.get_running_loop()
+    try:
+        async with session.get(url) as response:
+            result['status'] = response.status
+            if response.status != 200:
+                return
+            tail = b''
+            async for chunk in response.content.iter_any():
+                data = tail + chunk
+                count = data.count(BOUNDARY)
+                if count:
+                    now = loop.time()
+                    if result['first'] is None:
+                        result['first'] = now
+                    result['last'] = now
+                    result['frames'] += count
+                result['bytes'] += len(chunk)
+                tail = data[-(len(BOUNDARY) - 1):]
+                if loop.time() >= deadline:
+                    break
+    except Exception as e:
+        result['error'] = str(e)
+
+async def _snapshot_client(session, url, interval, deadline, result):
+    loop = asyncio.get_running_loop()
+    while loop.time() < deadline:
+        started = loop.time()
+        try:
+            async with session.get(url) as response:
+                await response.read()
+                if response.status == 200:
+                    result['latencies'].append(loop.time() - started)
+                else:
+                    result['errors'] += 1
+        except Exception:
+            result['errors'] += 1
+        await asyncio.sleep(max(0.0, interval - (loop.time() - started)))
+
+async def _clients(args, api_port, ready, results):
+    from aiohttp import web, ClientSession, ClientTimeout, TCPConnector
+
+    # Fake Bot API: accepts every method and records when each tagged alert arrives
+    received = {}
+    requests_seen = {}
+    async def bot_api(request):
+        method = request.match_info['method']
+        requests_seen[method] = requests_seen.get(method, 0) + 1
+        if request.content_type == 'application/json':
+            fields = await request.json()
+        else:
+            fields = {k: v for k, v in (await request.post()).items() if isinstance(v, str)}
+        now = time.time()
+        for alert in ALERT_TAG.findall(json.dumps(fields, ensure_ascii=False)):
+            received.setdefault(int(alert), now)
+        if args.api_delay:
+            await asyncio.sleep(args.api_delay)
+        return web.json_response({'ok': True, 'result': {'message_id': sum(requests_seen.values())}})
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post("/bot{token}/{method}", bot_api)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', api_port).start()
+    ready.set()
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + args.duration
+    base = f"http://127.0.0.1:{args.port}"
+    query = f"?rendition={args.rendition}" if args.rendition else ""
+    feed = f"{base}/video_feed{query}{'&' if query else '?'}fps={args.viewer_fps}" if args.viewer_fps else f"{base}/video_feed{query}"
+
+    viewers = [{'frames': 0, 'bytes': 0, 'first': None, 'last': None, 'status': None} for _ in range(args.viewers)]
+    pollers = [{'latencies': [], 'errors': 0} for _ in range(args.snapshot_clients)]
+    async with ClientSession(connector=TCPConnector(limit=0), timeout=ClientTimeout(total=None, sock_read=30)) as session:
+        await asyncio.gather(
+            *(_viewer(session, feed, deadline, v) for v in viewers),
+            *(_snapshot_client(session, f"{base}/snapshot{query}", args.snapshot_interval, deadline, p) for p in pollers))
+
+    # Alerts still in flight get a little longer
+    await asyncio.sleep(args.alert_grace)
+    await runner.cleanup()
+    results.put({'viewers': viewers, 'pollers': pollers, 'received': received, 'requests': requests_seen})
+
+def _client_process(args, api_port, ready, results):
+    asyncio.run(_clients(args, api_port, ready, results))
+
+# --- Benchmark ---
+
+def run(args):
+    """Runs the load test. Returns the report."""
+    metrics.record_raw_samples()
+    config.TELEGRAM_API_URL = f"http://127.0.0.1:{args.api_port}"
+    config.TELEGRAM_TOKEN = "benchmark"
+    config.TELEGRAM_CHAT_ID = "1"
+    from notifier import TelegramNotifier
+    from snapshots import SnapshotStore
+
+    streamer.start_server(args.port)
+    producer = Producer(args.fps, args.width, args.height)
+    producer.start()
+
+    # Spawned, not forked: this process already runs threads
+    context = multiprocessing.get_context('spawn')
+    ready = context.Event()
+    results = context.Queue()
+    clients = context.Process(target=_client_process, args=(args, args.api_port, ready, results), daemon=True)
+    clients.start()
+    if not ready.wait(30):
+        raise RuntimeError("Client process did not start")
+
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        notifier = TelegramNotifier(SnapshotStore(snapshot_dir))
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        sent = {} # Alert number -> time queued
+        threads = []
+        memory = []
+        interval = 60.0 / args.alerts_per_minute if args.alerts_per_minute > 0 else None
+        next_alert = wall_start
+        next_sample = wall_start
+        report = None
+        while report is None:
+            now = time.perf_counter()
+            if interval is not None and now >= next_alert and now - wall_start < args.duration:
+                # Alternate entry photos and exit messages, like the pipeline
+                n = len(sent)
+                sent[n] = time.time()
+                frame = producer.take() if n % 2 == 0 else None
+                if frame is not None:
+                    notifier.send_photo(frame, f"🚪 Entry Detected #a{n}")
+                    frames.release(frame)
+                else:
+                    notifier.send_message(f"🏃 Exit Detected #a{n}")
+                next_alert += interval
+            if now >= next_sample:
+                threads.append(threading.active_count())
+                memory.append(rss_mb())
+                next_sample += 0.5
+            try:
+                report = results.get(timeout=0.05)
+            except queue.Empty:
+                if not clients.is_alive():
+                    raise RuntimeError("Client process exited without results")
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        producer.stop()
+        telegram = notifier.stats()
+    clients.join()
+
+    # Per-viewer FPS over the time it actually received frames; turned-away viewers are counted apart
+    fps = []
+    for v in report['viewers']:
+        if v['status'] not in (None, 200):
+            continue
+        if v['frames'] > 1 and v['last'] > v['first']:
+            fps.append((v['frames'] - 1) / (v['last'] - v['first']))
+        else:
+            fps.append(0.0)
+    rejected = sum(1 for v in report['viewers'] if v['status'] not in (None, 200))
+
+    stages = {stage: percentiles(samples) for stage, samples in metrics.stage_samples().items()}
+    encode_seconds = sum(sum(s) for stage, s in metrics.stage_samples().items() if stage in ('encode', 'annotate'))
+    latencies = [report['received'][n] - t for n, t in sent.items() if n in report['received']]
+    snapshot_latencies = [t for p in report['pollers'] for t in p['latencies']]
+    memory = [m for m in memory if m is not None]
+
+    return {
+        'settings': {
+            'viewers': args.viewers,
+            'snapshot_clients': args.snapshot_clients,
+            'rendition': args.rendition or config.STREAM_DEFAULT_RENDITION,
+            'viewer_fps': args.viewer_fps,
+            'producer_fps': args.fps,
+            'frame_size': [args.width, args.height],
+            'alerts_per_minute': args.alerts_per_minute,
+            'api_delay': args.api_delay,
+            'duration': args.duration,
+        },
+        'producer': {
+            'frames': producer.frames,
+            'fps': producer.frames / producer.elapsed if producer.elapsed > 0 else 0.0,
+            'lag': percentiles(producer.lags) if producer.lags else None,
+        },
+        'stream': {
+            'client_fps': [round(f, 2) for f in fps],
+            'fps_min': min(fps) if fps else None,
+            'fps_mean': float(np.mean(fps)) if fps else None,
+            'rejected': rejected,
+            'bytes_received': sum(v['bytes'] for v in report['viewers']),
+            'encoded_frames': streamer.broadcaster.encoded_frames,
+            'encode_cpu_cores': encode_seconds / wall if wall > 0 else 0.0,
+            'renditions': {name: r.to_json() for name, r in streamer.broadcaster.renditions.items()},
+            'snapshot_latency': percentiles(snapshot_latencies) if snapshot_latencies else None,
+            'snapshot_errors': sum(p['errors'] for p in report['pollers']),
+        },
+        'alerts': {
+            'sent': len(sent),
+            'delivered': len(latencies),
+            'latency': percentiles(latencies) if latencies else None,
+            'api_requests': report['requests'],
+            'telegram': telegram,
+        },
+        'process': {
+            'wall_seconds': round(wall, 3),
+            'cpu_cores': cpu / wall if wall > 0 else 0.0,
+            'threads_max': max(threads) if threads else None,
+            'rss_mb_max': round(max(memory), 1) if memory else None,
+            'peak_rss_mb': peak_rss_mb(),
+        },
+        'stages': stages,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the stream server and the Telegram notifier.")
+    parser.add_argument("--viewers", type=int, default=10, help="Concurrent /video_feed clients")
+    parser.add_argument("--rendition", help="Rendition the viewers and snapshot clients ask for")
+    parser.add_argument("--viewer-fps", type=float, default=None, help="?fps= sent by every viewer")
+    parser.add_argument("--snapshot-clients", type=int, default=2, help="Clients polling /snapshot")
+    parser.add_argument("--snapshot-interval", type=float, default=1.0, help="Seconds between polls per snapshot client")
+    parser.add_argument("--fps", type=float, default=20.0, help="Synthetic producer frame rate")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--alerts-per-minute", type=float, default=30.0, help="Alerts sent through the notifier (0 disables)")
+    parser.add_argument("--api-delay", type=float, default=0.0, help="Seconds the fake Bot API takes per request")
+    parser.add_argument("--alert-grace", type=float, default=5.0, help="Seconds allowed for queued alerts to arrive after the run")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of load")
+    parser.add_argument("--port", type=int, default=5055, help="Stream server port for the run")
+    parser.add_argument("--api-port", type=int, default=5056, help="Fake Bot API port")
+    parser.add_argument("--json", help="Write the report to this file")
+    parser.add_argument("--min-client-fps", type=float, default=None, help="Exit with status 1 if any viewer got fewer FPS")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    report = run(args)
+
+    stream, alerts, process = report['stream'], report['alerts'], report['process']
+    print(f"Viewers: {args.viewers}  FPS min/mean: {stream['fps_min'] or 0:.1f}/{stream['fps_mean'] or 0:.1f}  "
+          f"Rejected: {stream['rejected']}  Encode CPU: {stream['encode_cpu_cores']:.2f} cores")
+    lag = report['producer']['lag']
+    if lag:
+        print(f"Producer: {report['producer']['fps']:.1f} FPS  lag p99={lag['p99_ms']:.1f}ms max={lag['max_ms']:.1f}ms")
+    if alerts['latency']:
+        print(f"Alerts: {alerts['delivered']}/{alerts['sent']} delivered  latency p50={alerts['latency']['p50_ms']:.0f}ms "
+              f"p99={alerts['latency']['p99_ms']:.0f}ms")
+    print(f"Process: {process['cpu_cores']:.2f} cores  {process['threads_max']} threads  {process['rss_mb_max']} MB RSS")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.min_client_fps is not None and (stream['fps_min'] or 0) < args.min_client_fps:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import json
+import time
+import uuid
+import socket
+import logging
+import threading
+import itertools
+import collections
+import config
+from metrics import REGISTRY
+from occupancy import ENTER, EXIT
+
+# Wire format: one JSON object per line over TCP.
+#   node -> aggregator: hello {node, boot}, event {seq, room, kind, time, track[, duration]}, heartbeat {time, rooms}
+#   aggregator -> node: ack {seq} (every event up to seq is safely recorded)
+PUBLISHED_KINDS = (ENTER, EXIT)
+
+def encode(message):
+    return (json.dumps(message, separators=(',', ':')) + "\n").encode()
+
+def parse_address(address, default_port=None):
+    """'host:port' -> (host, port)."""
+    host, _, port = address.rpartition(':')
+    if not host:
+        return address, default_port or config.AGGREGATOR_PORT
+    return host, int(port)
+
+class BusPublisher:
+    """
+    Node side of the aggregator link.
+    publish() only queues the event; a background thread keeps one TCP
+    connection to the aggregator, (re)sends every event it hasn't
+    acknowledged yet and a heartbeat with the local counts every
+    AGGREGATOR_HEARTBEAT_SECONDS. Events survive aggregator restarts and
+    network drops (up to AGGREGATOR_QUEUE_SIZE of them); the aggregator
+    ignores repeats by sequence number.
+    """
+    def __init__(self, address=None, node=None, counts=None):
+        self.host, self.port = parse_address(address or config.AGGREGATOR_ADDRESS)
+        self.node = node or config.NODE_NAME or socket.gethostname()
+        self.boot = uuid.uuid4().hex[:12] # New on every start, so sequence numbers can restart at 1
+        self.counts = counts # Optional callable -> {room: local count}, sent with heartbeats
+
+        self._cond = threading.Condition()
+        self._unacked = collections.OrderedDict() # seq -> message
+        self._seq = itertools.count(1)
+        self._running = True
+        self._sock = None
+
+        # Stats
+        self.connected = False
+        self.published = 0
+        self.acked = 0
+        self.dropped = 0
+
+        REGISTRY.gauge("bus_connected", "1 while connected to the aggregator.", fn=lambda: int(self.connected))
+        REGISTRY.gauge("bus_unacked_events", "Events not yet acknowledged by the aggregator.", fn=lambda: len(self._unacked))
+
+        self._thread = threading.Thread(target=self._run, name="bus-publisher", daemon=True)
+        self._thread.start()
+
+    # --- Public API ---
+
+    def publish(self, room, event):
+        """Queues an occupancy.Event (entries and exits only) for the aggregator."""
+        if event.kind not in PUBLISHED_KINDS:
+            return
+        with self._cond:
+            seq = next(self._seq)
+            if len(self._unacked) >= config.AGGREGATOR_QUEUE_SIZE:
+                self._unacked.popitem(last=False)
+                self.dropped += 1
+            message = {'type': 'event', 'seq': seq, 'room': room, 'kind': event.kind,
+                       'time': event.time, 'track': int(event.track_id)}
+            if event.kind == EXIT:
+                message['duration'] = round(event.duration, 1)
+            self._unacked[seq] = message
+            self.published += 1
+            self._cond.notify()
+
+    def pending(self):
+        with self._cond:
+            return len(self._unacked)
+
+    def close(self, timeout=2.0):
+        """Gives queued events up to `timeout` seconds to be acknowledged, then disconnects."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._cond.wait_for(lambda: not self._unacked, max(0.0, deadline - time.monotonic()))
+            self._running = False
+            self._cond.notify_all()
+        self._disconnect()
+        self._thread.join(timeout=1.0)
+
+    # --- Connection ---
+
+    def _disconnect(self):
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR) # Unblocks the reader thread
+            except OSError:
+                pass
+            try:
+                sock.close()
+            except OSError:
+                pass
+        self.connected = False
+
+    def _run(self):
+        delay = config.AGGREGATOR_RETRY_BASE
+        while self._running:
+            try:
+                self._sock = socket.create_connection((self.host, self.port), timeout=5.0)
+                self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self._sock.settimeout(None)
+                self._sock.sendall(encode({'type': 'hello', 'node': self.node, 'boot': self.boot}))
+            except OSError as e:
+                self._disconnect()
+                logging.warning(f"Aggregator {self.host}:{self.port} unreachable ({e}). Retrying in {delay:.0f}s.")
+                with self._cond:
+                    self._cond.wait_for(lambda: not self._running, delay)
+                delay = min(delay * 2, config.AGGREGATOR_RETRY_MAX_DELAY)
+                continue
+
+            delay = config.AGGREGATOR_RETRY_BASE
+            self.connected = True
+            logging.info(f"Connected to aggregator {self.host}:{self.port} as {self.node}.")
+            reader = threading.Thread(target=self._reader_thread, args=(self._sock,), name="bus-reader", daemon=True)
+            reader.start()
+            try:
+                self._writer_loop()
+            except OSError as e:
+                if self._running:
+                    logging.warning(f"Aggregator connection lost: {e}")
+            self._disconnect()
+            reader.join(timeout=1.0)
+
+    def _writer_loop(self):
+        sock = self._sock
+        sent = 0 # Highest seq sent on this connection; everything unacked is resent after a reconnect
+        next_heartbeat = 0.0
+        while self._running and self._sock is sock:
+            with self._cond:
+                now = time.monotonic()
+                batch = [m for seq, m in self._unacked.items() if seq > sent]
+                if not batch and now < next_heartbeat:
+                    self._cond.wait(next_heartbeat - now)
+                    continue
+            if batch:
+                sock.sendall(b"".join(encode(m) for m in batch))
+                sent = batch[-1]['seq']
+            if time.monotonic() >= next_heartbeat:
+                rooms = self.counts() if self.counts is not None else {}
+                sock.sendall(encode({'type': 'heartbeat', 'time': time.time(), 'rooms': rooms}))
+                next_heartbeat = time.monotonic() + config.AGGREGATOR_HEARTBEAT_SECONDS
+
+    def _reader_thread(self, sock):
+        """Applies acknowledgements; a closed connection wakes the writer so it reconnects."""
+        try:
+            for line in sock.makefile('rb'):
+                message = json.loads(line)
+                if message.get('type') == 'ack':
+                    with self._cond:
+                        while self._unacked and next(iter(self._unacked)) <= message['seq']:
+                            self._unacked.popitem(last=False)
+                            self.acked += 1
+                        self._cond.notify_all()
+        except (OSError, ValueError):
+            pass
+        with self._cond:
+            if self._sock is sock:
+                self._disconnect()
+            self._cond.notify_all()
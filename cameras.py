@@ -0,0 +1,45 @@
+import config
+from pipeline import OccupancyPipeline
+from wled import WLEDController
+from zones import ZoneConfig, DOOR_CONFIG_FILE
+
+def camera_settings():
+    """
+    Normalised camera entries from config.CAMERAS, or the single-camera
+    settings (CAMERA_INDEX, door_config.json, ROOM_NAME, WLED_HOSTS) when it is empty.
+    With an aggregator, no camera drives lights itself.
+    """
+    if not config.CAMERAS:
+        return [{'name': None, 'source': config.CAMERA_INDEX,
+                 'door_config': DOOR_CONFIG_FILE, 'room': config.ROOM_NAME,
+                 'wled_hosts': [] if config.AGGREGATOR_ADDRESS else config.WLED_HOSTS}]
+
+    settings = []
+    for i, cam in enumerate(config.CAMERAS):
+        name = cam.get('name', f"camera{i}")
+        settings.append({
+            'name': name,
+            'source': cam['source'],
+            'door_config': cam.get('door_config', f"door_config_{name}.json"),
+            'room': cam.get('room', name), # Cameras on one room (on any node) share its count at the aggregator
+            # Only the first room drives the default lights unless told otherwise
+            'wled_hosts': cam.get('wled_hosts', config.WLED_HOSTS if i == 0 else []),
+        })
+        if config.AGGREGATOR_ADDRESS:
+            settings[-1]['wled_hosts'] = [] # The aggregator drives the lights
+    return settings
+
+class Camera:
+    """
+    One room: its capture source, zones, lights and occupancy pipeline.
+    The grabber is created (and usually opened) beforehand, while the model loads.
+    """
+    def __init__(self, index, settings, grabber, detector, notifier, on_event=None):
+        self.index = index # Key of this camera's tracker state in HumanDetector
+        self.name = settings['name']
+        self.room = settings['room']
+        self.zones = ZoneConfig(settings['door_config'])
+        self.zones.load()
+        self.wled = WLEDController(settings['wled_hosts'], self.name)
+        self.grabber = grabber
+        self.pipeline = OccupancyPipeline(detector, self.wled, notifier, self.zones, on_event, self.name)
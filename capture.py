@@ -0,0 +1,118 @@
+import cv2
+import time
+import logging
+import threading
+import config
+import frames
+from frames import FramePool
+
+class FrameGrabber:
+    """
+    Reads the camera on a dedicated thread and keeps only the newest frame.
+    The inference loop always gets the most recent capture instead of whatever
+    has been sitting in OpenCV's internal buffer. Frames are decoded into
+    recycled buffers from a FramePool and handed out as read-only views.
+    """
+    def __init__(self, source=config.CAMERA_INDEX, warmup_frames=config.CAPTURE_WARMUP_FRAMES, ready=None):
+        self.source = source
+        self.warmup_frames = warmup_frames
+        self.ready = ready # Optional threading.Event shared by several grabbers, set on every new frame
+        self.cap = None
+        self.pool = FramePool()
+
+        # Latest-frame slot
+        self._cond = threading.Condition()
+        self._frame = None
+        self._timestamp = 0.0
+        self._seq = 0
+        self._consumed_seq = 0
+
+        # Stats
+        self.captured = 0
+        self.dropped = 0
+
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        """Opens the camera and starts the capture thread. Returns False if the device can't be opened."""
+        self.cap = cv2.VideoCapture(self.source)
+        if not self.cap.isOpened():
+            logging.error(f"Could not open video device {self.source}.")
+            return False
+
+        # Keep the driver-side queue as short as the backend allows
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        self._running = True
+        self._thread = threading.Thread(target=self._capture_thread, daemon=True)
+        self._thread.start()
+        logging.info(f"Capture started on source {self.source}")
+        return True
+
+    def _capture_thread(self):
+        # Warmup: let auto-exposure settle before publishing anything
+        for _ in range(self.warmup_frames):
+            if not self._running or not self.cap.grab():
+                break
+
+        while self._running:
+            # Decode straight into a recycled buffer (a new one until the size is known)
+            buf = self.pool.acquire()
+            ret, image = self.cap.read(buf.array if buf is not None else None)
+            timestamp = time.time()
+            if not ret:
+                if buf is not None:
+                    frames.release(buf.view)
+                logging.error("Camera read failed. Capture stopped.")
+                break
+            if buf is None or image is not buf.array:
+                if buf is not None:
+                    frames.release(buf.view)
+                buf = self.pool.wrap(image)
+            frame = buf.view
+
+            with self._cond:
+                # The previous frame was never picked up by the consumer
+                if self._seq > self._consumed_seq:
+                    self.dropped += 1
+                    frames.release(self._frame)
+                self._frame = frame
+                self._timestamp = timestamp
+                self._seq += 1
+                self.captured += 1
+                self._cond.notify_all()
+            if self.ready is not None:
+                self.ready.set()
+
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self.ready is not None:
+            self.ready.set()
+
+    def read(self, timeout=1.0):
+        """
+        Waits for a frame newer than the last one returned.
+        The caller owns the (read-only) frame until it calls frames.release(frame).
+        Returns:
+            (frame, timestamp, seq) or (None, None, None) on timeout / camera stop.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > self._consumed_seq or not self._running, timeout):
+                return None, None, None
+            if self._seq == self._consumed_seq:
+                return None, None, None
+            self._consumed_seq = self._seq
+            return self._frame, self._timestamp, self._seq
+
+    @property
+    def running(self):
+        return self._running
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        if self.cap is not None:
+            self.cap.release()
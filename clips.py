@@ -0,0 +1,229 @@
+import os
+import glob
+import time
+import queue
+import logging
+import datetime
+import threading
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+import config
+import frames
+from metrics import REGISTRY, observe_stage
+
+def _write_clip(path, jpegs, fps):
+    """
+    Runs in the clip worker process: decodes the buffered JPEGs into an MP4.
+    Returns:
+        (path, frames written)
+    """
+    writer = None
+    written = 0
+    try:
+        for jpeg in jpegs:
+            frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                continue
+            if writer is None:
+                height, width = frame.shape[:2]
+                writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+                if not writer.isOpened():
+                    raise RuntimeError(f"Could not open video writer for {path}")
+            writer.write(frame)
+            written += 1
+    finally:
+        if writer is not None:
+            writer.release()
+    return path, written
+
+class _PendingClip:
+    __slots__ = ('kind', 'start', 'end')
+
+    def __init__(self, kind, start, end):
+        self.kind = kind
+        self.start = start
+        self.end = end
+
+class ClipRecorder:
+    """
+    Pre-roll event clips.
+    Frames are downscaled, JPEG-compressed by a background thread and kept in
+    a ring covering the last CLIP_PRE_SECONDS + CLIP_POST_SECONDS, capped at
+    CLIP_BUFFER_MB however long the system runs. trigger() marks an event;
+    once its post-roll has been buffered the matching frames are handed to a
+    worker process that writes the MP4, so the main loop never encodes video.
+    Events that overlap an unfinished clip extend it instead of starting a
+    new one. Finished clips go to every on_clip(path, kind) callback. A
+    listener that uses the file later (e.g. a queued upload) calls retain()
+    and release() around it, so pruning old clips doesn't delete it meanwhile.
+    """
+    def __init__(self, on_clip=None):
+        self.fps = config.CLIP_FPS
+        self.pre_seconds = config.CLIP_PRE_SECONDS
+        self.post_seconds = config.CLIP_POST_SECONDS
+        self.max_bytes = int(config.CLIP_BUFFER_MB * 1024 * 1024)
+        self.clip_dir = config.CLIP_DIR
+        self.listeners = [on_clip] if on_clip is not None else []
+        self._retained = {} # path -> references held by listeners
+        self._retained_lock = threading.Lock()
+
+        os.makedirs(self.clip_dir, exist_ok=True)
+
+        self._ring = collections.deque() # (timestamp, jpeg bytes)
+        self._ring_bytes = 0
+        self._lock = threading.Lock()
+        self._pending = None # _PendingClip still collecting post-roll
+        self._next_ts = None # Earliest timestamp of the next buffered frame
+
+        # Frames waiting for JPEG encoding; new ones are dropped if the encoder falls behind
+        self._frames = queue.Queue(maxsize=2)
+        self._running = True
+        self._encoder = threading.Thread(target=self._encode_thread, name="clip-encoder", daemon=True)
+        self._encoder.start()
+
+        # Spawned, so the worker doesn't inherit the camera, sockets or threads
+        self._pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+
+        # Stats
+        self.clips_written = 0
+        self.clips_failed = 0
+        self.frames_dropped = 0
+
+        REGISTRY.gauge("clip_buffer_bytes", "Bytes of JPEG frames held for clip pre-roll.", fn=lambda: self._ring_bytes)
+        REGISTRY.counter("clips_written_total", "Event clips written.", fn=lambda: self.clips_written)
+
+    # --- Public API ---
+
+    def add(self, frame, now):
+        """Offers a frame (never modified afterwards) to the ring. Cheap; rate-limited to CLIP_FPS."""
+        interval = 1.0 / self.fps
+        # Steady schedule with half a frame of slack, so jitter or a camera
+        # slightly faster than CLIP_FPS doesn't halve the buffered rate
+        if self._next_ts is not None and now < self._next_ts - interval / 2:
+            return
+        self._next_ts = now + interval if self._next_ts is None else max(self._next_ts + interval, now)
+        frames.retain(frame) # Until the encoder thread has compressed it
+        try:
+            self._frames.put_nowait((now, frame))
+        except queue.Full:
+            frames.release(frame)
+            self.frames_dropped += 1
+
+    def trigger(self, kind, now):
+        """Requests a clip around `now` (pre-roll before, post-roll after)."""
+        with self._lock:
+            if self._pending is not None:
+                # Overlapping event: extend the clip, up to CLIP_MAX_SECONDS
+                self._pending.end = min(now + self.post_seconds, self._pending.start + config.CLIP_MAX_SECONDS)
+                return
+            self._pending = _PendingClip(kind, now - self.pre_seconds, now + self.post_seconds)
+
+    def retain(self, path):
+        """Keeps a clip from being pruned until the matching release()."""
+        with self._retained_lock:
+            self._retained[path] = self._retained.get(path, 0) + 1
+
+    def release(self, path):
+        """Drops a retain(); clips over CLIP_KEEP that were skipped are pruned now."""
+        with self._retained_lock:
+            count = self._retained.get(path, 0) - 1
+            if count > 0:
+                self._retained[path] = count
+            else:
+                self._retained.pop(path, None)
+        self._prune()
+
+    def close(self):
+        """Writes any clip still collecting post-roll with what is buffered, then stops."""
+        self._running = False
+        try:
+            self._frames.put_nowait((None, None))
+        except queue.Full:
+            pass # Encoder is busy and will see _running on its next pass
+        self._encoder.join(timeout=2.0)
+        with self._lock:
+            self._flush(force=True)
+        self._pool.shutdown(wait=True)
+
+    # --- Internals ---
+
+    def _encode_thread(self):
+        scale_width = config.CLIP_WIDTH
+        params = [cv2.IMWRITE_JPEG_QUALITY, config.CLIP_JPEG_QUALITY]
+        while self._running:
+            ts, frame = self._frames.get()
+            if frame is None:
+                break
+            started = time.perf_counter()
+            height, width = frame.shape[:2]
+            image = frame
+            if scale_width and width > scale_width:
+                image = cv2.resize(frame, (scale_width, int(height * scale_width / width)), interpolation=cv2.INTER_AREA)
+            ok, encoded = cv2.imencode(".jpg", image, params)
+            frames.release(frame)
+            observe_stage('clip_encode', time.perf_counter() - started)
+            if not ok:
+                continue
+
+            jpeg = encoded.tobytes()
+            with self._lock:
+                self._ring.append((ts, jpeg))
+                self._ring_bytes += len(jpeg)
+                # Keep only what a clip can need, and never more than the byte budget
+                horizon = ts - self.pre_seconds - self.post_seconds
+                if self._pending is not None:
+                    horizon = min(horizon, self._pending.start)
+                while self._ring and (self._ring_bytes > self.max_bytes or self._ring[0][0] < horizon):
+                    _, old = self._ring.popleft()
+                    self._ring_bytes -= len(old)
+                self._flush(now=ts)
+
+    def _flush(self, now=None, force=False):
+        """Hands the pending clip to the worker once its post-roll is buffered. Caller holds the lock."""
+        clip = self._pending
+        if clip is None or (not force and now < clip.end):
+            return
+        self._pending = None
+        jpegs = [jpeg for ts, jpeg in self._ring if clip.start <= ts <= clip.end]
+        if not jpegs:
+            return
+
+        stamp = datetime.datetime.fromtimestamp(clip.start + self.pre_seconds).strftime("%Y%m%d_%H%M%S_%f")
+        path = os.path.join(self.clip_dir, f"{clip.kind}_{stamp}.mp4")
+        future = self._pool.submit(_write_clip, path, jpegs, self.fps)
+        future.add_done_callback(lambda f, kind=clip.kind: self._clip_done(f, kind))
+
+    def _clip_done(self, future, kind):
+        try:
+            path, written = future.result()
+        except Exception as e:
+            self.clips_failed += 1
+            logging.error(f"Failed to write event clip: {e}")
+            return
+        if not written:
+            self.clips_failed += 1
+            return
+
+        self.clips_written += 1
+        logging.info(f"Event clip saved: {path} ({written} frames)")
+        for listener in self.listeners:
+            try:
+                listener(path, kind)
+            except Exception as e:
+                logging.error(f"Clip listener failed: {e}")
+        self._prune() # After the listeners, so a clip they retained is skipped
+
+    def _prune(self):
+        """Keeps only the newest CLIP_KEEP files on disk, never deleting a retained one."""
+        files = glob.glob(os.path.join(self.clip_dir, "*.mp4"))
+        files.sort(key=lambda p: os.path.getmtime(p) if os.path.exists(p) else 0, reverse=True)
+        with self._retained_lock:
+            old = [p for p in files[config.CLIP_KEEP:] if p not in self._retained]
+        for path in old:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -2,14 +2,81 @@ import os
 
 # WLED Configuration
 WLED_IP = "192.168.1.8"  # TODO: Replace with your WLED IP
-JSON_URL = f"http://{WLED_IP}/json/state"
+WLED_HOSTS = [WLED_IP] # Every device here gets the same state, in parallel
+WLED_BRIGHTNESS = 128 # Brightness for one person (None keeps the device's own setting)
+WLED_BRIGHTNESS_STEP = 32 # Added per extra person in the room, up to 255
+WLED_TRANSITION = 7 # Fade time in 100 ms units
+WLED_TIMEOUT = 2.0 # Seconds per request
+WLED_RETRY_BASE = 0.5 # Seconds; doubled on each failed attempt
+WLED_RETRY_MAX_DELAY = 30.0 # Offline devices are retried at least this often
 
 # Logic Configuration
 TIMEOUT_SECONDS = 8
 CONFIDENCE_THRESHOLD = 0.65
+EXIT_TIMEOUT_SECONDS = 1.5 # A track lost in the door counts as an exit after this long
+ENTRY_ALERT_DELAY = 1.0 # Entry photo is taken this long after entry, once the lights are on
+REACQUIRE_MAX_DISTANCE = 0.25 # Max distance (fraction of the frame) to merge a new door track with a pending exit
 
 # Camera Configuration
 CAMERA_INDEX = 0
+# Several rooms can share one process and one model: list them here and
+# their frames are batched into a single detector call. Leave empty for a
+# single camera on CAMERA_INDEX using door_config.json. Example:
+# CAMERAS = [
+#     {"name": "living", "source": 0, "door_config": "door_living.json", "wled_hosts": ["192.168.1.8"]},
+#     {"name": "office", "source": "rtsp://192.168.1.20/stream", "door_config": "door_office.json", "wled_hosts": ["192.168.1.9"]},
+# ]
+# With an aggregator, "room" (default: the camera name) says which room a camera counts for.
+CAMERAS = []
+CAPTURE_WARMUP_FRAMES = 10 # Frames discarded while auto-exposure settles
+FRAME_POOL_SIZE = 8 # Recycled frame buffers kept per camera (stream, clips and alerts hold a few)
+
+# Motion Gating Configuration
+# YOLO only runs on motion, while people are tracked, or every heartbeat
+MOTION_GATING = True
+MOTION_DOWNSCALE_WIDTH = 160 # Motion check runs on a tiny copy of the frame
+MOTION_PIXEL_THRESHOLD = 25 # Gray level change that counts as "moved"
+MOTION_MIN_RATIO = 0.005 # Weighted fraction of changed pixels that wakes the detector
+MOTION_DOOR_WEIGHT = 4.0 # Changes inside the door zone count this much more
+MOTION_BACKGROUND_ALPHA = 0.05 # Background adaptation rate
+MOTION_HEARTBEAT_SECONDS = 2.0 # Force a detector pass at least this often
+
+# Inference Backend Configuration
+# "ultralytics" (PyTorch), "onnx" (ONNX Runtime) or "openvino"
+# Exported models are built with: python export_model.py --backend onnx --imgsz 416
+INFERENCE_BACKEND = "ultralytics"
+INFERENCE_IMGSZ = 640 # Model input size (exported models are built per size)
+INFERENCE_THREADS = 4 # CPU threads used by the backend
+INFERENCE_INT8 = False # Load the INT8 model calibrated on CALIBRATION_DIR
+NMS_IOU_THRESHOLD = 0.45
+MODEL_DIR = "models" # Cache for exported/quantized models
+CALIBRATION_DIR = "calib_frames" # Frames from our own camera used for INT8 calibration
+
+# Detector Process Configuration
+# Run HumanDetector in a worker process (frames passed through shared memory)
+DETECTOR_PROCESS = False
+DETECTOR_SHM_SLOTS = 2 # Shared-memory frame slots in the ring
+DETECTOR_STARTUP_TIMEOUT = 60 # Seconds allowed for the worker to load the model
+DETECTOR_TIMEOUT_SECONDS = 5 # A frame taking longer than this means the worker is hung
+DETECTOR_RESTART_BACKOFF = 5 # Min seconds between worker restarts
+DETECTOR_OUTAGE_PREDICT_SECONDS = 2.0 # While the worker (re)starts, tracks are predicted this long, then dropped
+
+# Detect-every-N Configuration
+# While people are tracked, YOLO runs every N frames and boxes are predicted in between
+DETECT_INTERVAL = 4 # 1 = run the detector on every frame
+DETECT_ADAPTIVE = True # Shorten the interval when boxes move fast
+DETECT_MAX_DRIFT = 0.15 # Max predicted drift (fraction of box height) between passes
+
+# Region-of-interest Configuration
+# Detector passes only cover the door zones (room empty) or the door zones
+# plus the tracked people, at an input size scaled to the crop. Opt-in: people
+# outside those regions are only seen on the periodic full-frame passes
+ROI_INFERENCE = False
+ROI_PADDING = 0.05 # Margin around the door zones (fraction of the frame)
+ROI_TRACK_PADDING = 0.5 # Margin around tracked boxes (fraction of the box), covers movement between passes
+ROI_MAX_AREA = 0.6 # Regions covering more of the frame than this run full-frame
+ROI_FULL_FRAME_INTERVAL = 10 # Every Nth detector pass covers the whole frame
+ROI_MIN_IMGSZ = 160 # PyTorch backend only; exported models have a fixed size
 
 # Door Tracking Configuration
 # [x1, y1, x2, y2] proportional coordinates (0.0 to 1.0)
@@ -19,7 +86,86 @@ DEBUG_DRAW = False
 # Telegram Configuration
 TELEGRAM_TOKEN = "" 
 TELEGRAM_CHAT_ID = ""
+TELEGRAM_API_URL = "https://api.telegram.org" # Point at a local stand-in for testing
+TELEGRAM_WORKERS = 2 # Sender threads sharing one keep-alive session
+TELEGRAM_QUEUE_SIZE = 50 # Alerts beyond this are dropped
+TELEGRAM_COALESCE_SECONDS = 2.0 # Alerts within this window are merged (0 disables)
+TELEGRAM_MAX_RETRIES = 3
+TELEGRAM_RETRY_BASE = 1.0 # Seconds; doubled on each retry
+TELEGRAM_JPEG_QUALITY = 85
 
 # Remote Access Configuration
 CLOUDFLARED_PATH = r"C:\Users\MY PC\Documents\new\huamn\cloudflared.exe" # Assumes it's in PATH, or provide full path
 STREAM_PORT = 5000
+STREAM_FPS = 20 # Max frames per second sent to each viewer
+STREAM_JPEG_QUALITY = 80 # Full-size rendition
+STREAM_MAX_VIEWERS = 30 # Further /video_feed clients get 503 until someone leaves
+STREAM_WRITE_TIMEOUT = 10.0 # Seconds a viewer may stall before it is dropped
+# Sizes viewers can pick with ?rendition=<name> (or ?width=N): name, width (None = camera), JPEG quality
+STREAM_RENDITIONS = [
+    ("full", None, STREAM_JPEG_QUALITY),
+    ("medium", 640, 70),
+    ("small", 320, 60),
+]
+STREAM_DEFAULT_RENDITION = "full"
+STREAM_RENDITION_IDLE_SECONDS = 30 # Unwatched renditions release their buffer after this
+PROFILER_ENABLED = True # Allow /profile?seconds=N sampling profiles at runtime
+
+# Load Shedding Configuration
+# Over budget, features are given up in this order: stream FPS/quality,
+# annotation, inference resolution, detector frames. Door-zone tracking goes last.
+LOAD_SHEDDING = True
+FRAME_BUDGET_SECONDS = 1.0 / 15 # Target main loop processing time per frame
+LOAD_ESCALATE_SECONDS = 2.0 # Over budget this long -> shed one more feature
+LOAD_RECOVER_SECONDS = 10.0 # Under budget this long -> restore one feature
+LOAD_RECOVER_RATIO = 0.6 # "Under budget" means below this fraction of it
+LOAD_STREAM_FPS_SCALE = 0.5
+LOAD_STREAM_JPEG_QUALITY = 60
+LOAD_DEGRADED_IMGSZ = 320 # PyTorch backend only; exported models have a fixed size
+LOAD_SKIP_STRIDE = 2 # Detector runs on every Nth frame at the last level
+
+# Snapshot Archive Configuration
+# Every photo sent to Telegram is kept here and browsable at /snapshots
+SNAPSHOT_DIR = "snapshots"
+SNAPSHOT_MAX_AGE_DAYS = 30 # Older snapshots are deleted
+SNAPSHOT_MAX_MB = 500 # Oldest snapshots are deleted beyond this
+SNAPSHOT_QUEUE_SIZE = 32 # Pending writes beyond this are dropped
+
+# History Configuration
+# Enter/exit events and room count samples are kept in SQLite for /history
+HISTORY_ENABLED = True
+HISTORY_DB = "history.db"
+HISTORY_SAMPLE_SECONDS = 60 # Room count is sampled this often (and on every change)
+HISTORY_FLUSH_SECONDS = 2.0 # Rows are committed in batches at this interval
+HISTORY_QUEUE_SIZE = 10000 # Rows beyond this are dropped if the disk stalls
+
+# Event Clip Configuration
+# Enter/exit events produce a short MP4 with pre-roll, sent to Telegram and served at /clips
+CLIP_ENABLED = True
+CLIP_DIR = "clips"
+CLIP_PRE_SECONDS = 5.0 # Seconds kept before the event
+CLIP_POST_SECONDS = 5.0 # Seconds recorded after the event
+CLIP_MAX_SECONDS = 30.0 # Overlapping events extend a clip up to this length
+CLIP_FPS = 10 # Frame rate of the buffer and the clips
+CLIP_WIDTH = 640 # Frames are downscaled to this width before buffering (0 keeps full size)
+CLIP_JPEG_QUALITY = 70
+CLIP_BUFFER_MB = 32 # Hard cap on buffered frame memory
+CLIP_KEEP = 50 # Only the newest clips are kept on disk
+
+# Multi-Node Aggregation
+# Several detector hosts can share rooms: each node sends its entries and
+# exits to one aggregator (python aggregator.py), which de-duplicates them,
+# keeps the per-room counts and alone drives WLED and Telegram.
+AGGREGATOR_ADDRESS = None # "host:port" on the nodes; None runs standalone
+NODE_NAME = None # Defaults to the host name; must be unique per node
+ROOM_NAME = "room" # Room of the single camera (CAMERAS entries use "room" or their name)
+AGGREGATOR_PORT = 5600
+AGGREGATOR_STATUS_PORT = 5601 # /status and /metrics of the aggregator
+AGGREGATOR_ROOMS = {} # Room -> WLED hosts, e.g. {"living": ["192.168.1.8"]}; unlisted rooms drive no lights
+AGGREGATOR_DEDUP_SECONDS = 2.0 # Same event kind in the same room from two nodes within this is one event
+AGGREGATOR_HEARTBEAT_SECONDS = 5.0
+AGGREGATOR_NODE_TIMEOUT = 20.0 # A node silent this long is reported offline
+AGGREGATOR_STATE_FILE = "aggregator_state.json" # Counts survive aggregator restarts
+AGGREGATOR_QUEUE_SIZE = 1000 # Unacknowledged events a node keeps while the aggregator is away
+AGGREGATOR_RETRY_BASE = 1.0 # Seconds; doubled on each failed connection attempt
+AGGREGATOR_RETRY_MAX_DELAY = 30.0
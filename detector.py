@@ -1,49 +1,562 @@
-from ultralytics import YOLO
 import cv2
+import os
+import math
+import time
+import logging
+import numpy as np
 import config
+from metrics import stage_timer
+from motion import MotionGate
+from propagation import TrackPropagator
+from scheduler import LEVEL_LOW_RES, LEVEL_SKIP_FRAMES
 
-class HumanDetector:
-    def __init__(self):
-        # Load a pretrained YOLOv8n model
-        self.model = YOLO('yolov8n.pt') 
-        self.confidence_threshold = config.CONFIDENCE_THRESHOLD
+# Detector pass regions, widest first
+ROI_FULL = "full" # Whole frame
+ROI_TRACKS = "tracks" # Door zones plus the tracked people
+ROI_DOOR = "door" # Room empty: door zones only
+ROI_MODES = (ROI_FULL, ROI_TRACKS, ROI_DOOR)
+
+def model_path(backend, imgsz, int8=False, batch=1):
+    """On-disk location of an exported model (see export_model.py)."""
+    name = f"yolov8n_{imgsz}" + (f"_b{batch}" if batch > 1 else "") + ("_int8" if int8 else "")
+    if backend == "onnx":
+        return os.path.join(config.MODEL_DIR, f"{name}.onnx")
+    if backend == "openvino":
+        return os.path.join(config.MODEL_DIR, f"{name}_openvino", "yolov8n.xml")
+    raise ValueError(f"Unknown exported backend: {backend}")
+
+def letterbox(frame, imgsz):
+    """
+    Resizes a BGR frame into a square imgsz x imgsz RGB float blob, keeping aspect ratio.
+    Returns:
+        blob (numpy array): (1, 3, imgsz, imgsz) float32 in [0, 1]
+        scale (float), pad (x, y): needed to map boxes back to the frame.
+    """
+    h, w = frame.shape[:2]
+    scale = min(imgsz / w, imgsz / h)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+    pad_x, pad_y = (imgsz - new_w) // 2, (imgsz - new_h) // 2
+
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+    blob = cv2.dnn.blobFromImage(canvas, 1 / 255.0, swapRB=True)
+    return blob, scale, (pad_x, pad_y)
+
+def nms(boxes, scores, iou_threshold):
+    """Greedy non-maximum suppression. Returns indices of the kept boxes, best first."""
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        xx1 = np.maximum(x1[i], x1[rest])
+        yy1 = np.maximum(y1[i], y1[rest])
+        xx2 = np.minimum(x2[i], x2[rest])
+        yy2 = np.minimum(y2[i], y2[rest])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=int)
+
+def postprocess(output, conf_threshold, iou_threshold, scale, pad, frame_shape):
+    """
+    Decodes a raw YOLOv8 head output (1, 4 + classes, anchors) into person detections.
+    Returns:
+        (N, 6) float32 array of [x1, y1, x2, y2, conf, cls] in frame coordinates.
+    """
+    preds = output[0]
+    scores = preds[4]  # Person is class 0
+    mask = scores >= conf_threshold
+    if not mask.any():
+        return np.zeros((0, 6), dtype=np.float32)
+
+    cx, cy, w, h = preds[:4, mask]
+    scores = scores[mask]
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+    # Undo letterbox
+    boxes[:, [0, 2]] -= pad[0]
+    boxes[:, [1, 3]] -= pad[1]
+    boxes /= scale
+    height, width = frame_shape[:2]
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width - 1)
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height - 1)
+
+    keep = nms(boxes, scores, iou_threshold)
+    dets = np.zeros((len(keep), 6), dtype=np.float32)
+    dets[:, :4] = boxes[keep]
+    dets[:, 4] = scores[keep]
+    return dets
+
+class _Detections:
+    """Minimal stand-in for ultralytics Boxes, as consumed by BYTETracker.update."""
+    def __init__(self, dets):
+        self.xyxy = dets[:, :4]
+        self.conf = dets[:, 4]
+        self.cls = dets[:, 5]
+        wh = self.xyxy[:, 2:] - self.xyxy[:, :2]
+        self.xywh = np.hstack([self.xyxy[:, :2] + wh / 2, wh])
+
+    def __len__(self):
+        return len(self.conf)
+
+    def __getitem__(self, idx):
+        return _Detections(np.hstack([self.xyxy, self.conf[:, None], self.cls[:, None]])[idx])
+
+def _new_tracker():
+    """A fresh ByteTrack instance with the stock ultralytics settings."""
+    from ultralytics.trackers.byte_tracker import BYTETracker
+    from ultralytics.utils import IterableSimpleNamespace, yaml_load
+    from ultralytics.utils.checks import check_yaml
+
+    tracker_cfg = IterableSimpleNamespace(**yaml_load(check_yaml("bytetrack.yaml")))
+    return BYTETracker(tracker_cfg, frame_rate=30)
+
+def _shift(dets, offset):
+    """Moves detections from crop to frame coordinates."""
+    if offset is not None:
+        dets[:, [0, 2]] += offset[0]
+        dets[:, [1, 3]] += offset[1]
+    return dets
+
+def _update_tracker(tracker, dets, frame):
+    """Feeds (N, 6) detections to ByteTrack. Returns boxes (N, 4) int, ids (N,) int."""
+    tracked = tracker.update(_Detections(dets), frame)
+    if len(tracked) == 0:
+        return np.zeros((0, 4), dtype=int), np.zeros(0, dtype=int)
+    # Rows are [x1, y1, x2, y2, track_id, score, cls, idx]
+    return tracked[:, :4].astype(int), tracked[:, 4].astype(int)
+
+class UltralyticsBackend:
+    """
+    PyTorch model through ultralytics. A single full-frame camera uses its
+    built-in ByteTrack; several cameras, or cropped (ROI) frames, go through
+    batched predict() calls and get one ByteTrack instance per camera.
+    """
+    def __init__(self, imgsz, threads, conf, cameras=1):
+        # Imported here: torch and ultralytics take seconds to load
+        import torch
+        from ultralytics import YOLO
+        torch.set_num_threads(threads)
+        self.model = YOLO('yolov8n.pt')
+        self.imgsz = imgsz
+        self.conf = conf
+        # ROI crops move around, so their boxes must be shifted before tracking
+        self.own_trackers = cameras > 1 or config.ROI_INFERENCE
+        self.trackers = {}
+
+    def warmup(self):
+        """Dummy pass: ultralytics fuses the model and sets up its predictor on the first call."""
+        self.model.predict(np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8), imgsz=self.imgsz, verbose=False)
 
-    def track(self, frame):
+    def infer(self, frame, imgsz=None):
         """
-        Tracks humans in a frame using YOLOv8 tracking.
+        Args:
+            imgsz: Overrides the input size for this call (load shedding).
         Returns:
-            tracks (list): List of dicts {'id': int, 'box': [x1,y1,x2,y2], 'center': (x,y)}
-            annotated_frame (numpy array): Frame with tracking info.
+            boxes (N, 4) int, ids (N,) int.
         """
-        # Run tracking with Configured Confidence
         results = self.model.track(frame, classes=[0], persist=True, verbose=False, 
-                                   tracker="bytetrack.yaml", conf=self.confidence_threshold)
+                                   tracker="bytetrack.yaml", conf=self.conf, imgsz=imgsz or self.imgsz)
 
-        tracks = []
-        annotated_frame = frame
-        
+        boxes = np.zeros((0, 4), dtype=int)
+        ids = np.zeros(0, dtype=int)
         for result in results:
-            annotated_frame = result.plot()
             if result.boxes.id is not None:
                 boxes = result.boxes.xyxy.cpu().numpy().astype(int)
                 ids = result.boxes.id.cpu().numpy().astype(int)
-                
-                for box, track_id in zip(boxes, ids):
-                    x1, y1, x2, y2 = box
-                    w = x2 - x1
-                    h = y2 - y1
-                    
-                    # Filter small noise (must be at least 5% of frame width/height approx)
-                    # Simple heuristic: ignore things smaller than 20x20 pixels
-                    if w < 20 or h < 50: 
-                        continue
-
-                    center_x = (x1 + x2) // 2
-                    center_y = (y1 + y2) // 2
-                    tracks.append({
-                        'id': track_id,
-                        'box': box,
-                        'center': (center_x, center_y)
-                    })
-        
-        return tracks, annotated_frame
+        return boxes, ids
+
+    def infer_batch(self, frames, cameras, imgsz=None, offsets=None):
+        """
+        One (boxes, ids) pair per frame; frames[i] comes from camera cameras[i].
+        A frame may be a crop whose top-left corner is at offsets[i] in the full
+        frame; boxes are always returned in full-frame coordinates.
+        """
+        if not self.own_trackers:
+            return [self.infer(frame, imgsz) for frame in frames]
+
+        offsets = offsets or [None] * len(frames)
+        results = self.model.predict(frames, classes=[0], conf=self.conf, imgsz=imgsz or self.imgsz, verbose=False)
+        outputs = []
+        for frame, camera, offset, result in zip(frames, cameras, offsets, results):
+            boxes = result.boxes
+            dets = np.hstack([boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy()[:, None],
+                              boxes.cls.cpu().numpy()[:, None]]).astype(np.float32)
+            dets = _shift(dets, offset)
+            tracker = self.trackers.get(camera)
+            if tracker is None:
+                tracker = self.trackers[camera] = _new_tracker()
+            outputs.append(_update_tracker(tracker, dets, frame))
+        return outputs
+
+class _ExportedBackend:
+    """
+    Shared path for exported models: letterbox, raw forward pass, NumPy
+    decode + NMS, then ByteTrack (one per camera) on the resulting detections.
+    Frames from several cameras are stacked into one forward pass. The graph
+    input size is fixed, so ROI crops save preprocessing and gain detail
+    rather than forward-pass time.
+    """
+    def __init__(self, imgsz, conf):
+        self.imgsz = imgsz
+        self.conf = conf
+        self.batch = 1 # Graph batch size; None if the batch dimension is dynamic
+        self.trackers = {}
+
+    def _forward(self, blob):
+        raise NotImplementedError
+
+    def warmup(self):
+        """Dummy forward pass (the runtime allocates and tunes its kernels on the first call)."""
+        self._forward(np.zeros((self.batch or 1, 3, self.imgsz, self.imgsz), dtype=np.float32))
+        _new_tracker() # Pulls in the ultralytics tracker modules now rather than on the first frame
+
+    def infer(self, frame, imgsz=None):
+        return self.infer_batch([frame], [0], imgsz)[0]
+
+    def infer_batch(self, frames, cameras, imgsz=None, offsets=None):
+        """One (boxes, ids) pair per frame, in full-frame coordinates (see UltralyticsBackend.infer_batch)."""
+        offsets = offsets or [None] * len(frames)
+        # Exported graphs have a fixed input size, so imgsz overrides are ignored
+        letterboxed = [letterbox(frame, self.imgsz) for frame in frames]
+        step = self.batch or len(frames)
+        outputs = []
+        for start in range(0, len(frames), step):
+            blobs = [blob for blob, _, _ in letterboxed[start:start + step]]
+            n = len(blobs)
+            if n < step:
+                # Fixed-batch graph: pad with empty frames
+                blobs += [np.zeros_like(blobs[0])] * (step - n)
+            output = self._forward(np.concatenate(blobs))
+            outputs.extend(output[i:i + 1] for i in range(n))
+
+        results = []
+        for frame, camera, offset, (_, scale, pad), output in zip(frames, cameras, offsets, letterboxed, outputs):
+            dets = postprocess(output, self.conf, config.NMS_IOU_THRESHOLD, scale, pad, frame.shape)
+            dets = _shift(dets, offset)
+            tracker = self.trackers.get(camera)
+            if tracker is None:
+                tracker = self.trackers[camera] = _new_tracker()
+            results.append(_update_tracker(tracker, dets, frame))
+        return results
+
+class OnnxBackend(_ExportedBackend):
+    """ONNX Runtime on CPU."""
+    def __init__(self, path, imgsz, threads, conf):
+        super().__init__(imgsz, conf)
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch = model_input.shape[0]
+        self.batch = batch if isinstance(batch, int) else None
+
+    def _forward(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+class OpenVinoBackend(_ExportedBackend):
+    """OpenVINO runtime on CPU, tuned for single-frame latency."""
+    def __init__(self, path, imgsz, threads, conf, cameras=1):
+        super().__init__(imgsz, conf)
+        import openvino as ov
+
+        core = ov.Core()
+        model = core.read_model(path)
+        if cameras > 1:
+            # IR models can be reshaped at load time: one slot per camera
+            model.reshape([cameras, 3, imgsz, imgsz])
+            self.batch = cameras
+        self.compiled = core.compile_model(model, "CPU", {
+            "INFERENCE_NUM_THREADS": threads,
+            "PERFORMANCE_HINT": "LATENCY",
+        })
+        self.output = self.compiled.output(0)
+
+    def _forward(self, blob):
+        return self.compiled(blob)[self.output]
+
+def create_backend(cameras=1):
+    """Builds the inference backend selected in config.py, sized for `cameras` streams."""
+    backend = config.INFERENCE_BACKEND
+    imgsz = config.INFERENCE_IMGSZ
+    threads = config.INFERENCE_THREADS
+    conf = config.CONFIDENCE_THRESHOLD
+
+    if backend == "ultralytics":
+        return UltralyticsBackend(imgsz, threads, conf, cameras)
+
+    path = model_path(backend, imgsz, config.INFERENCE_INT8)
+    if backend == "onnx" and cameras > 1:
+        # ONNX graphs have a fixed batch size; prefer one exported with --batch N
+        batched = model_path(backend, imgsz, config.INFERENCE_INT8, batch=cameras)
+        if os.path.exists(batched):
+            path = batched
+        else:
+            logging.warning(f"{batched} not found; running cameras one at a time. "
+                            f"Export with --batch {cameras} to batch them.")
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"{path} not found. Run: python export_model.py --backend {backend} --imgsz {imgsz}"
+            + (" --int8" if config.INFERENCE_INT8 else "")
+        )
+    logging.info(f"Loading {backend} model from {path}")
+    if backend == "onnx":
+        return OnnxBackend(path, imgsz, threads, conf)
+    return OpenVinoBackend(path, imgsz, threads, conf, cameras)
+
+class _CameraState:
+    """Per-camera detector state: motion gate, Kalman propagation and detect-every-N counters."""
+    def __init__(self):
+        self.motion_gate = MotionGate() if config.MOTION_GATING else None
+        self.propagator = TrackPropagator()
+        self.last_tracks = []
+        self.skipped_passes = 0
+        self.frames_since_detect = 0
+        self.last_frame_time = None
+        self.frame_dt = 1.0 / 30
+        self.roi_passes = 0 # ROI passes since the last full-frame pass
+
+    def detect_interval(self):
+        """Frames between full detector passes while people are tracked."""
+        interval = max(1, config.DETECT_INTERVAL)
+        if config.DETECT_ADAPTIVE and interval > 1:
+            speed = self.propagator.max_speed()
+            if speed > 0:
+                # Re-detect before the fastest box can drift DETECT_MAX_DRIFT of its height
+                frames = config.DETECT_MAX_DRIFT / (speed * self.frame_dt)
+                interval = max(1, min(interval, int(frames)))
+        return interval
+
+class HumanDetector:
+    """
+    YOLOv8 person tracking for one or more cameras sharing a single model.
+    track_batch() runs every camera that needs a detector pass this round
+    through one batched backend call; each camera keeps its own motion gate,
+    propagation state and ByteTrack tracker.
+    With ROI_INFERENCE, a pass only looks at the door zones (room empty) or
+    the door zones plus the tracked people, at an input size scaled to the
+    crop; every ROI_FULL_FRAME_INTERVAL-th pass covers the whole frame.
+    """
+    def __init__(self, cameras=1):
+        # Load the configured YOLOv8n backend (PyTorch, ONNX Runtime or OpenVINO)
+        self.backend = create_backend(cameras)
+        self.confidence_threshold = config.CONFIDENCE_THRESHOLD
+        self.cameras = {} # camera index -> _CameraState
+        self.load_level = 0 # Set by the main loop's scheduler.LoadShedder
+
+        self.detected_frames = 0
+        self.propagated_frames = 0
+        self.batches = 0
+        self.mode_passes = dict.fromkeys(ROI_MODES, 0)
+
+    def warmup(self):
+        """Runs one dummy inference so the first real frame doesn't pay for lazy initialisation."""
+        with stage_timer('warmup'):
+            self.backend.warmup()
+
+    def _camera(self, camera):
+        state = self.cameras.get(camera)
+        if state is None:
+            state = self.cameras[camera] = _CameraState()
+        return state
+
+    @property
+    def last_tracks(self):
+        return self._camera(0).last_tracks
+
+    def _in_door(self, tracks, door_rects, width, height):
+        """True if any track center lies in a door rect (proportional coordinates)."""
+        for trk in tracks:
+            cx, cy = trk['center'][0] / width, trk['center'][1] / height
+            for x1, y1, x2, y2 in door_rects or ():
+                if x1 <= cx <= x2 and y1 <= cy <= y2:
+                    return True
+        return False
+
+    def track(self, frame, door_rects=None, now=None, camera=0):
+        """
+        Tracks humans in a frame using YOLOv8 tracking.
+        Static frames with nobody tracked are skipped by the motion gate;
+        the previous tracks are returned for them so callers see no change.
+        While people are tracked, YOLO runs every DETECT_INTERVAL frames and
+        the boxes are carried forward by Kalman prediction in between.
+        Drawing is left to annotator.FrameAnnotator, only when someone needs it.
+        Returns:
+            tracks (list): List of dicts {'id': int, 'box': [x1,y1,x2,y2], 'center': (x,y)}
+        """
+        return self.track_batch([(camera, frame, door_rects, now)])[0]
+
+    def _prepare(self, state, frame, door_rects, now):
+        """
+        Cheap per-camera checks before inference.
+        Returns:
+            tracks to use as-is, or None if this frame needs a detector pass.
+        """
+        if state.last_frame_time is not None and now > state.last_frame_time:
+            state.frame_dt = 0.9 * state.frame_dt + 0.1 * (now - state.last_frame_time)
+        state.last_frame_time = now
+
+        tracking = len(state.last_tracks) > 0
+        if state.motion_gate is not None:
+            with stage_timer('motion_gate'):
+                run = state.motion_gate.should_infer(frame, door_rects, tracking, now)
+            if not run:
+                return state.last_tracks
+
+        height, width = frame.shape[:2]
+        interval = state.detect_interval()
+        if self.load_level >= LEVEL_SKIP_FRAMES and not self._in_door(state.last_tracks, door_rects, width, height):
+            # Overloaded: stretch the detector interval, but never for someone in a doorway
+            interval *= config.LOAD_SKIP_STRIDE
+            if not tracking:
+                state.skipped_passes += 1
+                if state.skipped_passes % config.LOAD_SKIP_STRIDE:
+                    return state.last_tracks
+
+        if tracking and state.frames_since_detect + 1 < interval:
+            # Between detector passes: carry the boxes forward
+            state.frames_since_detect += 1
+            self.propagated_frames += 1
+            with stage_timer('propagation'):
+                tracks = state.propagator.predict(now, width, height)
+            state.last_tracks = tracks
+            return tracks
+        return None
+
+    def _plan(self, state, frame, door_rects, base_imgsz):
+        """
+        Picks the region for a detector pass.
+        Returns:
+            mode, crop (x1, y1, x2, y2) in pixels or None for the whole frame, imgsz.
+        """
+        height, width = frame.shape[:2]
+        if not config.ROI_INFERENCE or not door_rects or state.roi_passes >= config.ROI_FULL_FRAME_INTERVAL:
+            return ROI_FULL, None, base_imgsz
+
+        # Door zones, padded, plus every tracked box grown by the distance it may move
+        pad = config.ROI_PADDING
+        rects = [((x1 - pad) * width, (y1 - pad) * height, (x2 + pad) * width, (y2 + pad) * height)
+                 for x1, y1, x2, y2 in door_rects]
+        for trk in state.last_tracks:
+            x1, y1, x2, y2 = trk['box']
+            mx = (x2 - x1) * config.ROI_TRACK_PADDING
+            my = (y2 - y1) * config.ROI_TRACK_PADDING
+            rects.append((x1 - mx, y1 - my, x2 + mx, y2 + my))
+
+        x1 = max(0, int(min(r[0] for r in rects)))
+        y1 = max(0, int(min(r[1] for r in rects)))
+        x2 = min(width, int(math.ceil(max(r[2] for r in rects))))
+        y2 = min(height, int(math.ceil(max(r[3] for r in rects))))
+        if x2 <= x1 or y2 <= y1 or (x2 - x1) * (y2 - y1) > config.ROI_MAX_AREA * width * height:
+            return ROI_FULL, None, base_imgsz # Not worth cropping
+
+        # Same detail as a full-frame pass (letterboxing fits the longest side), in multiples of 32
+        scale = max(x2 - x1, y2 - y1) / max(width, height)
+        imgsz = max(config.ROI_MIN_IMGSZ, int(math.ceil(base_imgsz * scale / 32)) * 32)
+        return (ROI_TRACKS if state.last_tracks else ROI_DOOR), (x1, y1, x2, y2), min(imgsz, base_imgsz)
+
+    def track_batch(self, requests):
+        """
+        Tracks several cameras at once.
+        Args:
+            requests: list of (camera, frame, door_rects, now).
+        Returns:
+            list of track lists, in request order.
+        """
+        results = [None] * len(requests)
+        pending = []
+        for i, (camera, frame, door_rects, now) in enumerate(requests):
+            now = time.time() if now is None else now
+            state = self._camera(camera)
+            tracks = self._prepare(state, frame, door_rects, now)
+            if tracks is None:
+                pending.append((i, camera, frame, door_rects, now))
+            else:
+                results[i] = tracks
+        if not pending:
+            return results
+
+        base_imgsz = config.LOAD_DEGRADED_IMGSZ if self.load_level >= LEVEL_LOW_RES else config.INFERENCE_IMGSZ
+        crops, offsets, modes, imgsz = [], [], [], 0
+        for i, camera, frame, door_rects, now in pending:
+            state = self._camera(camera)
+            mode, crop, size = self._plan(state, frame, door_rects, base_imgsz)
+            if crop is None:
+                state.roi_passes = 0
+                crops.append(frame)
+                offsets.append(None)
+            else:
+                state.roi_passes += 1
+                x1, y1, x2, y2 = crop
+                crops.append(frame[y1:y2, x1:x2]) # View, no copy
+                offsets.append((x1, y1))
+            modes.append(mode)
+            self.mode_passes[mode] += 1
+            imgsz = max(imgsz, size)
+
+        # One backend call for every camera that needs a detector pass. The
+        # batch runs at its largest input, so it is timed under its widest mode.
+        mode = min(modes, key=ROI_MODES.index)
+        with stage_timer('inference'), stage_timer(f'inference_{mode}'):
+            outputs = self.backend.infer_batch(crops, [p[1] for p in pending], imgsz, offsets)
+        self.batches += 1
+
+        for (i, camera, frame, door_rects, now), (boxes, ids) in zip(pending, outputs):
+            tracks = []
+            for box, track_id in zip(boxes, ids):
+                x1, y1, x2, y2 = box
+                w = x2 - x1
+                h = y2 - y1
+
+                # Filter small noise (must be at least 5% of frame width/height approx)
+                # Simple heuristic: ignore things smaller than 20x20 pixels
+                if w < 20 or h < 50: 
+                    continue
+
+                center_x = (x1 + x2) // 2
+                center_y = (y1 + y2) // 2
+                tracks.append({
+                    'id': track_id,
+                    'box': box,
+                    'center': (center_x, center_y)
+                })
+
+            state = self._camera(camera)
+            state.frames_since_detect = 0
+            state.propagator.update(tracks, now)
+            state.last_tracks = tracks
+            self.detected_frames += 1
+            results[i] = tracks
+        return results
+
+    def stats(self):
+        """Frame counters: detector passes, propagated frames and motion-gated frames (all cameras)."""
+        stats = {
+            'detected_frames': self.detected_frames,
+            'propagated_frames': self.propagated_frames,
+            'batches': self.batches,
+        }
+        for mode, count in self.mode_passes.items():
+            stats[f'{mode}_passes'] = count
+        for camera, state in sorted(self.cameras.items()):
+            if state.motion_gate is None:
+                continue
+            for key, value in state.motion_gate.stats().items():
+                if key.endswith('_frames'):
+                    stats[key] = stats.get(key, 0) + value
+                elif camera == 0:
+                    stats[key] = value
+        return stats
+
+    def close(self):
+        pass
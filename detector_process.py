@@ -0,0 +1,226 @@
+import time
+import logging
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+import config
+from propagation import TrackPropagator
+
+def _worker_main(conn):
+    """
+    Worker process: loads and warms up HumanDetector, reports ready, then runs
+    it on frames read straight out of shared memory.
+    """
+    from detector import HumanDetector
+
+    shm = None
+    frames = []
+    try:
+        detector = HumanDetector()
+        detector.warmup()
+        conn.send(('ready', None, None))
+
+        while True:
+            msg = conn.recv()
+            if msg is None:
+                break
+            if msg[0] == 'attach':
+                # First frame or new frame size: map the parent's ring of slots
+                _, shm_name, shape, slots = msg
+                frames.clear()
+                if shm is not None:
+                    shm.close()
+                shm = shared_memory.SharedMemory(name=shm_name)
+                frame_bytes = int(np.prod(shape))
+                frames = [np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=i * frame_bytes) for i in range(slots)]
+                continue
+            seq, slot, door_rects, now, detector.load_level = msg
+            tracks = detector.track(frames[slot], door_rects, now)
+            # Compact reply: one [id, x1, y1, x2, y2, cx, cy] row per track
+            rows = np.array([[t['id'], *t['box'], *t['center']] for t in tracks], dtype=np.int32).reshape(-1, 7)
+            conn.send((seq, rows, detector.stats()))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        # Views into the buffer must be gone before it can be closed
+        frames.clear()
+        if shm is not None:
+            shm.close()
+
+class DetectorProcess:
+    """
+    Runs HumanDetector in a separate process so YOLO doesn't fight the
+    streamer, Telegram and notifier threads for the GIL.
+    Frames go through a ring of shared-memory slots (no ndarray pickling);
+    only compact track arrays come back. A dead or hung worker is detected
+    and restarted in the background; the frame loop never waits for it.
+    Same track()/stats() interface as HumanDetector.
+    """
+    def __init__(self):
+        self.slots = config.DETECTOR_SHM_SLOTS
+        self.ctx = mp.get_context('spawn')
+
+        self.proc = None
+        self.conn = None
+        self.ready = threading.Event() # Set once the current worker has warmed up
+        self._starter = None # Thread waiting for the worker to report ready
+        self.shm = None
+        self.shape = None
+        self.frames = []
+        self.next_slot = 0
+        self.seq = 0
+
+        self.last_tracks = []
+        self.last_reply = None # Time of the last frame the worker answered
+        self.propagator = TrackPropagator() # Carries tracks forward while the worker is down
+        self.load_level = 0 # Forwarded to the worker's HumanDetector with every frame
+        self.last_stats = {}
+        self.restarts = 0
+        self.next_restart = 0.0
+
+    def start(self):
+        """
+        Starts the worker without waiting for it. It becomes usable (`ready`)
+        once it has loaded and warmed up the model.
+        """
+        self._stop()
+        parent_conn, child_conn = self.ctx.Pipe()
+        self.proc = self.ctx.Process(target=_worker_main, args=(child_conn,), name="detector-worker", daemon=True)
+        self.proc.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.ready = threading.Event()
+        self._starter = threading.Thread(target=self._wait_ready, args=(self.proc, self.conn, self.ready),
+                                         name="detector-start", daemon=True)
+        self._starter.start()
+
+    def _wait_ready(self, proc, conn, ready):
+        """Runs on the starter thread until the worker reports in or DETECTOR_STARTUP_TIMEOUT passes."""
+        try:
+            if conn.poll(config.DETECTOR_STARTUP_TIMEOUT) and conn.recv()[0] == 'ready':
+                logging.info(f"Detector worker started (pid {proc.pid}).")
+                ready.set()
+                return
+        except (EOFError, OSError):
+            if conn.closed:
+                return # Stopped meanwhile
+        logging.error("Detector worker failed to start.")
+        # The frame loop sees it dead and restarts it after the backoff
+        proc.terminate()
+
+    def wait_ready(self):
+        """Blocks until the worker started by start() is ready. Returns False if it failed to start."""
+        if self._starter is not None:
+            self._starter.join()
+        return self.ready.is_set()
+
+    def _attach(self, shape):
+        """Allocates the shared-memory ring for a new frame size and hands it to the worker."""
+        self._release_frames()
+        frame_bytes = int(np.prod(shape))
+        self.shm = shared_memory.SharedMemory(create=True, size=frame_bytes * self.slots)
+        self.frames = [np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf, offset=i * frame_bytes) for i in range(self.slots)]
+        self.shape = shape
+        self.conn.send(('attach', self.shm.name, shape, self.slots))
+
+    def _release_frames(self):
+        if self.shm is not None:
+            self.frames = []
+            self.shm.close()
+            self.shm.unlink()
+        self.shm = None
+        self.shape = None
+
+    def _stop(self, graceful=True):
+        """Stops the worker; a hung one (graceful=False) is terminated right away."""
+        if self.conn is not None and graceful:
+            try:
+                self.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        if self.proc is not None:
+            if not graceful:
+                self.proc.terminate()
+            self.proc.join(timeout=2.0)
+            if self.proc.is_alive():
+                self.proc.terminate()
+                self.proc.join(timeout=2.0)
+        if self.conn is not None:
+            self.conn.close()
+        self._release_frames()
+        self.proc = None
+        self.conn = None
+
+    def _ensure_worker(self):
+        """(Re)starts the worker in the background if needed. Returns False while it is unavailable."""
+        if self.proc is not None and self.proc.is_alive():
+            return self.ready.is_set()
+
+        now = time.time()
+        if now < self.next_restart:
+            return False
+        if self.proc is not None:
+            self.restarts += 1
+            logging.error(f"Detector worker died (exit code {self.proc.exitcode}). Restarting...")
+        self.next_restart = now + config.DETECTOR_RESTART_BACKOFF
+        self.start()
+        return False
+
+    def _outage_tracks(self, frame, now):
+        """
+        Tracks while the worker is unavailable: the last ones carried forward
+        for DETECTOR_OUTAGE_PREDICT_SECONDS, then none.
+        """
+        if self.last_reply is not None and now - self.last_reply <= config.DETECTOR_OUTAGE_PREDICT_SECONDS:
+            height, width = frame.shape[:2]
+            self.last_tracks = self.propagator.predict(now, width, height)
+        else:
+            self.last_tracks = []
+        return self.last_tracks
+
+    def track(self, frame, door_rects=None, now=None):
+        """
+        Same contract as HumanDetector.track. While the worker is starting
+        or down, predicted (and after a while, no) tracks are returned
+        instead of waiting for it.
+        """
+        now = time.time() if now is None else now
+        if not self._ensure_worker():
+            return self._outage_tracks(frame, now)
+
+        try:
+            if frame.shape != self.shape:
+                self._attach(frame.shape)
+            slot = self.next_slot
+            self.next_slot = (slot + 1) % self.slots
+            np.copyto(self.frames[slot], frame)
+            self.seq += 1
+
+            self.conn.send((self.seq, slot, door_rects, now, self.load_level))
+            while True:
+                if not self.conn.poll(config.DETECTOR_TIMEOUT_SECONDS):
+                    raise TimeoutError("no reply")
+                seq, rows, stats = self.conn.recv()
+                if seq == self.seq:
+                    break
+        except (EOFError, OSError, TimeoutError) as e:
+            logging.error(f"Detector worker not responding ({e}). Restarting...")
+            self.restarts += 1
+            self._stop(graceful=False)
+            return self._outage_tracks(frame, now)
+
+        self.last_stats = stats
+        self.last_tracks = [
+            {'id': int(r[0]), 'box': r[1:5], 'center': (int(r[5]), int(r[6]))}
+            for r in rows
+        ]
+        self.last_reply = now
+        self.propagator.update(self.last_tracks, now)
+        return self.last_tracks
+
+    def stats(self):
+        return dict(self.last_stats, worker_restarts=self.restarts)
+
+    def close(self):
+        self._stop()
@@ -0,0 +1,159 @@
+"""
+Exports YOLOv8n for the CPU inference backends and caches the result in config.MODEL_DIR.
+
+Examples:
+    python export_model.py --backend onnx --imgsz 416
+    python export_model.py --backend openvino --imgsz 416 --int8 --capture 300
+    python export_model.py --backend onnx --imgsz 416 --batch 3   # three cameras
+
+INT8 models are calibrated on frames from our own camera stored in
+config.CALIBRATION_DIR. Use --capture N to grab them first. Existing
+artifacts are reused unless --force is given.
+
+ONNX graphs have a fixed batch size, so multi-camera setups need one
+exported with --batch N (N = number of cameras). OpenVINO models are
+reshaped at load time and don't need it.
+"""
+import argparse
+import glob
+import logging
+import os
+import shutil
+import cv2
+import numpy as np
+from ultralytics import YOLO
+import config
+from detector import model_path, letterbox
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def capture_calibration_frames(count, every=15):
+    """Saves `count` frames from the configured camera, one every `every` reads."""
+    os.makedirs(config.CALIBRATION_DIR, exist_ok=True)
+    cap = cv2.VideoCapture(config.CAMERA_INDEX)
+    if not cap.isOpened():
+        raise RuntimeError("Could not open video device.")
+
+    saved = 0
+    reads = 0
+    try:
+        while saved < count:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            reads += 1
+            if reads % every == 0:
+                cv2.imwrite(os.path.join(config.CALIBRATION_DIR, f"calib_{saved:05d}.jpg"), frame)
+                saved += 1
+    finally:
+        cap.release()
+    logging.info(f"Captured {saved} calibration frames into {config.CALIBRATION_DIR}")
+
+def load_calibration_blobs(imgsz, limit):
+    """Letterboxed blobs for the calibration frames, in a stable (sorted) order."""
+    files = sorted(glob.glob(os.path.join(config.CALIBRATION_DIR, "*.jpg")))[:limit]
+    if not files:
+        raise RuntimeError(f"No calibration frames in {config.CALIBRATION_DIR}. Use --capture N first.")
+    blobs = []
+    for path in files:
+        frame = cv2.imread(path)
+        if frame is not None:
+            blobs.append(letterbox(frame, imgsz)[0])
+    logging.info(f"Loaded {len(blobs)} calibration frames.")
+    return blobs
+
+def export_fp32(backend, imgsz, force, batch=1):
+    """Exports the FP32 model through ultralytics. Returns its cached path."""
+    target = model_path(backend, imgsz, batch=batch)
+    if os.path.exists(target) and not force:
+        logging.info(f"Using cached {target}")
+        return target
+
+    os.makedirs(config.MODEL_DIR, exist_ok=True)
+    model = YOLO('yolov8n.pt')
+    if backend == "onnx":
+        exported = model.export(format="onnx", imgsz=imgsz, dynamic=False, simplify=True, batch=batch)
+        shutil.move(exported, target)
+    else:
+        exported = model.export(format="openvino", imgsz=imgsz, half=False)
+        target_dir = os.path.dirname(target)
+        shutil.rmtree(target_dir, ignore_errors=True)
+        shutil.move(exported, target_dir)
+        # ultralytics names the IR after the weights file; normalise to yolov8n.xml/.bin
+        for ext in (".xml", ".bin"):
+            found = glob.glob(os.path.join(target_dir, f"*{ext}"))
+            if found and found[0] != os.path.splitext(target)[0] + ext:
+                os.replace(found[0], os.path.splitext(target)[0] + ext)
+    logging.info(f"Exported {target}")
+    return target
+
+def quantize_onnx(fp32_path, int8_path, blobs, batch=1):
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    import onnxruntime as ort
+
+    input_name = ort.InferenceSession(fp32_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    # Batched graphs take `batch` frames per calibration step
+    stacks = [np.concatenate(blobs[i:i + batch]) for i in range(0, len(blobs) - batch + 1, batch)]
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self.it = iter(stacks)
+
+        def get_next(self):
+            blob = next(self.it, None)
+            return None if blob is None else {input_name: blob}
+
+    quantize_static(fp32_path, int8_path, FrameReader(),
+                    quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8,
+                    weight_type=QuantType.QInt8)
+
+def quantize_openvino(fp32_path, int8_path, blobs):
+    import nncf
+    import openvino as ov
+
+    core = ov.Core()
+    model = core.read_model(fp32_path)
+    quantized = nncf.quantize(model, nncf.Dataset(blobs), subset_size=len(blobs),
+                              preset=nncf.QuantizationPreset.MIXED)
+    os.makedirs(os.path.dirname(int8_path), exist_ok=True)
+    ov.save_model(quantized, int8_path)
+
+def export_int8(backend, imgsz, fp32_path, force, calib_limit, batch=1):
+    target = model_path(backend, imgsz, int8=True, batch=batch)
+    if os.path.exists(target) and not force:
+        logging.info(f"Using cached {target}")
+        return target
+
+    blobs = load_calibration_blobs(imgsz, calib_limit)
+    if backend == "onnx":
+        quantize_onnx(fp32_path, target, blobs, batch)
+    else:
+        quantize_openvino(fp32_path, target, blobs)
+    logging.info(f"Quantized {target}")
+    return target
+
+def main():
+    parser = argparse.ArgumentParser(description="Export YOLOv8n for ONNX Runtime / OpenVINO.")
+    parser.add_argument("--backend", choices=["onnx", "openvino"], default=config.INFERENCE_BACKEND if config.INFERENCE_BACKEND != "ultralytics" else "onnx")
+    parser.add_argument("--imgsz", type=int, default=config.INFERENCE_IMGSZ)
+    parser.add_argument("--int8", action="store_true", help="Also build the INT8 model calibrated on our frames")
+    parser.add_argument("--capture", type=int, default=0, help="Grab N calibration frames from the camera first")
+    parser.add_argument("--calib-limit", type=int, default=300, help="Max calibration frames used")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if cached artifacts exist")
+    parser.add_argument("--batch", type=int, default=1, help="Fixed batch size (ONNX only): the number of cameras")
+    args = parser.parse_args()
+    if args.batch > 1 and args.backend != "onnx":
+        parser.error("--batch is only needed for ONNX; OpenVINO models are reshaped at load time")
+
+    np.random.seed(0)
+    if args.capture:
+        capture_calibration_frames(args.capture)
+
+    fp32_path = export_fp32(args.backend, args.imgsz, args.force, args.batch)
+    if args.int8:
+        export_int8(args.backend, args.imgsz, fp32_path, args.force, args.calib_limit, args.batch)
+
+if __name__ == "__main__":
+    main()
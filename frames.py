@@ -0,0 +1,107 @@
+import threading
+import numpy as np
+import config
+
+class FrameView(np.ndarray):
+    """
+    Read-only view of a pooled frame buffer. Behaves like any other image
+    array; consumers that keep it past the current loop iteration call
+    retain() / release() so the buffer isn't recycled under them.
+    """
+    def __array_finalize__(self, obj):
+        # Slices share the buffer, so they keep it alive too; results of arithmetic don't
+        buf = getattr(obj, 'frame', None)
+        self.frame = buf if buf is not None and np.may_share_memory(self, buf.array) else None
+
+class _Buffer:
+    __slots__ = ('pool', 'array', 'view', 'refs')
+
+    def __init__(self, pool, array):
+        self.pool = pool
+        self.array = array # Writable, for the producer only
+        self.view = array.view(FrameView)
+        self.view.flags.writeable = False
+        self.view.frame = self
+        self.refs = 0
+
+class FramePool:
+    """
+    Recycled frame buffers for one capture source.
+    The producer fills a buffer from acquire() in place and hands out its
+    read-only view; every holder keeps a reference, and the buffer returns to
+    the pool when the last one is released. Once warmed up, a steady stream of
+    frames allocates nothing. A buffer that is never released is simply
+    garbage-collected and replaced.
+    """
+    def __init__(self, size=config.FRAME_POOL_SIZE):
+        self.size = size # Free buffers kept for reuse
+        self.shape = None
+        self.dtype = None
+        self._free = []
+        self._lock = threading.Lock()
+
+        # Stats
+        self.allocated = 0
+        self.reused = 0
+        self.in_use = 0
+
+    def acquire(self):
+        """A buffer to fill (one reference, held by the caller), or None until the frame size is known."""
+        with self._lock:
+            if self.shape is None:
+                return None
+            buf = self._free.pop() if self._free else None
+            if buf is None:
+                self.allocated += 1
+            else:
+                self.reused += 1
+            self.in_use += 1
+            shape, dtype = self.shape, self.dtype
+        if buf is None:
+            buf = _Buffer(self, np.empty(shape, dtype=dtype))
+        buf.refs = 1 # Free buffers are only reachable from here
+        return buf
+
+    def wrap(self, array):
+        """
+        Adopts an array filled elsewhere (first frame, or the size changed) and
+        makes its size the pool's. Returns a buffer with one reference.
+        """
+        with self._lock:
+            if array.shape != self.shape or array.dtype != self.dtype:
+                self.shape = array.shape
+                self.dtype = array.dtype
+                self._free = []
+            self.allocated += 1
+            self.in_use += 1
+        buf = _Buffer(self, array)
+        buf.refs = 1
+        return buf
+
+    def _retain(self, buf):
+        with self._lock:
+            buf.refs += 1
+
+    def _release(self, buf):
+        with self._lock:
+            buf.refs -= 1
+            if buf.refs > 0:
+                return
+            self.in_use -= 1
+            if len(self._free) < self.size and buf.array.shape == self.shape and buf.array.dtype == self.dtype:
+                self._free.append(buf)
+
+    def stats(self):
+        return {'allocated': self.allocated, 'reused': self.reused, 'in_use': self.in_use, 'free': len(self._free)}
+
+def retain(frame):
+    """Keeps a pooled frame's buffer from being recycled. No-op for ordinary arrays."""
+    buf = getattr(frame, 'frame', None)
+    if buf is not None:
+        buf.pool._retain(buf)
+
+def release(frame):
+    """Drops a reference taken by retain() (or handed over by the producer). No-op for ordinary arrays."""
+    buf = getattr(frame, 'frame', None)
+    if buf is not None:
+        buf.pool._release(buf)
@@ -0,0 +1,281 @@
+import math
+import time
+import queue
+import sqlite3
+import logging
+import threading
+import config
+from metrics import REGISTRY, observe_stage
+from occupancy import ENTER, EXIT, REAPPEAR, REACQUIRE
+
+# Events worth keeping (ENTRY_ALERT only repeats ENTER)
+RECORDED_KINDS = (ENTER, EXIT, REAPPEAR, REACQUIRE)
+
+# Rollup resolutions (seconds). Queries read the coarsest table that still
+# gives the requested resolution, so they touch a bounded number of rows.
+ROLLUPS = (60, 3600)
+
+_ROLLUPS = """
+CREATE TABLE IF NOT EXISTS rollups (
+    res INTEGER NOT NULL, bucket INTEGER NOT NULL,
+    entries INTEGER NOT NULL DEFAULT 0, exits INTEGER NOT NULL DEFAULT 0,
+    max_count INTEGER NOT NULL DEFAULT 0, sum_count INTEGER NOT NULL DEFAULT 0, samples INTEGER NOT NULL DEFAULT 0,
+    room TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (res, bucket, room)) WITHOUT ROWID;
+"""
+
+# Rows written before rooms were recorded have room ''
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    t REAL NOT NULL, kind TEXT NOT NULL, track_id INTEGER, count INTEGER, door TEXT, duration REAL,
+    room TEXT NOT NULL DEFAULT '');
+CREATE INDEX IF NOT EXISTS events_t ON events (t);
+CREATE TABLE IF NOT EXISTS samples (
+    t REAL NOT NULL, count INTEGER NOT NULL, room TEXT NOT NULL DEFAULT '');
+CREATE INDEX IF NOT EXISTS samples_t ON samples (t);
+""" + _ROLLUPS
+
+_UPSERT_EVENT = """
+INSERT INTO rollups (room, res, bucket, entries, exits) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (res, bucket, room) DO UPDATE SET entries = entries + excluded.entries, exits = exits + excluded.exits
+"""
+
+_UPSERT_SAMPLE = """
+INSERT INTO rollups (room, res, bucket, max_count, sum_count, samples) VALUES (?, ?, ?, ?, ?, 1)
+ON CONFLICT (res, bucket, room) DO UPDATE SET max_count = MAX(max_count, excluded.max_count),
+    sum_count = sum_count + excluded.sum_count, samples = samples + 1
+"""
+
+def _migrate(conn):
+    """Adds the room column to a database created before rooms were recorded."""
+    for table in ("events", "samples"):
+        if "room" not in [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN room TEXT NOT NULL DEFAULT ''")
+    if "room" not in [row[1] for row in conn.execute("PRAGMA table_info(rollups)")]:
+        # The room is part of the primary key, so the table is rebuilt
+        conn.executescript("ALTER TABLE rollups RENAME TO rollups_old;" + _ROLLUPS + """
+            INSERT INTO rollups (res, bucket, entries, exits, max_count, sum_count, samples)
+                SELECT res, bucket, entries, exits, max_count, sum_count, samples FROM rollups_old;
+            DROP TABLE rollups_old;""")
+
+def _room_filter(room):
+    """SQL condition and parameters restricting a query to one room (None: every room)."""
+    return ("", ()) if room is None else (" AND room = ?", (room,))
+
+class EventLog:
+    """
+    Persistent occupancy history in SQLite (WAL mode).
+    record() and sample() only queue rows; a writer thread commits them in
+    batches every HISTORY_FLUSH_SECONDS. Besides the raw events and count
+    samples it maintains per-minute and per-hour rollups, so range queries
+    stay fast however many rows have accumulated. Every row carries the room
+    it belongs to; queries cover one room or all of them. Readers use their
+    own connections and never wait for the writer.
+    """
+    def __init__(self, path=None):
+        self.path = path or config.HISTORY_DB
+        self._queue = queue.Queue(maxsize=config.HISTORY_QUEUE_SIZE)
+        self._local = threading.local() # Per-thread read connections
+        self._last_sample = {} # room -> (time, count)
+
+        # Stats
+        self.written = 0
+        self.dropped = 0
+
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+        _migrate(conn)
+        conn.close()
+
+        REGISTRY.gauge("history_backlog", "Rows waiting to be written to the event log.", fn=self._queue.qsize)
+        REGISTRY.counter("history_rows_written_total", "Rows written to the event log.", fn=lambda: self.written)
+
+        self._thread = threading.Thread(target=self._writer_thread, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL") # Safe with WAL; skips an fsync per commit
+        return conn
+
+    # --- Writing ---
+
+    def record(self, event, room=""):
+        """Queues an occupancy.Event that happened in `room`."""
+        if event.kind in RECORDED_KINDS:
+            self._put(('event', (room, event)))
+
+    def sample(self, count, now, room=""):
+        """Queues a room count sample; at most one per HISTORY_SAMPLE_SECONDS per room unless the count changed."""
+        last = self._last_sample.get(room)
+        if last is not None and count == last[1] and now - last[0] < config.HISTORY_SAMPLE_SECONDS:
+            return
+        self._last_sample[room] = (now, count)
+        self._put(('sample', (room, now, count)))
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """Writes whatever is queued and stops the writer."""
+        self._queue.put(None)
+        self._thread.join(timeout=5.0)
+
+    def _writer_thread(self):
+        conn = self._connect()
+        stop = False
+        while not stop:
+            # Collect everything that arrives within one flush interval
+            batch = []
+            deadline = time.monotonic() + config.HISTORY_FLUSH_SECONDS
+            while True:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            if batch:
+                try:
+                    started = time.perf_counter()
+                    self._write(conn, batch)
+                    observe_stage('history_write', time.perf_counter() - started)
+                    self.written += len(batch)
+                except sqlite3.Error as e:
+                    logging.error(f"Failed to write {len(batch)} history rows: {e}")
+        conn.close()
+
+    def _write(self, conn, batch):
+        events, samples, rollup_events, rollup_samples = [], [], [], []
+        for kind, item in batch:
+            if kind == 'event':
+                room, e = item
+                events.append((e.time, e.kind, int(e.track_id), e.count, e.door, e.duration, room))
+                if e.kind in (ENTER, EXIT):
+                    entered, exited = (1, 0) if e.kind == ENTER else (0, 1)
+                    rollup_events.extend((room, res, int(e.time // res), entered, exited) for res in ROLLUPS)
+            else:
+                room, t, count = item
+                samples.append((t, count, room))
+                rollup_samples.extend((room, res, int(t // res), count, count) for res in ROLLUPS)
+
+        with conn: # One transaction per batch
+            conn.executemany("INSERT INTO events (t, kind, track_id, count, door, duration, room) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?)", events)
+            conn.executemany("INSERT INTO samples (t, count, room) VALUES (?, ?, ?)", samples)
+            conn.executemany(_UPSERT_EVENT, rollup_events)
+            conn.executemany(_UPSERT_SAMPLE, rollup_samples)
+
+    # --- Queries ---
+
+    def _reader(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def totals(self, start, end, room=None):
+        """
+        Entries and exits in [start, end), in `room` or in every room.
+        Whole hours come from the hourly rollup; only the partial hours at
+        either end are counted from raw events. Without a room, the peak is
+        the highest count of any one room.
+        """
+        conn = self._reader()
+        where, params = _room_filter(room)
+        first_hour = math.ceil(start / 3600)
+        last_hour = math.floor(end / 3600)
+
+        def raw(lo, hi):
+            row = conn.execute("SELECT COALESCE(SUM(kind = ?), 0), COALESCE(SUM(kind = ?), 0) FROM events "
+                               "WHERE t >= ? AND t < ?" + where, (ENTER, EXIT, lo, hi, *params)).fetchone()
+            return row[0], row[1]
+
+        if last_hour <= first_hour:
+            entries, exits = raw(start, end)
+        else:
+            entries, exits = conn.execute(
+                "SELECT COALESCE(SUM(entries), 0), COALESCE(SUM(exits), 0) FROM rollups "
+                "WHERE res = 3600 AND bucket >= ? AND bucket < ?" + where, (first_hour, last_hour, *params)).fetchone()
+            for lo, hi in ((start, first_hour * 3600), (last_hour * 3600, end)):
+                e, x = raw(lo, hi)
+                entries += e
+                exits += x
+
+        # Peak from raw samples for short ranges, else from the rollup buckets
+        # that start within the range
+        span = end - start
+        if span <= 3600:
+            peak = conn.execute("SELECT MAX(count) FROM samples WHERE t >= ? AND t < ?" + where,
+                                (start, end, *params)).fetchone()[0]
+        else:
+            res = 60 if span <= 2 * 86400 else 3600
+            peak = conn.execute("SELECT MAX(max_count) FROM rollups WHERE res = ? AND bucket >= ? AND bucket < ?" + where,
+                                (res, math.ceil(start / res), math.ceil(end / res), *params)).fetchone()[0]
+        return {'entries': entries, 'exits': exits, 'peak_count': peak or 0}
+
+    def series(self, start, end, points=60, room=None):
+        """
+        Downsampled history of `room` (or every room): up to `points` buckets
+        covering [start, end), each {'t', 'entries', 'exits', 'max_count', 'avg_count'}.
+        """
+        step = max((end - start) / max(points, 1), 1.0)
+        buckets = int(math.ceil((end - start) / step))
+        conn = self._reader()
+        where, params = _room_filter(room)
+        res = max([r for r in ROLLUPS if r <= step], default=None)
+
+        if res is None:
+            # Finer than a minute: short range, aggregate raw rows
+            rows = conn.execute(
+                "SELECT CAST((t - ?) / ? AS INTEGER) AS b, MAX(count), SUM(count), COUNT(*) FROM samples "
+                "WHERE t >= ? AND t < ?" + where + " GROUP BY b", (start, step, start, end, *params)).fetchall()
+            samples = {b: (mx, total, n) for b, mx, total, n in rows}
+            rows = conn.execute(
+                "SELECT CAST((t - ?) / ? AS INTEGER) AS b, SUM(kind = ?), SUM(kind = ?) FROM events "
+                "WHERE t >= ? AND t < ?" + where + " GROUP BY b", (start, step, ENTER, EXIT, start, end, *params)).fetchall()
+            moves = {b: (entered, exited) for b, entered, exited in rows}
+        else:
+            samples, moves = {}, {}
+            # Only rollup buckets that start inside the range; one straddling
+            # `start` holds rows from before it
+            rows = conn.execute(
+                "SELECT bucket, entries, exits, max_count, sum_count, samples FROM rollups "
+                "WHERE res = ? AND bucket >= ? AND bucket < ?" + where,
+                (res, math.ceil(start / res), math.ceil(end / res), *params)).fetchall()
+            for bucket, entered, exited, mx, total, n in rows:
+                b = int((bucket * res - start) // step)
+                if not 0 <= b < buckets:
+                    continue
+                e0, x0 = moves.get(b, (0, 0))
+                moves[b] = (e0 + entered, x0 + exited)
+                if n:
+                    m0, t0, n0 = samples.get(b, (0, 0, 0))
+                    samples[b] = (max(m0, mx), t0 + total, n0 + n)
+
+        result = []
+        for b in range(buckets):
+            entered, exited = moves.get(b, (0, 0))
+            mx, total, n = samples.get(b, (None, 0, 0))
+            result.append({
+                't': start + b * step,
+                'entries': entered,
+                'exits': exited,
+                'max_count': mx,
+                'avg_count': total / n if n else None,
+            })
+        return result
+
+    def query(self, start, end, points=60, room=None):
+        """Totals plus a downsampled series, as served by /history."""
+        started = time.perf_counter()
+        result = {'start': start, 'end': end, 'room': room, 'totals': self.totals(start, end, room),
+                  'series': self.series(start, end, points, room)}
+        observe_stage('history_query', time.perf_counter() - started)
+        return result
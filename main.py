@@ -1,58 +1,30 @@
-import cv2
 import time
-import logging
-import json
-import os
-import math
+STARTED = time.monotonic() # Before the other imports, so startup timings include them
+
+import cv2
 import datetime
+import logging
 import subprocess
 import threading
 import re
 import config
-from detector import HumanDetector
-from wled import WLEDController
-from notifier import TelegramNotifier
-import streamer
+import frames
+from annotator import FrameAnnotator
+from occupancy import ENTER, EXIT
+from clips import ClipRecorder
+from notifier import TelegramNotifier, PRIORITY_COMMAND
+from snapshots import SnapshotStore
+from history import EventLog
+from scheduler import LoadShedder, LEVEL_NO_ANNOTATION
+from cameras import Camera, camera_settings
+from capture import FrameGrabber
+from startup import Startup
+from bus import BusPublisher
+from metrics import REGISTRY, stage_timer
 
 # Configure logging
 logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
 
-DOOR_CONFIG_FILE = "door_config.json"
-
-class DoorConfig:
-    def __init__(self):
-        self.rect = config.DOOR_RECT
-        self.dragging = False
-        self.start_point = None
-        self.current_drag_rect = None 
-
-    def load(self):
-        if os.path.exists(DOOR_CONFIG_FILE):
-            try:
-                with open(DOOR_CONFIG_FILE, 'r') as f:
-                    data = json.load(f)
-                    self.rect = data.get("rect", config.DOOR_RECT)
-            except Exception as e:
-                logging.error(f"Failed to load door config: {e}")
-
-    def save(self):
-        try:
-            with open(DOOR_CONFIG_FILE, 'w') as f:
-                json.dump({"rect": self.rect}, f)
-        except Exception as e:
-            logging.error(f"Failed to save door config: {e}")
-
-def get_absolute_rect(rect, width, height):
-    dx1, dy1, dx2, dy2 = rect
-    x1, y1 = int(dx1 * width), int(dy1 * height)
-    x2, y2 = int(dx2 * width), int(dy2 * height)
-    return x1, y1, x2, y2
-
-def is_in_rect(center, rect, width, height):
-    x, y = center
-    x1, y1, x2, y2 = get_absolute_rect(rect, width, height)
-    return x1 <= x <= x2 and y1 <= y <= y2
-
 def mouse_callback(event, x, y, flags, param):
     cfg = param['config']
     width, height = param['size']
@@ -90,10 +62,10 @@ def control_tunnel(action, notifier):
     global tunnel_process
     if action == 'start_stream':
         if tunnel_process:
-            notifier.send_message("Tunnel already running.")
+            notifier.send_message("Tunnel already running.", PRIORITY_COMMAND)
             return
             
-        notifier.send_message("Starting Cloudflare Tunnel... 🚀")
+        notifier.send_message("Starting Cloudflare Tunnel... 🚀", PRIORITY_COMMAND)
         try:
             # Start cloudflared
             cmd = [config.CLOUDFLARED_PATH, "tunnel", "--url", f"http://localhost:{config.STREAM_PORT}"]
@@ -103,17 +75,17 @@ def control_tunnel(action, notifier):
             threading.Thread(target=extract_url, args=(tunnel_process.stderr, notifier)).start()
             
         except FileNotFoundError:
-            notifier.send_message("Error: 'cloudflared' not found in PATH.")
+            notifier.send_message("Error: 'cloudflared' not found in PATH.", PRIORITY_COMMAND)
         except Exception as e:
-            notifier.send_message(f"Error starting tunnel: {e}")
+            notifier.send_message(f"Error starting tunnel: {e}", PRIORITY_COMMAND)
             
     elif action == 'stop_stream':
         if tunnel_process:
             tunnel_process.terminate()
             tunnel_process = None
-            notifier.send_message("Tunnel Closed. 🛑")
+            notifier.send_message("Tunnel Closed. 🛑", PRIORITY_COMMAND)
         else:
-            notifier.send_message("No tunnel running.")
+            notifier.send_message("No tunnel running.", PRIORITY_COMMAND)
 
 def extract_url(pipe, notifier):
     """Reads stream output to find the *.trycloudflare.com URL"""
@@ -122,18 +94,130 @@ def extract_url(pipe, notifier):
             url_match = re.search(r'https://[a-zA-Z0-9-]+\.trycloudflare\.com', line)
             if url_match:
                 url = url_match.group(0)
-                notifier.send_message(f"🎥 Live Stream Ready:\n{url}")
+                notifier.send_message(f"🎥 Live Stream Ready:\n{url}", PRIORITY_COMMAND)
                 return
 
+def history_window(arg, now):
+    """
+    Parses the /history argument.
+    Returns:
+        (start, end, label), or None if it can't be parsed.
+        "" -> last 24 h, "6" -> last 6 h, "9-11" -> 9:00 to 11:00 today.
+    """
+    try:
+        if not arg:
+            return now - 86400, now, "last 24h"
+        if '-' in arg:
+            first, last = (int(h) for h in arg.split('-', 1))
+            if not 0 <= first < last <= 24:
+                return None
+            midnight = datetime.datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+            return midnight + first * 3600, midnight + last * 3600, f"today {first}:00-{last}:00"
+        hours = float(arg)
+        if hours <= 0:
+            return None
+        return now - hours * 3600, now, f"last {arg}h"
+    except ValueError:
+        return None
+
+def load_detector(cameras):
+    """
+    Builds the detector and warms it up (runs on a startup thread). The
+    detector modules are imported here, so their import time counts towards
+    the model phase instead of delaying the start of the other phases.
+    """
+    if config.DETECTOR_PROCESS and cameras == 1:
+        from detector_process import DetectorProcess
+        # The worker loads and warms up the model before it reports ready;
+        # if it doesn't, track() keeps retrying in the background
+        detector = DetectorProcess()
+        detector.start()
+        detector.wait_ready()
+        return detector
+    from detector import HumanDetector
+    # One model for every camera; their frames are batched into one call
+    detector = HumanDetector(cameras)
+    detector.warmup()
+    return detector
+
 def main():
-    detector = HumanDetector()
-    wled = WLEDController()
-    door_cfg = DoorConfig()
-    door_cfg.load()
-    notifier = TelegramNotifier()
-    
-    # Start Streamer App in Background
-    streamer.start_server(config.STREAM_PORT)
+    startup = Startup(STARTED)
+    settings = camera_settings()
+    multi = len(settings) > 1
+    if config.DETECTOR_PROCESS and multi:
+        logging.warning("DETECTOR_PROCESS supports a single camera. Running the shared detector in-process.")
+
+    # The slow steps overlap: the model loads and warms up while the cameras
+    # open and the server starts
+    detector_loading = startup.run("model", load_detector, len(settings))
+    ready = threading.Event() # Set by every grabber on each new frame
+    grabbers = [FrameGrabber(s['source'], ready=ready) for s in settings]
+    # A camera that fails to open doesn't hold back readiness while another one runs
+    opening = [startup.run(f"camera {s['name'] or s['source']}", g.start, group="cameras")
+               for s, g in zip(settings, grabbers)]
+
+    # aiohttp is the slowest import left; it loads while the cameras open
+    import streamer
+
+    snapshots = SnapshotStore()
+    # With an aggregator, it alone sends alerts and answers commands
+    notifier = TelegramNotifier(snapshots, token="" if config.AGGREGATOR_ADDRESS else None)
+
+    history = EventLog() if config.HISTORY_ENABLED else None
+
+    # Event clips (pre-roll + post-roll around every entry/exit)
+    recorder = None
+    captions = {ENTER: "🎬 Entry clip", EXIT: "🎬 Exit clip"}
+    if config.CLIP_ENABLED:
+        def send_clip(path, kind):
+            recorder.retain(path) # Not pruned until the upload is done with it
+            notifier.send_video(path, captions.get(kind, "🎬 Clip"), on_done=lambda: recorder.release(path))
+
+        recorder = ClipRecorder(on_clip=send_clip)
+
+    bus = None # Set below when reporting to an aggregator
+
+    def camera_events(index, room):
+        def on_event(event):
+            if bus is not None:
+                bus.publish(room, event)
+            if history is not None:
+                history.record(event, room)
+            if index != primary.index:
+                return
+            if recorder is not None and event.kind in captions:
+                recorder.trigger(event.kind, event.time)
+        return on_event
+
+    shedder = LoadShedder()
+
+    # Start Streamer App in Background (/healthz answers while the model loads)
+    streamer.start_server(config.STREAM_PORT, snapshots, history, startup, shedder)
+
+    detector = detector_loading.result()
+
+    # One room per camera. History, clips, the stream and the debug window
+    # follow the first camera that opened.
+    cameras = [Camera(i, s, g, detector, notifier, camera_events(i, s['room']))
+               for i, (s, g) in enumerate(zip(settings, grabbers))]
+
+    # A camera that fails to open is dropped; the other rooms keep running
+    cameras = [cam for cam, opened in zip(cameras, opening) if opened.result()]
+    if not cameras:
+        detector.close()
+        return
+
+    def room_counts():
+        counts = {}
+        for cam in cameras:
+            counts[cam.room] = counts.get(cam.room, 0) + cam.pipeline.room_count
+        return counts
+
+    if config.AGGREGATOR_ADDRESS:
+        bus = BusPublisher(counts=room_counts)
+    primary = cameras[0]
+    pipeline = primary.pipeline
+    door_cfg = primary.zones
     
     # Start Telegram Listener
     # Use a closure to capture local state (wled, door_cfg, etc.)
@@ -142,7 +226,7 @@ def main():
     # We will use a mutable wrapper for state stats if needed, 
     # but strictly speaking Python function closures look up variables at call time.
     
-    def telegram_command_handler(action):
+    def telegram_command_handler(action, arg=""):
         # Handle Tunnel
         if action in ['start_stream', 'stop_stream']:
             control_tunnel(action, notifier)
@@ -150,38 +234,74 @@ def main():
 
         # Handle Status
         if action == 'status':
-            wled_status = "ON 💡" if wled_is_active else "OFF ⚫"
+            wled_status = "ON 💡" if pipeline.wled_is_active else "OFF ⚫"
             stream_status = "ON 🟢" if tunnel_process else "OFF 🔴"
             mute_status = "YES 🔕" if notifier.muted else "NO 🔔"
+            det_stats = detector.stats()
             stats = (
                 f"📊 *System Status*\n"
-                f"👥 Room Count: {room_count}\n"
+                f"👥 Room Count: {pipeline.room_count}\n"
                 f"💡 Lights: {wled_status}\n"
                 f"📹 Stream: {stream_status}\n"
                 f"🔇 Muted: {mute_status}"
             )
-            notifier.send_message(stats)
+            if multi:
+                for cam in cameras:
+                    lights = "ON 💡" if cam.pipeline.wled_is_active else "OFF ⚫"
+                    stats += f"\n🏠 {cam.name}: {cam.pipeline.room_count} 👥, lights {lights}"
+
+            stats += (
+                f"\n🧠 Detector: {det_stats.get('detected_frames', 0)} run / "
+                f"{det_stats.get('propagated_frames', 0)} predicted / {det_stats.get('gated_frames', 0)} skipped"
+            )
+            stats += f"\n⚙️ Load: level {shedder.level} ({shedder.level_name})"
+            if shedder.frame_time is not None:
+                stats += f", {shedder.frame_time * 1000:.0f} ms/frame"
+            if not startup.ready:
+                stats += "\n⏳ Still starting up"
+            failed = startup.to_json()['failed']
+            if failed:
+                stats += f"\n⚠️ Failed to start: {', '.join(failed)}"
+
+
+            notifier.send_message(stats, PRIORITY_COMMAND)
 
         # Handle Snapshot
         if action == 'snapshot':
             # Get latest frame from streamer (thread safe)
             frame = streamer.get_frame()
             if frame is not None:
-                notifier.send_photo(frame, "📸 Snapshot requested")
+                notifier.send_photo(frame, "📸 Snapshot requested", PRIORITY_COMMAND)
             else:
-                notifier.send_message("⚠️ Camera not ready.")
-
-    notifier.start_listening(telegram_command_handler)
+                notifier.send_message("⚠️ Camera not ready.", PRIORITY_COMMAND)
 
-    cap = cv2.VideoCapture(config.CAMERA_INDEX)
-    if not cap.isOpened():
-        logging.error("Could not open video device.")
-        return
+        # Handle History
+        if action == 'history':
+            if history is None:
+                notifier.send_message("⚠️ History is disabled.", PRIORITY_COMMAND)
+                return
+            window = history_window(arg, time.time())
+            if window is None:
+                notifier.send_message("Usage: /history [hours | 9-11]", PRIORITY_COMMAND)
+                return
+            start, end, label = window
+            totals = history.totals(start, end)
+            notifier.send_message(
+                f"📈 *History* ({label})\n"
+                f"🚪 Entries: {totals['entries']}\n"
+                f"🏃 Exits: {totals['exits']}\n"
+                f"👥 Peak Count: {totals['peak_count']}",
+                PRIORITY_COMMAND)
+
+    if bus is None:
+        notifier.start_listening(telegram_command_handler)
 
     # Headless Mode vs Debug Mode
     WINDOW_NAME = "Smart Human Detector"
     callback_param = {'config': door_cfg, 'size': (0, 0)}
 
+    annotator = FrameAnnotator() # Only used by the debug window
+
     if config.DEBUG_DRAW:
         cv2.namedWindow(WINDOW_NAME)
         cv2.setMouseCallback(WINDOW_NAME, mouse_callback, callback_param)
@@ -189,179 +309,116 @@ def main():
     else:
         logging.info("Headless Mode: No local window.")
 
-    # State
-    tracked_history = {} 
-    
-    room_count = 0
-    wled_is_active = False
-    no_human_start_time = None
-    
-    delayed_alerts = [] # List of {'time': ts, 'tid': id}
-    pending_exits = {} # {tid: {'time': ts, 'info': track_info}}
+    # Metrics (read at scrape time, nothing extra on the hot path)
+    for cam in cameras:
+        labels = {'camera': cam.name} if cam.name else {}
+        REGISTRY.counter("capture_frames_total", "Frames read from the camera.", fn=lambda g=cam.grabber: g.captured, **labels)
+        REGISTRY.counter("capture_dropped_frames_total", "Frames replaced before the loop picked them up.",
+                         fn=lambda g=cam.grabber: g.dropped, **labels)
+        REGISTRY.counter("frame_buffers_allocated_total", "Frame buffers allocated (steady state: none).",
+                         fn=lambda p=cam.grabber.pool: p.allocated, **labels)
+        REGISTRY.counter("frame_buffers_reused_total", "Frames captured into a recycled buffer.",
+                         fn=lambda p=cam.grabber.pool: p.reused, **labels)
+        REGISTRY.gauge("frame_buffers_in_use", "Frame buffers still referenced by a consumer.",
+                       fn=lambda p=cam.grabber.pool: p.in_use, **labels)
+    frames_total = REGISTRY.counter("frames_processed_total", "Frames processed by the main loop.")
+    fps_gauge = REGISTRY.gauge("pipeline_fps", "Main loop frames per second (smoothed).")
+    latency_hist = REGISTRY.histogram("frame_latency_seconds", "Capture to end-of-processing latency.")
+    fps = 0.0
+    last_frame_end = None
 
     print("Starting Intelligent Human Detector... (Headless/Silent Mode)")
 
-    # Warmup
-    for _ in range(10): cap.read()
-
     try:
         while True:
-            ret, frame = cap.read()
-            if not ret: break
-            
-            height, width = frame.shape[:2]
-            callback_param['size'] = (width, height)
-            
-            current_time = time.time()
-
-            # 0. Process Delayed Alerts (Ensure light is definitely ON in frame)
-            pending_alerts = []
-            for alert in delayed_alerts:
-                if current_time >= alert['time']:
-                    # Trigger Alert
-                    time_str = datetime.datetime.now().strftime("%I:%M %p")
-                    notifier.send_photo(frame, f"🚪 Entry Detected at {time_str}\nID: {alert['tid']}")
-                else:
-                    pending_alerts.append(alert)
-            delayed_alerts = pending_alerts
-
-            # 1. Detection & Tracking
-            tracks, annotated_frame = detector.track(frame)
-            current_track_ids = set()
-
-            # 2. Process Tracks (Active Humans)
-            for trk in tracks:
-                tid = trk['id']
-                center = trk['center']
-                current_track_ids.add(tid)
-                
-                if tid not in tracked_history:
-                    # New ID detected
-                    arrival_time = time.time()
-                    
-                    if is_in_rect(center, door_cfg.rect, width, height):
-                        # In Door Zone - Check for Pending Exit (Flicker Merge)
-                        if pending_exits:
-                            # Reacquired! Pop one and treat as same person
-                            old_tid, _ = pending_exits.popitem()
-                            logging.info(f"Merged New ID {tid} with Pending Exit {old_tid}. Count remains {room_count}.")
-                            # Inherit history? Or just start fresh tracker?
-                            # Fresh tracker is safer for positions, but we skip Count increment.
-                        else:
-                            # Genuine New Entry
-                            room_count += 1
-                            # DELAYED TELEGRAM ALERT
-                            delayed_alerts.append({'time': time.time() + 1.0, 'tid': tid})
-                            logging.info(f"ID {tid} ENTERED. Count: {room_count}")
-                        
-                        tracked_history[tid] = {'center': center, 'first_seen': arrival_time, 'last_seen': arrival_time}
-
-                    else:
-                        # Reappearance (Inside Room)
-                        logging.info(f"ID {tid} Appeared (Reappearance).")
-                        arrival_time = time.time()
-                        tracked_history[tid] = {'center': center, 'first_seen': arrival_time, 'last_seen': arrival_time}
-                else:
-                    # Existing ID
-                    tracked_history[tid]['center'] = center
-                    tracked_history[tid]['last_seen'] = time.time()
-
-
-            # 3. Process Missing Tracks
-            lost_ids = [tid for tid in tracked_history if tid not in current_track_ids]
-            
-            for tid in lost_ids:
-                info = tracked_history[tid]
-                last_center = info['center']
-                
-                del tracked_history[tid] # Remove from active tracking
-
-                if is_in_rect(last_center, door_cfg.rect, width, height):
-                    # Lost in Door Zone -> Buffer as Pending Exit
-                    logging.info(f"ID {tid} pending exit (Buffer 1.5s)...")
-                    pending_exits[tid] = {'time': time.time(), 'info': info}
-                else:
-                    # Lost elsewhere -> Occluded
-                    pass
-
-            # 4. Process Pending Exits (Timeout)
-            expired_exits = []
-            for tid, exit_data in pending_exits.items():
-                if current_time - exit_data['time'] > 1.5:
-                    expired_exits.append(tid)
-            
-            for tid in expired_exits:
-                info = pending_exits.pop(tid)['info']
-                room_count -= 1
-                logging.info(f"ID {tid} EXIT CONFIRMED. Count: {room_count}")
-                
-                # TELEGRAM ALERT
-                duration_sec = info['last_seen'] - info['first_seen']
-                mins, secs = divmod(int(duration_sec), 60)
-                duration_str = f"{mins}m {secs}s"
-                notifier.send_message(f"🏃 Exit Detected.\nDuration: {duration_str}")
-
-            # 5. Safety
-            if room_count < 0: room_count = 0
-
-            # 5. WLED Logic
-            status_text = f"Count: {room_count} | "
-            
-            if room_count > 0:
-                no_human_start_time = None
-                if not wled_is_active:
-                    wled.turn_on()
-                    wled_is_active = True
-                status_text += "ON"
-            else:
-                if wled_is_active:
-                    if no_human_start_time is None: no_human_start_time = time.time()
-                    elapsed = time.time() - no_human_start_time
-                    remaining = config.TIMEOUT_SECONDS - elapsed
-                    if elapsed >= config.TIMEOUT_SECONDS:
-                        wled.turn_off()
-                        wled_is_active = False
-                        status_text += "OFF"
-                    else:
-                        status_text += f"Wait {remaining:.1f}s"
-                else:
-                    status_text += "OFF"
-
-            # 6. Visualization
-            # Draw Door
-            x1, y1, x2, y2 = get_absolute_rect(door_cfg.rect, width, height)
-            cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (255, 0, 0), 2)
-            cv2.putText(annotated_frame, "DOOR", (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 1)
-
-            # Draw drag rect (Legacy support for logic, though mouse off)
-            if door_cfg.dragging and door_cfg.current_drag_rect:
-                dx1, dy1, dx2, dy2 = get_absolute_rect(door_cfg.current_drag_rect, width, height)
-                cv2.rectangle(annotated_frame, (dx1, dy1), (dx2, dy2), (0, 255, 255), 2)
-
-            # Viz Pending Exits
-            for tid in pending_exits:
-                cv2.putText(annotated_frame, f"Wait Exit {tid}...", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 128, 255), 2)
-
-            cv2.putText(annotated_frame, status_text, (10, 30), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-
-            # STREAM UPDATE: Send the ANNOTATED frame to the stream
-            # so remote user sees the boxes/door/status.
-            streamer.update_frame(annotated_frame)
-
-            # Local Window (Debug Mode)
-            if config.DEBUG_DRAW:
-                cv2.imshow(WINDOW_NAME, annotated_frame)
-                if cv2.waitKey(1) & 0xFF == ord('q'):
-                    break
-            else:
-                # Tiny sleep to prevent CPU hogging in headless mode since waitKey is gone
-                time.sleep(0.01)
+            # Wait for any camera, then take the newest frame of every camera
+            # that has one; older frames are dropped by the grabbers
+            with stage_timer('capture_wait'):
+                ready.wait(timeout=1.0)
+                ready.clear()
+            batch = []
+            for cam in cameras:
+                frame, current_time, _ = cam.grabber.read(timeout=0)
+                if frame is not None:
+                    batch.append((cam, frame, current_time))
+            if not batch:
+                if not any(cam.grabber.running for cam in cameras): break
+                continue
+            process_start = time.perf_counter()
+
+            # One batched detector call for every camera with a new frame
+            results = [None] # Single camera: the pipeline calls the detector itself
+            if multi:
+                with stage_timer('detector'):
+                    results = detector.track_batch([(cam.index, frame, cam.zones.door_rects(), current_time)
+                                                    for cam, frame, current_time in batch])
+
+            quit_requested = False
+            for (cam, frame, current_time), tracks in zip(batch, results):
+                overlay = cam.pipeline.process(frame, current_time, tracks)
+                if cam is not primary:
+                    continue
+
+                height, width = frame.shape[:2]
+                callback_param['size'] = (width, height)
+                if recorder is not None:
+                    recorder.add(frame, current_time)
+
+                # STREAM UPDATE: raw frame + overlay. The streamer annotates
+                # only while someone is watching (or for /snap).
+                streamer.update_frame(frame, overlay)
+
+                # Local Window (Debug Mode)
+                if config.DEBUG_DRAW:
+                    with stage_timer('debug_window'):
+                        shown = frame if shedder.level >= LEVEL_NO_ANNOTATION else annotator.render(frame, overlay)
+                        cv2.imshow(WINDOW_NAME, shown)
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        quit_requested = True
+            if history is not None:
+                for room, count in room_counts().items():
+                    history.sample(count, current_time, room)
+            if startup.first_detection is None and detector.stats().get('detected_frames'):
+                startup.detected()
+
+            # Consumers that keep a frame (stream, clips, alerts) hold their own reference
+            for _, frame, _ in batch:
+                frames.release(frame)
+            if quit_requested:
+                break
+
+            # 7. Load shedding: degrade features in priority order when over budget
+            current_time = max(ts for _, _, ts in batch)
+            if shedder.update(time.perf_counter() - process_start, current_time):
+                streamer.broadcaster.set_load_level(shedder.level)
+                detector.load_level = shedder.level
+
+            # 8. Loop metrics
+            frame_end = time.time()
+            for _, _, ts in batch:
+                latency_hist.observe(frame_end - ts)
+            frames_total.inc(len(batch))
+            if last_frame_end is not None and frame_end > last_frame_end:
+                fps = 0.9 * fps + 0.1 / (frame_end - last_frame_end)
+                fps_gauge.set(fps)
+            last_frame_end = frame_end
 
     except KeyboardInterrupt:
         logging.info("Interrupted.")
     finally:
-        cap.release()
+        for cam in cameras:
+            cam.grabber.stop()
+            logging.info(f"Capture stats{f' ({cam.name})' if cam.name else ''}: {cam.grabber.captured} frames, {cam.grabber.dropped} dropped.")
+        logging.info(f"Detector stats: {detector.stats()}")
+        detector.close()
+        if bus is not None:
+            bus.close()
+        for cam in cameras:
+            cam.wled.close()
+        if recorder is not None:
+            recorder.close()
+        if history is not None:
+            history.close()
         cv2.destroyAllWindows()
 
 if __name__ == "__main__":
@@ -0,0 +1,238 @@
+import os
+import sys
+import time
+import bisect
+import threading
+import collections
+
+# Default latency buckets (seconds): 1 ms .. 2.5 s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+class Counter:
+    """Incremented directly, or read at scrape time from an existing counter via a callback."""
+    def __init__(self, name, labels, fn=None):
+        self.name = name
+        self.labels = labels
+        self.value = 0
+        self.fn = fn
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self):
+        yield self.name, self.labels, self.fn() if self.fn is not None else self.value
+
+class Gauge:
+    """Either set directly or computed at scrape time from a callback."""
+    def __init__(self, name, labels, fn=None):
+        self.name = name
+        self.labels = labels
+        self.value = 0
+        self.fn = fn
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self):
+        yield self.name, self.labels, self.fn() if self.fn is not None else self.value
+
+class Histogram:
+    """Fixed-bucket histogram. observe() is a bisect plus two additions."""
+    def __init__(self, name, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.raw = None # List of every observation, when enabled (offline runs only)
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+            if self.raw is not None:
+                self.raw.append(value)
+
+    def time(self):
+        return _Timer(self)
+
+    def samples(self):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float('inf'),), counts):
+            cumulative += n
+            le = "+Inf" if bound == float('inf') else repr(bound)
+            yield f"{self.name}_bucket", self.labels + (("le", le),), cumulative
+        yield f"{self.name}_sum", self.labels, total
+        yield f"{self.name}_count", self.labels, count
+
+class _Timer:
+    """Context manager that records its elapsed time into a histogram."""
+    __slots__ = ('hist', 'start')
+
+    def __init__(self, hist):
+        self.hist = hist
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.start)
+        return False
+
+class Registry:
+    """Holds all metrics and renders them in Prometheus text format."""
+    def __init__(self):
+        self._metrics = {}
+        self._help = {}
+        self._types = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, kind, name, help_text, labels, **kwargs):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric = cls(name, key[1], **kwargs)
+                    self._metrics[key] = metric
+                    self._help.setdefault(name, help_text)
+                    self._types.setdefault(name, kind)
+        return metric
+
+    def counter(self, name, help_text="", fn=None, **labels):
+        counter = self._get(Counter, "counter", name, help_text, labels)
+        if fn is not None:
+            counter.fn = fn
+        return counter
+
+    def gauge(self, name, help_text="", fn=None, **labels):
+        gauge = self._get(Gauge, "gauge", name, help_text, labels)
+        if fn is not None:
+            gauge.fn = fn
+        return gauge
+
+    def histogram(self, name, help_text="", buckets=LATENCY_BUCKETS, **labels):
+        return self._get(Histogram, "histogram", name, help_text, labels, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        last_name = None
+        for metric in metrics:
+            if metric.name != last_name:
+                lines.append(f"# HELP {metric.name} {self._help[metric.name]}")
+                lines.append(f"# TYPE {metric.name} {self._types[metric.name]}")
+                last_name = metric.name
+            for name, labels, value in metric.samples():
+                if isinstance(value, (bool, int)):
+                    text = str(int(value))
+                else:
+                    try:
+                        text = repr(float(value))
+                    except (TypeError, ValueError):
+                        continue
+                lines.append(f"{name}{_format_labels(labels)} {text}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+_stages = {}
+_record_raw = False
+
+def _stage(stage):
+    hist = _stages.get(stage)
+    if hist is None:
+        hist = _stages[stage] = REGISTRY.histogram(
+            "frame_stage_seconds", "Time spent in each pipeline stage.", stage=stage)
+        if _record_raw:
+            hist.raw = []
+    return hist
+
+def record_raw_samples():
+    """Keeps every stage observation so exact percentiles can be computed (replay/benchmarks)."""
+    global _record_raw
+    _record_raw = True
+    for hist in _stages.values():
+        if hist.raw is None:
+            hist.raw = []
+
+def stage_samples():
+    """Raw stage observations recorded since record_raw_samples(): {stage: [seconds, ...]}."""
+    return {stage: list(hist.raw) for stage, hist in _stages.items() if hist.raw}
+
+def stage_timer(stage):
+    """Timer for one stage of the frame pipeline (frame_stage_seconds{stage=...})."""
+    return _stage(stage).time()
+
+def observe_stage(stage, seconds):
+    """Records a stage duration measured elsewhere."""
+    _stage(stage).observe(seconds)
+
+class SamplingProfiler:
+    """
+    Statistical profiler that can be switched on at runtime.
+    A background thread snapshots every thread's stack at a fixed interval
+    and counts identical stacks. Output is in "folded" format, ready for
+    flamegraph.pl / speedscope.
+    """
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.counts = collections.Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return False
+            self.counts.clear()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sample_thread, name="profiler", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.folded()
+
+    def _sample_thread(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for t in threading.enumerate():
+                names[t.ident] = t.name
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.counts[";".join(reversed(stack))] += 1
+
+    def folded(self):
+        return "\n".join(f"{stack} {n}" for stack, n in self.counts.most_common()) + "\n"
+
+profiler = SamplingProfiler()
@@ -0,0 +1,88 @@
+import cv2
+import time
+import numpy as np
+import config
+
+class MotionGate:
+    """
+    Cheap motion pre-filter used to decide whether a frame is worth a YOLO pass.
+    Works on a small blurred grayscale copy of the frame and compares it with a
+    running background average. Changed pixels inside the door zones count extra.
+    """
+    def __init__(self):
+        self.width = config.MOTION_DOWNSCALE_WIDTH
+        self.threshold = config.MOTION_PIXEL_THRESHOLD
+        self.min_ratio = config.MOTION_MIN_RATIO
+        self.door_weight = config.MOTION_DOOR_WEIGHT
+        self.heartbeat = config.MOTION_HEARTBEAT_SECONDS
+
+        self.background = None
+        self.weights = None
+        self._weights_key = None
+        self.last_inference = 0.0
+
+        # Counters
+        self.gated_frames = 0
+        self.passed_frames = 0
+        self.last_score = 0.0
+
+    def _weight_map(self, shape, door_rects):
+        """Per-pixel weights for the downscaled frame, cached until the door zones change."""
+        key = (shape, tuple(tuple(r) for r in door_rects or ()))
+        if key != self._weights_key:
+            h, w = shape
+            weights = np.ones((h, w), dtype=np.float32)
+            for x1, y1, x2, y2 in door_rects or ():
+                weights[int(y1 * h):int(np.ceil(y2 * h)), int(x1 * w):int(np.ceil(x2 * w))] = self.door_weight
+            self.weights = weights
+            self._weights_key = key
+        return self.weights
+
+    def score(self, frame, door_rects=None):
+        """Returns the weighted fraction of changed pixels and updates the background."""
+        h, w = frame.shape[:2]
+        small_h = max(1, int(h * self.width / w))
+        small = cv2.resize(frame, (self.width, small_h), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(gray, (5, 5), 0)
+
+        if self.background is None or self.background.shape != gray.shape:
+            self.background = gray.astype(np.float32)
+            return 1.0
+
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+        changed = (diff > self.threshold).astype(np.float32)
+        weights = self._weight_map(gray.shape, door_rects)
+        # Slowly adapt to lighting changes
+        cv2.accumulateWeighted(gray, self.background, config.MOTION_BACKGROUND_ALPHA)
+
+        return float((changed * weights).sum() / weights.sum())
+
+    def should_infer(self, frame, door_rects=None, tracking=False, now=None):
+        """
+        Decides whether the detector needs to run on this frame.
+        Inference runs on motion, while people are being tracked,
+        or at least once every heartbeat interval.
+        """
+        now = time.time() if now is None else now
+        self.last_score = self.score(frame, door_rects)
+
+        run = (
+            tracking
+            or self.last_score >= self.min_ratio
+            or (now - self.last_inference) >= self.heartbeat
+        )
+
+        if run:
+            self.last_inference = now
+            self.passed_frames += 1
+        else:
+            self.gated_frames += 1
+        return run
+
+    def stats(self):
+        return {
+            'gated_frames': self.gated_frames,
+            'passed_frames': self.passed_frames,
+            'motion_score': self.last_score,
+        }
@@ -1,71 +1,294 @@
 import requests
 import threading
+import queue
+import random
+import json
 import time
 import cv2
 import os
-import datetime
 import logging
+import itertools
+from requests.adapters import HTTPAdapter
 import config
+import frames
+from metrics import REGISTRY, observe_stage
+from snapshots import SnapshotStore
+
+# Lower value = sent first
+PRIORITY_COMMAND = 0 # Replies to the owner's commands
+PRIORITY_ALERT = 1 # Entry/exit alerts (coalesced into bursts)
+
+class _Job:
+    __slots__ = ('kind', 'text', 'photos', 'video', 'source', 'attempt', 'on_done')
+
+    def __init__(self, kind, text="", photos=None, video=None, source="alert", on_done=None):
+        self.kind = kind # 'message', 'photo', 'album' or 'video'
+        self.text = text
+        self.photos = photos or [] # JPEG bytes
+        self.video = video # MP4 file path
+        self.source = source # Snapshot kind the photos are archived under
+        self.attempt = 0
+        self.on_done = on_done # Called once the job is finished with, whatever the outcome
 
 class TelegramNotifier:
-    def __init__(self):
-        self.token = config.TELEGRAM_TOKEN
+    """
+    Queue-based Telegram sender.
+    Alerts go into a bounded priority queue drained by a small worker pool that
+    shares one keep-alive HTTP session. Photos are JPEG-encoded in memory.
+    Alerts arriving within TELEGRAM_COALESCE_SECONDS of each other are merged
+    (several photos become one album, several texts one message). When the
+    queue is full new alerts are dropped instead of piling up.
+    Every photo sent is also archived in a SnapshotStore.
+    """
+    def __init__(self, snapshots=None, token=None):
+        self.token = config.TELEGRAM_TOKEN if token is None else token # "" disables sending
         self.chat_id = config.TELEGRAM_CHAT_ID
-        self.base_url = f"https://api.telegram.org/bot{self.token}"
-        self.snapshot_dir = "snapshots"
+        self.base_url = f"{config.TELEGRAM_API_URL}/bot{self.token}"
+        self.snapshots = snapshots if snapshots is not None else SnapshotStore()
         self.muted = False # State for notification toggle
-        
-        if not os.path.exists(self.snapshot_dir):
-            os.makedirs(self.snapshot_dir)
 
-    def _send_photo_thread(self, frame, caption):
-        """Internal method to send photo in a separate thread."""
-        if self.muted: return
-        try:
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = os.path.join(self.snapshot_dir, f"alert_{timestamp}.jpg")
-            cv2.imwrite(filename, frame)
-            
-            with open(filename, 'rb') as photo:
-                url = f"{self.base_url}/sendPhoto"
-                payload = {'chat_id': self.chat_id, 'caption': caption}
-                files = {'photo': photo}
-                requests.post(url, data=payload, files=files, timeout=10)
-                
-            logging.info("Telegram photo sent.")
-        except Exception as e:
-            logging.error(f"Failed to send Telegram photo: {e}")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.TELEGRAM_WORKERS)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.queue = queue.PriorityQueue(maxsize=config.TELEGRAM_QUEUE_SIZE)
+        self._order = itertools.count() # FIFO within a priority
+
+        # Burst coalescing: alerts wait here until the window closes
+        self._burst_cond = threading.Condition()
+        self._bursts = {'message': [], 'photo': []}
+        self._burst_deadline = None
+
+        # Stats
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+        REGISTRY.gauge("telegram_backlog", "Telegram jobs waiting to be sent.", fn=self.backlog)
+        REGISTRY.counter("telegram_sent_total", "Telegram requests delivered.", fn=lambda: self.sent)
+        REGISTRY.counter("telegram_failed_total", "Telegram jobs given up on.", fn=lambda: self.failed)
+        REGISTRY.counter("telegram_dropped_total", "Telegram jobs shed because the queue was full.", fn=lambda: self.dropped)
+
+        self._workers = []
+        if self._enabled():
+            for i in range(config.TELEGRAM_WORKERS):
+                t = threading.Thread(target=self._worker_thread, name=f"telegram-{i}", daemon=True)
+                t.start()
+                self._workers.append(t)
+            threading.Thread(target=self._coalesce_thread, name="telegram-coalesce", daemon=True).start()
+
+    def _enabled(self):
+        return bool(self.token) and self.token != "YOUR_BOT_TOKEN_HERE"
 
-    def send_photo(self, frame, caption="Alert"):
-        """Sends a photo asynchronously."""
-        if self.token == "YOUR_BOT_TOKEN_HERE" or self.muted:
+    # --- Public API ---
+
+    def send_photo(self, frame, caption="Alert", priority=PRIORITY_ALERT):
+        """Queues a photo. The frame is encoded by a worker, so it must not be modified afterwards."""
+        if not self._enabled() or self.muted:
             return
+        frames.retain(frame) # Released once encoded, or when the job is dropped or skipped
+        self._submit('photo', (frame, caption), priority)
 
-        t = threading.Thread(target=self._send_photo_thread, args=(frame, caption))
-        t.start()
+    def send_message(self, text, priority=PRIORITY_ALERT):
+        """Queues a text message."""
+        if not self._enabled() or self.muted:
+            return
+        self._submit('message', text, priority)
 
-    def _send_message_thread(self, text):
-        """Internal method to send text in a separate thread."""
-        if self.muted: return
-        try:
-            url = f"{self.base_url}/sendMessage"
-            payload = {'chat_id': self.chat_id, 'text': text}
-            requests.post(url, json=payload, timeout=10)
-            logging.info(f"Telegram message sent: {text}")
-        except Exception as e:
-            logging.error(f"Failed to send Telegram message: {e}")
-
-    def send_message(self, text):
-        """Sends a text message asynchronously."""
-        if self.token == "YOUR_BOT_TOKEN_HERE" or self.muted:
+    def send_video(self, path, caption="", priority=PRIORITY_ALERT, on_done=None):
+        """
+        Queues an MP4 file (event clips). Videos are never coalesced.
+        on_done() is called once the file is no longer needed: sent, failed,
+        dropped or skipped.
+        """
+        if not self._enabled() or self.muted:
+            if on_done is not None:
+                on_done()
             return
+        self._put(_Job('video', caption, video=path, on_done=on_done), priority)
+
+    def backlog(self):
+        """Jobs waiting to be sent (queued + held for coalescing)."""
+        with self._burst_cond:
+            held = len(self._bursts['message']) + len(self._bursts['photo'])
+        return self.queue.qsize() + held
+
+    def stats(self):
+        return {
+            'sent': self.sent,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+            'backlog': self.backlog(),
+        }
+
+    # --- Queueing ---
+
+    def _submit(self, kind, item, priority):
+        if priority > PRIORITY_COMMAND and config.TELEGRAM_COALESCE_SECONDS > 0:
+            with self._burst_cond:
+                self._bursts[kind].append(item)
+                if self._burst_deadline is None:
+                    self._burst_deadline = time.time() + config.TELEGRAM_COALESCE_SECONDS
+                    self._burst_cond.notify()
+            return
+
+        if kind == 'photo':
+            frame, caption = item
+            job = _Job('photo', caption, [frame], source="alert" if priority > PRIORITY_COMMAND else "snapshot")
+        else:
+            job = _Job('message', item)
+        self._put(job, priority)
+
+    def _put(self, job, priority):
+        try:
+            self.queue.put_nowait((priority, next(self._order), job))
+        except queue.Full:
+            self.dropped += 1
+            self._finish(job)
+            logging.warning(f"Telegram queue full. Dropped {job.kind}.")
+
+    def _finish(self, job):
+        """
+        Gives back the frames of a job that won't be encoded (dropped, skipped
+        or failed) and tells its owner it is done.
+        """
+        for p in job.photos:
+            if not isinstance(p, bytes):
+                frames.release(p)
+        job.photos = [p for p in job.photos if isinstance(p, bytes)]
+        if job.on_done is not None:
+            try:
+                job.on_done()
+            except Exception as e:
+                logging.error(f"Telegram {job.kind} callback failed: {e}")
+
+    def _coalesce_thread(self):
+        """Flushes each burst of alerts as a single message / album once its window closes."""
+        while True:
+            with self._burst_cond:
+                while self._burst_deadline is None:
+                    self._burst_cond.wait()
+                delay = self._burst_deadline - time.time()
+                if delay > 0:
+                    self._burst_cond.wait(delay)
+                    continue
+                messages, photos = self._bursts['message'], self._bursts['photo']
+                self._bursts = {'message': [], 'photo': []}
+                self._burst_deadline = None
+
+            if messages:
+                self.coalesced += len(messages) - 1
+                self._put(_Job('message', "\n\n".join(messages)), PRIORITY_ALERT)
+            # An album holds at most 10 photos
+            for i in range(0, len(photos), 10):
+                chunk = photos[i:i + 10]
+                self.coalesced += len(chunk) - 1
+                kind = 'photo' if len(chunk) == 1 else 'album'
+                caption = "\n".join(caption for _, caption in chunk)
+                self._put(_Job(kind, caption, [frame for frame, _ in chunk]), PRIORITY_ALERT)
+
+    # --- Delivery ---
+
+    def _worker_thread(self):
+        while True:
+            priority, _, job = self.queue.get()
+            try:
+                self._deliver(job, priority)
+            finally:
+                self._finish(job) # Skipped or failed jobs may still hold frames
+                self.queue.task_done()
+
+    def _encode(self, frame, source):
+        flag, encodedImage = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, config.TELEGRAM_JPEG_QUALITY])
+        if not flag:
+            raise ValueError("JPEG encoding failed")
+        jpeg = encodedImage.tobytes()
+        self.snapshots.save(jpeg, source) # Local copy, written in the background
+        return jpeg
+
+    def _post(self, job):
+        """Sends one job. Returns the HTTP response."""
+        if job.kind == 'message':
+            return self.session.post(f"{self.base_url}/sendMessage",
+                                     json={'chat_id': self.chat_id, 'text': job.text}, timeout=10)
+
+        if job.kind == 'video':
+            with open(job.video, 'rb') as f:
+                return self.session.post(f"{self.base_url}/sendVideo",
+                                         data={'chat_id': self.chat_id, 'caption': job.text[:1024], 'supports_streaming': 'true'},
+                                         files={'video': (os.path.basename(job.video), f, 'video/mp4')}, timeout=60)
+
+        # Encode lazily (and only once across retries)
+        for i, p in enumerate(job.photos):
+            if not isinstance(p, bytes):
+                job.photos[i] = self._encode(p, job.source)
+                frames.release(p)
+
+        if job.kind == 'photo':
+            return self.session.post(f"{self.base_url}/sendPhoto",
+                                     data={'chat_id': self.chat_id, 'caption': job.text[:1024]},
+                                     files={'photo': ('alert.jpg', job.photos[0], 'image/jpeg')}, timeout=30)
+
+        media = []
+        files = {}
+        for i, jpeg in enumerate(job.photos):
+            name = f"photo{i}"
+            item = {'type': 'photo', 'media': f"attach://{name}"}
+            if i == 0:
+                item['caption'] = job.text[:1024]
+            media.append(item)
+            files[name] = (f"{name}.jpg", jpeg, 'image/jpeg')
+        return self.session.post(f"{self.base_url}/sendMediaGroup",
+                                 data={'chat_id': self.chat_id, 'media': json.dumps(media)},
+                                 files=files, timeout=60)
+
+    def _deliver(self, job, priority):
+        """Sends a job, retrying transient failures with exponential backoff."""
+        while True:
+            if self.muted and priority > PRIORITY_COMMAND:
+                return
+            retry_after = None
+            try:
+                started = time.perf_counter()
+                response = self._post(job)
+                observe_stage('telegram', time.perf_counter() - started)
+                if response.status_code == 200:
+                    self.sent += 1
+                    logging.info(f"Telegram {job.kind} sent.")
+                    return
+                if response.status_code == 429:
+                    try:
+                        retry_after = response.json().get('parameters', {}).get('retry_after')
+                    except ValueError:
+                        pass
+                elif response.status_code < 500:
+                    # Client error: retrying won't help
+                    self.failed += 1
+                    logging.error(f"Telegram rejected {job.kind}: {response.status_code} {response.text[:200]}")
+                    return
+                error = f"HTTP {response.status_code}"
+            except requests.RequestException as e:
+                error = str(e)
+            except Exception as e:
+                self.failed += 1
+                logging.error(f"Failed to send Telegram {job.kind}: {e}")
+                return
+
+            job.attempt += 1
+            if job.attempt > config.TELEGRAM_MAX_RETRIES:
+                self.failed += 1
+                logging.error(f"Failed to send Telegram {job.kind} after {job.attempt} attempts: {error}")
+                return
+            delay = retry_after or config.TELEGRAM_RETRY_BASE * (2 ** (job.attempt - 1)) * (0.5 + random.random())
+            logging.warning(f"Telegram {job.kind} failed ({error}). Retry {job.attempt} in {delay:.1f}s")
+            time.sleep(delay)
 
-        t = threading.Thread(target=self._send_message_thread, args=(text,))
-        t.start()
-        
     def start_listening(self, callback):
         """Starts a background thread to listen for Telegram commands."""
-        if self.token == "YOUR_BOT_TOKEN_HERE":
+        if not self._enabled():
             logging.warning("Telegram token missing. Listener disabled.")
             return
 
@@ -79,12 +302,14 @@ class TelegramNotifier:
         """Polls for updates and triggers callback on valid commands."""
         offset = 0
         get_updates_url = f"{self.base_url}/getUpdates"
+        # Separate session: the long poll would otherwise hold a sender connection
+        listener_session = requests.Session()
         
         while True:
             try:
                 # Long polling
                 params = {'offset': offset + 1, 'timeout': 30}
-                response = requests.get(get_updates_url, params=params, timeout=35)
+                response = listener_session.get(get_updates_url, params=params, timeout=35)
                 data = response.json()
                 
                 if data.get('ok'):
@@ -117,11 +342,14 @@ class TelegramNotifier:
                                 self.callback('status')
                             elif text == '/snap':
                                 self.callback('snapshot')
+                            elif text.split()[0] == '/history':
+                                self.callback('history', text[len('/history'):].strip())
                             elif text == '/help':
                                 help_text = (
                                     "🤖 *Bot Commands*:\n"
                                     "/status - Check System Status\n"
                                     "/snap - Take a photo 📸\n"
+                                    "/history [hours | 9-11] - Entries and exits 📈\n"
                                     "/stream - Start Live Video\n"
                                     "/stop - Stop Live Video\n"
                                     "/slint - Mute Alerts 🔕\n"
@@ -137,8 +365,5 @@ class TelegramNotifier:
                 time.sleep(5)
 
     def _send_reply(self, text):
-        try:
-            url = f"{self.base_url}/sendMessage"
-            payload = {'chat_id': self.chat_id, 'text': text}
-            requests.post(url, json=payload, timeout=10)
-        except: pass
+        """Queues a command reply. Sent even in silent mode."""
+        self._put(_Job('message', text), PRIORITY_COMMAND)
@@ -0,0 +1,169 @@
+import heapq
+import itertools
+import logging
+import math
+from collections import namedtuple
+
+# Event kinds
+ENTER = 'enter' # New person came in through a door
+EXIT = 'exit' # Person left through a door (after the exit timeout)
+REAPPEAR = 'reappear' # Track (re)appeared inside the room, count unchanged
+REACQUIRE = 'reacquire' # New track in a door matched a pending exit, count unchanged
+ENTRY_ALERT = 'entry_alert' # Delayed follow-up to ENTER, once the lights are surely on
+
+Event = namedtuple('Event', ['kind', 'track_id', 'time', 'count', 'door', 'duration'])
+
+# One detector track as seen by the tracker this frame.
+# center is proportional (0.0 - 1.0); door is the door zone name or None.
+# excluded: inside an exclusion area; outside: not in any configured "inside" area.
+Observation = namedtuple('Observation', ['track_id', 'center', 'door', 'excluded', 'outside'])
+
+class TrackRecord:
+    __slots__ = ('track_id', 'center', 'door', 'first_seen', 'last_seen', 'lost_time', 'pending', 'deadline')
+
+    def __init__(self, track_id, center, door, now):
+        self.track_id = track_id
+        self.center = center
+        self.door = door
+        self.first_seen = now
+        self.last_seen = now
+        self.lost_time = None
+        self.pending = False # Waiting in the exit buffer
+        self.deadline = None # Exit timer that owns the pending state
+
+class OccupancyTracker:
+    """
+    Room occupancy state machine.
+    Feed it the tracks seen in each frame; it returns the typed events that
+    happened. Active tracks live in a dict, and exit timeouts and delayed
+    entry alerts sit in timer heaps, so a frame only pays for the tracks
+    that appeared, disappeared or timed out. Pure Python, no OpenCV.
+    """
+    def __init__(self, exit_timeout=1.5, alert_delay=1.0, reacquire_distance=0.25):
+        self.exit_timeout = exit_timeout
+        self.alert_delay = alert_delay
+        self.reacquire_distance = reacquire_distance
+
+        self.room_count = 0
+        self.active = {} # track_id -> TrackRecord
+        self.pending_exits = {} # track_id -> TrackRecord lost in a door zone
+
+        self._exit_timers = [] # (deadline, seq, record)
+        self._alert_timers = [] # (deadline, seq, track_id)
+        self._seq = itertools.count()
+
+    def _event(self, kind, record, now, duration=None):
+        return Event(kind, record.track_id, now, self.room_count, record.door, duration)
+
+    def _match_pending_exit(self, center, now):
+        """Nearest pending exit in position and time, or None if none is close enough."""
+        best = None
+        best_cost = None
+        for record in self.pending_exits.values():
+            distance = math.dist(center, record.center)
+            if distance > self.reacquire_distance:
+                continue
+            # Both terms are normalised to [0, 1]
+            cost = distance / self.reacquire_distance + (now - record.lost_time) / self.exit_timeout
+            if best_cost is None or cost < best_cost:
+                best, best_cost = record, cost
+        return best
+
+    def update(self, observations, now):
+        """
+        Processes one frame of tracks.
+        Returns:
+            list of Event, in the order they happened.
+        """
+        events = []
+        seen = set()
+
+        for obs in observations:
+            tid = obs.track_id
+            seen.add(tid)
+            record = self.active.get(tid)
+
+            if record is not None:
+                # Existing ID (an excluded position doesn't move the record)
+                if not obs.excluded:
+                    record.center = obs.center
+                    record.door = obs.door
+                    record.last_seen = now
+                continue
+
+            if obs.excluded:
+                continue
+
+            record = self.pending_exits.pop(tid, None)
+            if record is not None:
+                # The tracker recovered the same ID before the exit timed out
+                record.pending = False
+                record.center = obs.center
+                record.door = obs.door
+                record.last_seen = now
+                self.active[tid] = record
+                logging.info(f"ID {tid} back before exit timeout. Count remains {self.room_count}.")
+                events.append(self._event(REACQUIRE, record, now))
+
+            elif obs.door is not None:
+                # In Door Zone - Check for Pending Exit (Flicker Merge)
+                match = self._match_pending_exit(obs.center, now)
+                record = TrackRecord(tid, obs.center, obs.door, now)
+                if match is not None:
+                    # Reacquired: same person, keep their history and count
+                    del self.pending_exits[match.track_id]
+                    match.pending = False
+                    record.first_seen = match.first_seen
+                    logging.info(f"Merged New ID {tid} with Pending Exit {match.track_id}. Count remains {self.room_count}.")
+                    events.append(self._event(REACQUIRE, record, now))
+                else:
+                    # Genuine New Entry
+                    self.room_count += 1
+                    heapq.heappush(self._alert_timers, (now + self.alert_delay, next(self._seq), tid))
+                    logging.info(f"ID {tid} ENTERED via {obs.door}. Count: {self.room_count}")
+                    events.append(self._event(ENTER, record, now))
+                self.active[tid] = record
+
+            elif not obs.outside:
+                # Reappearance (Inside Room)
+                record = TrackRecord(tid, obs.center, None, now)
+                self.active[tid] = record
+                logging.info(f"ID {tid} Appeared (Reappearance).")
+                events.append(self._event(REAPPEAR, record, now))
+
+        # Process Missing Tracks
+        for tid in [tid for tid in self.active if tid not in seen]:
+            record = self.active.pop(tid)
+            if record.door is not None:
+                # Lost in Door Zone -> Buffer as Pending Exit
+                logging.info(f"ID {tid} pending exit (Buffer {self.exit_timeout}s)...")
+                record.lost_time = now
+                record.pending = True
+                record.deadline = now + self.exit_timeout
+                self.pending_exits[tid] = record
+                heapq.heappush(self._exit_timers, (record.deadline, next(self._seq), record))
+            # Lost elsewhere -> Occluded
+
+        events.extend(self._expire(now))
+        return events
+
+    def _expire(self, now):
+        """Pops due timers: confirmed exits and delayed entry alerts."""
+        events = []
+        while self._exit_timers and self._exit_timers[0][0] < now:
+            deadline, _, record = heapq.heappop(self._exit_timers)
+            if not record.pending or deadline != record.deadline:
+                continue # Reacquired meanwhile (or lost again, with a newer timer)
+            record.pending = False
+            del self.pending_exits[record.track_id]
+            self.room_count = max(0, self.room_count - 1)
+            logging.info(f"ID {record.track_id} EXIT CONFIRMED. Count: {self.room_count}")
+            events.append(self._event(EXIT, record, now, duration=record.last_seen - record.first_seen))
+
+        while self._alert_timers and self._alert_timers[0][0] <= now:
+            _, _, tid = heapq.heappop(self._alert_timers)
+            events.append(Event(ENTRY_ALERT, tid, now, self.room_count, None, None))
+        return events
+
+    def pending_ids(self):
+        return tuple(self.pending_exits)
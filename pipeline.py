@@ -0,0 +1,132 @@
+import time
+import datetime
+import config
+from annotator import Overlay
+from zones import DOOR, EXCLUDE, INSIDE
+from occupancy import OccupancyTracker, Observation, ENTRY_ALERT, EXIT
+from metrics import REGISTRY, stage_timer, observe_stage
+
+class OccupancyPipeline:
+    """
+    Per-frame room logic shared by main() and the offline replay tool:
+    detection, entry/exit tracking, WLED switching and alerts.
+    All timing comes from the `now` passed to process() (the frame's
+    capture timestamp), never from the wall clock, so recorded footage
+    replays exactly as it happened.
+    """
+    def __init__(self, detector, wled, notifier, zones, on_event=None, name=None):
+        self.detector = detector
+        self.wled = wled
+        self.notifier = notifier
+        self.zones = zones # zones.ZoneConfig
+        self.on_event = on_event # Optional callback(Event)
+        self.name = name # Room name, set when several cameras share the process
+
+        # State
+        self.tracker = OccupancyTracker(config.EXIT_TIMEOUT_SECONDS, config.ENTRY_ALERT_DELAY,
+                                        config.REACQUIRE_MAX_DISTANCE)
+        self.wled_is_active = False
+        self.lit_count = 0 # Room count the current brightness was set for
+        self.no_human_start_time = None
+
+        labels = {'camera': name} if name else {}
+        REGISTRY.gauge("room_count", "People currently in the room.", fn=lambda: self.room_count, **labels)
+        REGISTRY.gauge("wled_active", "1 while the lights are on.", fn=lambda: int(self.wled_is_active), **labels)
+        REGISTRY.gauge("pending_exits", "Tracks lost in the door zone awaiting exit confirmation.",
+                       fn=lambda: len(self.tracker.pending_exits), **labels)
+
+    @property
+    def room_count(self):
+        return self.tracker.room_count
+
+    def _observations(self, tracks, width, height):
+        """Zone-classified tracker input, with every track center looked up at once."""
+        if not tracks:
+            return []
+        zones = self.zones
+        bits, type_bits = zones.classify([trk['center'] for trk in tracks], width, height)
+        door_bits, exclude_bits, inside_bits = type_bits[DOOR], type_bits[EXCLUDE], type_bits[INSIDE]
+
+        observations = []
+        for trk, b in zip(tracks, bits):
+            cx, cy = trk['center']
+            observations.append(Observation(
+                trk['id'],
+                (cx / width, cy / height),
+                zones.zone_name(b, DOOR) if b & door_bits else None,
+                bool(b & exclude_bits),
+                bool(inside_bits) and not b & inside_bits,
+            ))
+        return observations
+
+    def _dispatch(self, event, frame):
+        """Sends tracker events to the alert consumers."""
+        room = f"[{self.name}] " if self.name else ""
+        if event.kind == ENTRY_ALERT:
+            # Delayed so the light is definitely ON in the photo
+            time_str = datetime.datetime.fromtimestamp(event.time).strftime("%I:%M %p")
+            self.notifier.send_photo(frame, f"{room}🚪 Entry Detected at {time_str}\nID: {event.track_id}")
+        elif event.kind == EXIT:
+            mins, secs = divmod(int(event.duration), 60)
+            duration_str = f"{mins}m {secs}s"
+            self.notifier.send_message(f"{room}🏃 Exit Detected.\nDuration: {duration_str}")
+
+        if self.on_event is not None:
+            self.on_event(event)
+
+    def process(self, frame, now, tracks=None):
+        """
+        Runs one frame through the pipeline.
+        Args:
+            tracks: Detector output for this frame, if the caller already ran it
+                (multi-camera batches). Otherwise the detector is called here.
+        Returns:
+            overlay (Overlay): what to draw on this frame, for whoever needs it.
+        """
+        height, width = frame.shape[:2]
+        zones = self.zones
+
+        # 1. Detection & Tracking
+        if tracks is None:
+            with stage_timer('detector'):
+                tracks = self.detector.track(frame, zones.door_rects(), now)
+
+        # 2. Occupancy (entries, exits, delayed alerts)
+        logic_start = time.perf_counter()
+        events = self.tracker.update(self._observations(tracks, width, height), now)
+        for event in events:
+            self._dispatch(event, frame)
+        observe_stage('logic', time.perf_counter() - logic_start)
+
+        # 3. WLED Logic
+        status_text = f"Count: {self.room_count} | "
+
+        if self.room_count > 0:
+            self.no_human_start_time = None
+            if not self.wled_is_active or self.room_count != self.lit_count:
+                # Also re-sent when the count changes, so brightness follows occupancy
+                with stage_timer('wled'):
+                    self.wled.turn_on(self.room_count)
+                self.wled_is_active = True
+                self.lit_count = self.room_count
+            status_text += "ON"
+        else:
+            if self.wled_is_active:
+                if self.no_human_start_time is None: self.no_human_start_time = now
+                elapsed = now - self.no_human_start_time
+                remaining = config.TIMEOUT_SECONDS - elapsed
+                if elapsed >= config.TIMEOUT_SECONDS:
+                    with stage_timer('wled'):
+                        self.wled.turn_off()
+                    self.wled_is_active = False
+                    self.lit_count = 0
+                    status_text += "OFF"
+                else:
+                    status_text += f"Wait {remaining:.1f}s"
+            else:
+                status_text += "OFF"
+
+        # 4. Visualization
+        # Only describe the overlay here; it is drawn lazily by whoever needs it
+        drag_rect = zones.current_drag_rect if zones.dragging else None
+        return Overlay(tracks, zones.overlay_zones(), status_text, self.tracker.pending_ids(), drag_rect)
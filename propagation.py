@@ -0,0 +1,96 @@
+import numpy as np
+
+class _KalmanBox:
+    """Constant-velocity Kalman filter over a box state [cx, cy, w, h, vx, vy]."""
+    __slots__ = ('x', 'P', 'last_time')
+
+    # Measurement picks [cx, cy, w, h] out of the state
+    H = np.hstack([np.eye(4), np.zeros((4, 2))])
+    R = np.diag([4.0, 4.0, 16.0, 16.0])
+
+    def __init__(self, box, now):
+        x1, y1, x2, y2 = box
+        self.x = np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1, 0.0, 0.0])
+        self.P = np.diag([10.0, 10.0, 10.0, 10.0, 1000.0, 1000.0])
+        self.last_time = now
+
+    def predict(self, now):
+        dt = max(0.0, now - self.last_time)
+        F = np.eye(6)
+        F[0, 4] = dt
+        F[1, 5] = dt
+        # Process noise grows with the time since the last update
+        q = 50.0 * dt
+        Q = np.diag([q, q, q, q, 4 * q, 4 * q])
+        self.x = F @ self.x
+        self.P = F @ self.P @ F.T + Q
+        self.last_time = now
+
+    def update(self, box):
+        x1, y1, x2, y2 = box
+        z = np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1])
+        y = z - self.H @ self.x
+        S = self.H @ self.P @ self.H.T + self.R
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ y
+        self.P = (np.eye(6) - K @ self.H) @ self.P
+
+    def box(self):
+        cx, cy, w, h = self.x[:4]
+        return np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+
+    def speed(self):
+        """Center speed relative to box height, in heights per second."""
+        h = max(self.x[3], 1.0)
+        return float(np.hypot(self.x[4], self.x[5]) / h)
+
+class TrackPropagator:
+    """
+    Carries detector tracks forward between full YOLO passes.
+    Each track ID gets its own small Kalman filter; predictions are returned
+    in the same {'id', 'box', 'center'} format as HumanDetector.track.
+    """
+    def __init__(self):
+        self.filters = {}
+
+    def update(self, tracks, now):
+        """Corrects the filters with a fresh detector pass and drops vanished IDs."""
+        seen = set()
+        for trk in tracks:
+            tid = trk['id']
+            seen.add(tid)
+            kf = self.filters.get(tid)
+            if kf is None:
+                self.filters[tid] = _KalmanBox(trk['box'], now)
+            else:
+                kf.predict(now)
+                kf.update(trk['box'])
+
+        for tid in list(self.filters):
+            if tid not in seen:
+                del self.filters[tid]
+
+    def predict(self, now, width, height):
+        """Returns the predicted tracks at time `now`, clipped to the frame."""
+        tracks = []
+        for tid, kf in self.filters.items():
+            kf.predict(now)
+            x1, y1, x2, y2 = kf.box()
+            x1 = int(min(max(x1, 0), width - 1))
+            y1 = int(min(max(y1, 0), height - 1))
+            x2 = int(min(max(x2, 0), width - 1))
+            y2 = int(min(max(y2, 0), height - 1))
+            tracks.append({
+                'id': tid,
+                'box': np.array([x1, y1, x2, y2]),
+                'center': ((x1 + x2) // 2, (y1 + y2) // 2)
+            })
+        return tracks
+
+    def max_speed(self):
+        if not self.filters:
+            return 0.0
+        return max(kf.speed() for kf in self.filters.values())
+
+    def clear(self):
+        self.filters.clear()
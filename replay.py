@@ -0,0 +1,241 @@
+"""
+Offline replay / benchmark for the detection pipeline.
+
+Feeds a recorded video file or a directory of frames through the same
+OccupancyPipeline main() uses, driven by the frames' own timestamps.
+WLED and Telegram are replaced by stubs that only record what would have
+been sent.
+
+Examples:
+    python replay.py clip.mp4
+    python replay.py frames/ --fps 15 --realtime
+    python replay.py clip.mp4 --ground-truth clip.gt.json --json result.json --max-errors 0
+
+Ground truth file (times in seconds from the start of the recording):
+    {"events": [{"t": 12.4, "type": "enter"}, {"t": 31.0, "type": "exit"}]}
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import time
+import cv2
+import numpy as np
+import config
+import metrics
+from detector import HumanDetector
+from pipeline import OccupancyPipeline
+from zones import ZoneConfig
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+class StubWLED:
+    def __init__(self):
+        self.calls = []
+
+    def turn_on(self, count=1):
+        self.calls.append(f'on:{count}')
+
+    def turn_off(self):
+        self.calls.append('off')
+
+class StubNotifier:
+    def __init__(self):
+        self.muted = False
+        self.photos = 0
+        self.messages = []
+
+    def send_photo(self, frame, caption="Alert", priority=None):
+        self.photos += 1
+
+    def send_message(self, text, priority=None):
+        self.messages.append(text)
+
+def video_frames(path):
+    """Yields (timestamp, frame) from a video file, using its own timestamps."""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    index = 0
+    last_ts = -1.0
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            ts = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            # Some containers report no timestamps; fall back to the nominal rate
+            if ts <= last_ts:
+                ts = index / fps
+            last_ts = ts
+            index += 1
+            yield ts, frame
+    finally:
+        cap.release()
+
+def directory_frames(path, fps):
+    """Yields (timestamp, frame) for the images in a directory, in name order."""
+    files = sorted(f for f in glob.glob(os.path.join(path, "*")) if f.lower().endswith(IMAGE_EXTENSIONS))
+    for index, file in enumerate(files):
+        frame = cv2.imread(file)
+        if frame is not None:
+            yield index / fps, frame
+
+def percentiles(samples):
+    values = np.asarray(samples) * 1000.0
+    return {
+        'count': int(values.size),
+        'p50_ms': float(np.percentile(values, 50)),
+        'p90_ms': float(np.percentile(values, 90)),
+        'p99_ms': float(np.percentile(values, 99)),
+        'max_ms': float(values.max()),
+    }
+
+def peak_rss_mb():
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+    except ImportError:
+        try:
+            import psutil
+            info = psutil.Process().memory_info()
+            return getattr(info, 'peak_wset', info.rss) / (1024 * 1024)
+        except ImportError:
+            return None
+
+def match_events(predicted, truth, tolerance):
+    """
+    Greedy one-to-one matching of predicted vs. ground-truth events of the same type.
+    Returns:
+        dict per type with true positives, false positives and misses.
+    """
+    report = {}
+    for kind in ('enter', 'exit'):
+        pred_times = sorted(t for t, k, _ in predicted if k == kind)
+        true_times = sorted(e['t'] for e in truth if e['type'] == kind)
+        used = [False] * len(pred_times)
+        tp = 0
+        for t in true_times:
+            best = None
+            for i, p in enumerate(pred_times):
+                if not used[i] and abs(p - t) <= tolerance and (best is None or abs(p - t) < abs(pred_times[best] - t)):
+                    best = i
+            if best is not None:
+                used[best] = True
+                tp += 1
+        report[kind] = {
+            'expected': len(true_times),
+            'detected': len(pred_times),
+            'true_positives': tp,
+            'false_positives': len(pred_times) - tp,
+            'missed': len(true_times) - tp,
+        }
+    return report
+
+def run(source, realtime=False):
+    """Runs every frame through the pipeline. Returns the raw results."""
+    metrics.record_raw_samples()
+    detector = HumanDetector()
+    door_cfg = ZoneConfig()
+    door_cfg.load()
+    wled = StubWLED()
+    notifier = StubNotifier()
+    events = []
+    pipeline = OccupancyPipeline(detector, wled, notifier, door_cfg,
+                                 on_event=lambda e: events.append((e.time, e.kind, int(e.track_id))))
+
+    frame_times = []
+    first_ts = None
+    wall_start = time.perf_counter()
+    for ts, frame in source:
+        if first_ts is None:
+            first_ts = ts
+        if realtime:
+            delay = (ts - first_ts) - (time.perf_counter() - wall_start)
+            if delay > 0:
+                time.sleep(delay)
+
+        started = time.perf_counter()
+        pipeline.process(frame, ts)
+        frame_times.append(time.perf_counter() - started)
+    wall = time.perf_counter() - wall_start
+
+    return {
+        'frames': len(frame_times),
+        'wall_seconds': wall,
+        'frame_times': frame_times,
+        'events': events,
+        'final_count': pipeline.room_count,
+        'wled_calls': wled.calls,
+        'alerts': {'photos': notifier.photos, 'messages': len(notifier.messages)},
+        'detector': detector.stats(),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded footage through the detection pipeline.")
+    parser.add_argument("input", help="Video file or directory of frames")
+    parser.add_argument("--fps", type=float, default=30.0, help="Frame rate for frame directories")
+    parser.add_argument("--realtime", action="store_true", help="Pace frames at their recorded rate instead of as fast as possible")
+    parser.add_argument("--ground-truth", help="JSON file with expected enter/exit events")
+    parser.add_argument("--tolerance", type=float, default=2.0, help="Seconds allowed between expected and detected events")
+    parser.add_argument("--json", help="Write the report to this file")
+    parser.add_argument("--max-errors", type=int, default=None, help="Exit with status 1 if false positives + misses exceed this")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if os.path.isdir(args.input):
+        source = directory_frames(args.input, args.fps)
+    else:
+        source = video_frames(args.input)
+    result = run(source, args.realtime)
+
+    stages = {stage: percentiles(samples) for stage, samples in metrics.stage_samples().items()}
+    if result['frame_times']:
+        stages['frame'] = percentiles(result['frame_times'])
+
+    report = {
+        'input': args.input,
+        'backend': config.INFERENCE_BACKEND,
+        'realtime': args.realtime,
+        'frames': result['frames'],
+        'wall_seconds': round(result['wall_seconds'], 3),
+        'fps': result['frames'] / result['wall_seconds'] if result['wall_seconds'] > 0 else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': stages,
+        'events': [{'t': round(t, 3), 'type': kind, 'id': tid} for t, kind, tid in result['events']],
+        'final_count': result['final_count'],
+        'wled_calls': result['wled_calls'],
+        'alerts': result['alerts'],
+        'detector': result['detector'],
+    }
+
+    errors = 0
+    if args.ground_truth:
+        with open(args.ground_truth) as f:
+            truth = json.load(f)['events']
+        report['accuracy'] = match_events(result['events'], truth, args.tolerance)
+        errors = sum(r['false_positives'] + r['missed'] for r in report['accuracy'].values())
+
+    print(f"Frames: {report['frames']}  Wall: {report['wall_seconds']}s  FPS: {report['fps']:.1f}  Peak RSS: {report['peak_rss_mb']} MB")
+    for stage, p in sorted(stages.items()):
+        print(f"  {stage:<14} n={p['count']:<6} p50={p['p50_ms']:.2f}ms p90={p['p90_ms']:.2f}ms p99={p['p99_ms']:.2f}ms max={p['max_ms']:.2f}ms")
+    print(f"Events: {len(report['events'])}  Final count: {report['final_count']}")
+    if 'accuracy' in report:
+        for kind, r in report['accuracy'].items():
+            print(f"  {kind}: {r['true_positives']}/{r['expected']} matched, {r['false_positives']} false, {r['missed']} missed")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.max_errors is not None and errors > args.max_errors:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
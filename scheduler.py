@@ -0,0 +1,90 @@
+import logging
+import config
+from metrics import REGISTRY
+
+# Degradation levels, in the order features are given up.
+# Each level includes everything shed by the levels below it.
+LEVEL_NORMAL = 0
+LEVEL_STREAM = 1 # Stream FPS and JPEG quality reduced
+LEVEL_NO_ANNOTATION = 2 # Stream / debug window show the raw frame
+LEVEL_LOW_RES = 3 # Inference at LOAD_DEGRADED_IMGSZ
+LEVEL_SKIP_FRAMES = 4 # Detector skips frames, except for tracks in the door zone
+MAX_LEVEL = LEVEL_SKIP_FRAMES
+
+LEVEL_NAMES = {
+    LEVEL_NORMAL: "normal",
+    LEVEL_STREAM: "reduced stream",
+    LEVEL_NO_ANNOTATION: "no annotation",
+    LEVEL_LOW_RES: "low-res inference",
+    LEVEL_SKIP_FRAMES: "skipping frames",
+}
+
+class LoadShedder:
+    """
+    Frame-budget scheduler.
+    The main loop reports how long each frame took; the smoothed time is
+    compared with FRAME_BUDGET_SECONDS. Over budget for LOAD_ESCALATE_SECONDS
+    sheds one more feature; comfortably under budget (LOAD_RECOVER_RATIO) for
+    LOAD_RECOVER_SECONDS restores one. Levels change one step at a time, so
+    the loop settles on the cheapest level that fits.
+    """
+    def __init__(self, budget=None):
+        self.budget = budget or config.FRAME_BUDGET_SECONDS
+        self.level = LEVEL_NORMAL
+        self.frame_time = None # Smoothed seconds per frame
+        self._over_since = None
+        self._under_since = None
+        self.changes = 0
+
+        REGISTRY.gauge("load_level", "Current degradation level (0 = normal).", fn=lambda: self.level)
+        REGISTRY.gauge("frame_time_seconds", "Smoothed main loop processing time per frame.", fn=lambda: self.frame_time or 0.0)
+
+    @property
+    def level_name(self):
+        return LEVEL_NAMES[self.level]
+
+    def update(self, frame_seconds, now):
+        """
+        Reports one frame's processing time.
+        Returns:
+            True if the level changed.
+        """
+        if self.frame_time is None:
+            self.frame_time = frame_seconds
+        else:
+            self.frame_time += 0.1 * (frame_seconds - self.frame_time)
+
+        if not config.LOAD_SHEDDING:
+            return False
+
+        if self.frame_time > self.budget:
+            self._under_since = None
+            if self._over_since is None:
+                self._over_since = now
+            if self.level < MAX_LEVEL and now - self._over_since >= config.LOAD_ESCALATE_SECONDS:
+                return self._set(self.level + 1, now)
+        elif self.frame_time < self.budget * config.LOAD_RECOVER_RATIO:
+            self._over_since = None
+            if self._under_since is None:
+                self._under_since = now
+            if self.level > LEVEL_NORMAL and now - self._under_since >= config.LOAD_RECOVER_SECONDS:
+                return self._set(self.level - 1, now)
+        else:
+            # Within the dead band: hold the current level
+            self._over_since = None
+            self._under_since = None
+        return False
+
+    def _set(self, level, now):
+        worse = level > self.level
+        self.level = level
+        self.changes += 1
+        # Give the new level time to take effect before judging it
+        self._over_since = now if worse else None
+        self._under_since = None if worse else now
+        msg = f"Load level {level} ({self.level_name}), frame time {self.frame_time * 1000:.0f} ms / budget {self.budget * 1000:.0f} ms"
+        if worse:
+            logging.warning(msg)
+        else:
+            logging.info(msg)
+        return True
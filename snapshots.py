@@ -0,0 +1,178 @@
+import os
+import re
+import time
+import queue
+import bisect
+import logging
+import datetime
+import itertools
+import threading
+import config
+from metrics import REGISTRY
+
+# kind_YYYYmmdd_HHMMSS_ffffff_n.jpg (older archives: kind_YYYYmmdd_HHMMSS[_ffffff].jpg)
+_NAME_RE = re.compile(r"^(?P<kind>[a-z]+)_(?P<stamp>\d{8}_\d{6})(?:_(?P<us>\d{6}))?(?:_\d+)?\.jpg$")
+
+class Snapshot:
+    __slots__ = ('name', 'time', 'kind', 'size')
+
+    def __init__(self, name, time, kind, size):
+        self.name = name
+        self.time = time
+        self.kind = kind
+        self.size = size
+
+    def to_json(self):
+        return {'name': self.name, 'time': self.time, 'kind': self.kind, 'size': self.size}
+
+class SnapshotStore:
+    """
+    Alert photo archive.
+    save() only queues the JPEG bytes; a background thread writes them under
+    a collision-free name and adds them to an in-memory index sorted by time,
+    so listing recent snapshots never touches the filesystem. The oldest files
+    are evicted once they exceed SNAPSHOT_MAX_AGE_DAYS or the directory
+    exceeds SNAPSHOT_MAX_MB.
+    """
+    def __init__(self, directory=None):
+        self.directory = directory or config.SNAPSHOT_DIR
+        self.max_age = config.SNAPSHOT_MAX_AGE_DAYS * 86400
+        self.max_bytes = int(config.SNAPSHOT_MAX_MB * 1024 * 1024)
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Index, oldest first; _times mirrors _entries for bisect
+        self._lock = threading.Lock()
+        self._entries = []
+        self._times = []
+        self._by_name = {}
+        self.total_bytes = 0
+
+        self._queue = queue.Queue(maxsize=config.SNAPSHOT_QUEUE_SIZE)
+        self._seq = itertools.count()
+
+        # Stats
+        self.written = 0
+        self.evicted = 0
+        self.dropped = 0
+
+        self._scan()
+        self._evict()
+
+        REGISTRY.gauge("snapshot_store_bytes", "Bytes of snapshots on disk.", fn=lambda: self.total_bytes)
+        REGISTRY.gauge("snapshot_store_files", "Snapshots on disk.", fn=lambda: len(self._entries))
+        REGISTRY.counter("snapshots_evicted_total", "Snapshots deleted by the retention policy.", fn=lambda: self.evicted)
+
+        threading.Thread(target=self._writer_thread, name="snapshot-writer", daemon=True).start()
+
+    # --- Public API ---
+
+    def save(self, jpeg, kind="alert", now=None):
+        """Queues JPEG bytes for writing. Returns the file name it will get, or None if dropped."""
+        now = time.time() if now is None else now
+        stamp = datetime.datetime.fromtimestamp(now).strftime("%Y%m%d_%H%M%S_%f")
+        name = f"{kind}_{stamp}_{next(self._seq)}.jpg"
+        try:
+            self._queue.put_nowait((name, now, kind, jpeg))
+        except queue.Full:
+            self.dropped += 1
+            logging.warning("Snapshot queue full. Dropped snapshot.")
+            return None
+        return name
+
+    def list(self, since=None, until=None, kind=None, limit=50):
+        """Snapshots in [since, until], newest first."""
+        with self._lock:
+            lo = 0 if since is None else bisect.bisect_left(self._times, since)
+            hi = len(self._times) if until is None else bisect.bisect_right(self._times, until)
+            result = []
+            for i in range(hi - 1, lo - 1, -1):
+                entry = self._entries[i]
+                if kind is None or entry.kind == kind:
+                    result.append(entry)
+                    if len(result) >= limit:
+                        break
+            return result
+
+    def path(self, name):
+        """Full path of an indexed snapshot, or None (names outside the index are never served)."""
+        with self._lock:
+            if name not in self._by_name:
+                return None
+        return os.path.join(self.directory, name)
+
+    def stats(self):
+        return {
+            'files': len(self._entries),
+            'bytes': self.total_bytes,
+            'written': self.written,
+            'evicted': self.evicted,
+            'dropped': self.dropped,
+        }
+
+    def flush(self):
+        """Blocks until every queued snapshot is on disk."""
+        self._queue.join()
+
+    # --- Internals ---
+
+    def _scan(self):
+        """Indexes the files already on disk (once, at startup)."""
+        for name in os.listdir(self.directory):
+            match = _NAME_RE.match(name)
+            if match is None:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                size = os.path.getsize(path)
+                ts = datetime.datetime.strptime(match.group('stamp'), "%Y%m%d_%H%M%S").timestamp()
+                ts += int(match.group('us') or 0) / 1e6
+            except (OSError, ValueError):
+                continue
+            self._add(Snapshot(name, ts, match.group('kind'), size))
+
+    def _add(self, entry):
+        with self._lock:
+            i = bisect.bisect_right(self._times, entry.time)
+            self._times.insert(i, entry.time)
+            self._entries.insert(i, entry)
+            self._by_name[entry.name] = entry
+            self.total_bytes += entry.size
+
+    def _evict(self):
+        cutoff = time.time() - self.max_age
+        while True:
+            with self._lock:
+                if not self._entries:
+                    return
+                oldest = self._entries[0]
+                if oldest.time >= cutoff and self.total_bytes <= self.max_bytes:
+                    return
+                del self._entries[0]
+                del self._times[0]
+                del self._by_name[oldest.name]
+                self.total_bytes -= oldest.size
+            try:
+                os.remove(os.path.join(self.directory, oldest.name))
+            except OSError:
+                pass
+            self.evicted += 1
+
+    def _writer_thread(self):
+        while True:
+            try:
+                name, ts, kind, jpeg = self._queue.get(timeout=60.0)
+            except queue.Empty:
+                self._evict() # Age-based eviction while idle
+                continue
+            try:
+                # 'x' never overwrites an existing file
+                with open(os.path.join(self.directory, name), 'xb') as f:
+                    f.write(jpeg)
+                self._add(Snapshot(name, ts, kind, len(jpeg)))
+                self.written += 1
+                self._evict()
+            except Exception as e:
+                logging.error(f"Failed to write snapshot {name}: {e}")
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,87 @@
+import time
+import logging
+import threading
+from concurrent.futures import Future
+
+class Startup:
+    """
+    Startup phases and readiness.
+    Slow steps (model load and warm-up, opening each camera) run on their own
+    threads through run(), so they overlap instead of adding up. The node is
+    ready once every ungrouped phase has succeeded, at least one phase of each
+    group (e.g. the cameras) has succeeded, and the first frame has gone
+    through the detector; /status and /healthz report progress until then.
+    """
+    def __init__(self, started=None):
+        self.started = time.monotonic() if started is None else started
+        self._lock = threading.Lock()
+        self.phases = {} # name -> {'state': 'running' | 'done' | 'failed', 'seconds': float, 'group': str}
+        self.first_detection = None # Seconds from start to the first detector pass
+
+    @property
+    def ready(self):
+        with self._lock:
+            if self.first_detection is None:
+                return False
+            groups = {}
+            for p in self.phases.values():
+                if p['group'] is None:
+                    if p['state'] != 'done':
+                        return False
+                else:
+                    groups[p['group']] = groups.get(p['group'], False) or p['state'] == 'done'
+            return all(groups.values())
+
+    def run(self, name, fn, *args, group=None):
+        """
+        Runs fn(*args) on a startup thread. A result of False or an exception
+        marks the phase failed. Phases sharing a group are alternatives: one
+        of them succeeding is enough for readiness.
+        Returns:
+            concurrent.futures.Future with fn's result.
+        """
+        future = Future()
+        with self._lock:
+            self.phases[name] = {'state': 'running', 'seconds': None, 'group': group}
+
+        def target():
+            started = time.monotonic()
+            try:
+                result = fn(*args)
+            except Exception as e:
+                self._finish(name, 'failed', started)
+                logging.error(f"Startup: {name} failed: {e}")
+                future.set_exception(e)
+                return
+            self._finish(name, 'failed' if result is False else 'done', started)
+            future.set_result(result)
+
+        threading.Thread(target=target, name=f"startup-{name}", daemon=True).start()
+        return future
+
+    def _finish(self, name, state, started):
+        seconds = time.monotonic() - started
+        with self._lock:
+            self.phases[name].update(state=state, seconds=seconds)
+        logging.info(f"Startup: {name} {state} in {seconds:.2f} s")
+
+    def detected(self):
+        """Records the first detector pass on a real frame (once) and logs the startup timings."""
+        with self._lock:
+            if self.first_detection is not None:
+                return
+            self.first_detection = time.monotonic() - self.started
+            phases = ", ".join(f"{name} {p['seconds']:.1f} s" for name, p in self.phases.items() if p['seconds'] is not None)
+        logging.warning(f"Time to first detection: {self.first_detection:.1f} s ({phases})")
+
+    def to_json(self):
+        with self._lock:
+            phases = {name: dict(p) for name, p in self.phases.items()}
+            first_detection = self.first_detection
+        return {
+            'ready': self.ready,
+            'uptime': time.monotonic() - self.started,
+            'phases': phases,
+            'failed': [name for name, p in phases.items() if p['state'] == 'failed'],
+            'first_detection_seconds': first_detection,
+        }
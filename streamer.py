@@ -1,56 +1,486 @@
-from flask import Flask, Response
+import os
+import asyncio
 import threading
 import cv2
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+import config
+import frames
+import metrics
+from metrics import REGISTRY, stage_timer
+from annotator import FrameAnnotator
+from scheduler import LEVEL_STREAM, LEVEL_NO_ANNOTATION
 
-app = Flask(__name__)
+routes = web.RouteTableDef()
 
-# Global buffer for the latest frame
-outputFrame = None
-lock = threading.Lock()
+class Rendition:
+    """
+    One output size and JPEG quality of the stream. Its latest JPEG is shared
+    by every viewer of the rendition; it holds nothing while nobody uses it.
+    """
+    def __init__(self, name, width, quality):
+        self.name = name
+        self.width = width # None = camera resolution
+        self.quality = quality
+        self.viewers = 0
+        self.jpeg = None
+        self.generation = 0
+        self.task = None # Encode of the latest frame in progress
+        self.teardown = None # Timer handle while idle
 
-def update_frame(frame):
-    global outputFrame, lock
-    with lock:
-        outputFrame = frame.copy()
+        # Stats
+        self.encoded_frames = 0
+        self.encoded_bytes = 0
+        self.sent_bytes = 0
+        self._rate = 0.0
+        self._rate_time = time.monotonic()
+        self._rate_bytes = 0
+
+        labels = {'rendition': name}
+        REGISTRY.gauge("stream_rendition_viewers", "Viewers per stream rendition.", fn=lambda: self.viewers, **labels)
+        REGISTRY.gauge("stream_bytes_per_second", "Bytes/s sent to all viewers of a rendition.", fn=self.bytes_per_second, **labels)
+        REGISTRY.counter("stream_sent_bytes_total", "Bytes sent to viewers of a rendition.", fn=lambda: self.sent_bytes, **labels)
+        REGISTRY.counter("stream_encoded_bytes_total", "JPEG bytes encoded for a rendition.", fn=lambda: self.encoded_bytes, **labels)
+
+    @property
+    def active(self):
+        return self.jpeg is not None or self.task is not None
+
+    def bytes_per_second(self):
+        """Send rate over the last few seconds (refreshed at most every 5 s)."""
+        now = time.monotonic()
+        if now - self._rate_time >= 5.0:
+            self._rate = (self.sent_bytes - self._rate_bytes) / (now - self._rate_time)
+            self._rate_time = now
+            self._rate_bytes = self.sent_bytes
+        return self._rate
+
+    def to_json(self):
+        return {
+            'width': self.width,
+            'quality': self.quality,
+            'viewers': self.viewers,
+            'active': self.active,
+            'bytes_per_second': round(self.bytes_per_second()),
+            'frame_bytes': len(self.jpeg) if self.jpeg is not None else None,
+        }
+
+class FrameBroadcaster:
+    """
+    Latest-frame slot shared by all stream clients.
+    The main loop publishes raw frames together with their overlay; clients
+    live on the server's event loop and each watch one of the renditions in
+    STREAM_RENDITIONS. Each new frame is annotated once and JPEG-encoded at
+    most once per rendition, on a single encoder thread, and only when a
+    client asks for it, so the cost stays flat no matter how many viewers are
+    connected (and is zero when nobody is watching). A slow client simply
+    skips to the newest frame. A rendition nobody has used for
+    STREAM_RENDITION_IDLE_SECONDS drops its buffered JPEG.
+    """
+    def __init__(self):
+        self.renditions = {name: Rendition(name, width, quality) for name, width, quality in config.STREAM_RENDITIONS}
+        self.quality_cap = None # Max JPEG quality while shedding load
+        self.fps = config.STREAM_FPS
+        self.annotate = True
+        self._lock = threading.Lock()
+        self._frame = None
+        self._overlay = None
+        self._generation = 0
+
+        # Event loop side, only touched from the loop thread
+        self.loop = None # Set by start_server()
+        self._new_frame = None # asyncio.Event replaced on every frame
+
+        # Encoder thread side
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stream-encode")
+        self._annotator = FrameAnnotator()
+        self._annotated = None # (generation, annotate flag, image)
+
+        self.subscribers = 0
+        self.rejected = 0
+        self.encoded_frames = 0
+
+    def publish(self, frame, overlay=None):
+        """Keeps a reference to the frame (no copy). The caller must not modify it afterwards."""
+        frames.retain(frame)
+        with self._lock:
+            previous = self._frame
+            self._frame = frame
+            self._overlay = overlay
+            self._generation += 1
+        frames.release(previous)
+        if self.subscribers and self.loop is not None:
+            self.loop.call_soon_threadsafe(self._wake)
+
+    def set_load_level(self, level):
+        """Sheds stream work first when the main loop is over its frame budget."""
+        degraded = level >= LEVEL_STREAM
+        self.fps = config.STREAM_FPS * config.LOAD_STREAM_FPS_SCALE if degraded else config.STREAM_FPS
+        self.quality_cap = config.LOAD_STREAM_JPEG_QUALITY if degraded else None
+        self.annotate = level < LEVEL_NO_ANNOTATION
+
+    def latest(self):
+        """
+        Returns (frame, overlay) as last published. The frame is retained for
+        the caller, who must frames.release() it when done.
+        """
+        with self._lock:
+            frames.retain(self._frame) # publish() may replace it while the caller reads it
+            return self._frame, self._overlay
+
+    def rendition(self, name=None, width=None):
+        """
+        Looks up a rendition by name, or the smallest one at least `width`
+        wide (the largest if none is). Returns None for an unknown name.
+        """
+        if name is not None:
+            return self.renditions.get(name)
+        if width is None:
+            return self.renditions[config.STREAM_DEFAULT_RENDITION]
+        size = lambda r: r.width or float('inf')
+        fits = [r for r in self.renditions.values() if size(r) >= width]
+        if not fits:
+            return max(self.renditions.values(), key=size)
+        return min(fits, key=size)
+
+    def subscribe(self, rendition):
+        """Registers a viewer. Returns False if STREAM_MAX_VIEWERS are already connected."""
+        if self.subscribers >= config.STREAM_MAX_VIEWERS:
+            self.rejected += 1
+            return False
+        self.subscribers += 1
+        if rendition.teardown is not None:
+            rendition.teardown.cancel()
+            rendition.teardown = None
+        rendition.viewers += 1
+        return True
+
+    def unsubscribe(self, rendition):
+        self.subscribers -= 1
+        rendition.viewers -= 1
+        if not rendition.viewers:
+            self._touch(rendition)
+
+    def _touch(self, rendition):
+        """(Re)starts the idle timer of a rendition nobody is watching."""
+        if rendition.teardown is not None:
+            rendition.teardown.cancel()
+        rendition.teardown = self.loop.call_later(config.STREAM_RENDITION_IDLE_SECONDS, self._teardown, rendition)
+
+    def _teardown(self, rendition):
+        rendition.teardown = None
+        if rendition.viewers or rendition.task is not None:
+            return
+        if rendition.jpeg is not None:
+            logging.info(f"Stream rendition '{rendition.name}' unused, released.")
+        rendition.jpeg = None
+        rendition.generation = 0
+
+    def _wake(self):
+        if self._new_frame is not None:
+            self._new_frame.set()
+            self._new_frame = None
+
+    async def wait_frame(self, last_generation, timeout=1.0):
+        """Waits until a frame newer than `last_generation` is published. Returns False on timeout."""
+        if self._generation > last_generation and self._frame is not None:
+            return True
+        if self._new_frame is None:
+            self._new_frame = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._new_frame.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return self._frame is not None
+
+    async def jpeg(self, rendition):
+        """
+        Returns (generation, jpeg bytes) for the latest frame in `rendition`.
+        All its viewers share one encode per frame.
+        """
+        if rendition.generation >= self._generation > 0:
+            return rendition.generation, rendition.jpeg # None if this frame failed to encode
+        if rendition.task is None:
+            rendition.task = asyncio.ensure_future(self._encode_latest(rendition))
+        # Shielded: a client disconnecting mid-encode mustn't cancel it for the others
+        return await asyncio.shield(rendition.task)
+
+    async def _encode_latest(self, rendition):
+        try:
+            with self._lock:
+                generation, frame, overlay = self._generation, self._frame, self._overlay
+                frames.retain(frame) # publish() may replace it while the encoder reads it
+            if frame is None:
+                return 0, None
+            quality = min(rendition.quality, self.quality_cap or 100)
+            try:
+                jpeg = await self.loop.run_in_executor(self._executor, self._encode, generation, frame, overlay,
+                                                       rendition.width, quality)
+            finally:
+                frames.release(frame)
+            # A failed encode still marks the frame as done, so viewers wait
+            # for the next one instead of retrying it on every wakeup
+            rendition.generation = generation
+            rendition.jpeg = jpeg
+            if jpeg is not None:
+                rendition.encoded_frames += 1
+                rendition.encoded_bytes += len(jpeg)
+            return rendition.generation, rendition.jpeg
+        finally:
+            rendition.task = None
+            if not rendition.viewers and rendition.teardown is None:
+                self._touch(rendition) # One-off use (/snapshot)
+
+    def _encode(self, generation, frame, overlay, width, quality):
+        """Runs on the encoder thread. The annotated image is reused across renditions of the same frame."""
+        annotate = self.annotate
+        if self._annotated is not None and self._annotated[:2] == (generation, annotate):
+            image = self._annotated[2]
+        else:
+            image = frame
+            if annotate:
+                with stage_timer('annotate'):
+                    image = self._annotator.render(frame, overlay)
+            self._annotated = (generation, annotate, image)
+
+        with stage_timer('encode'):
+            height, full_width = image.shape[:2]
+            if width and width < full_width:
+                image = cv2.resize(image, (width, int(height * width / full_width)), interpolation=cv2.INTER_AREA)
+            flag, encodedImage = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not flag:
+            return None
+        self.encoded_frames += 1
+        return encodedImage.tobytes()
+
+broadcaster = FrameBroadcaster()
+snapshot_store = None # Set by start_server()
+event_log = None # Set by start_server()
+startup_state = None # Set by start_server()
+load_shedder = None # Set by start_server()
+
+REGISTRY.gauge("stream_viewers", "Connected /video_feed clients.", fn=lambda: broadcaster.subscribers)
+REGISTRY.counter("stream_rejected_total", "/video_feed clients turned away at STREAM_MAX_VIEWERS.", fn=lambda: broadcaster.rejected)
+REGISTRY.counter("stream_encoded_frames_total", "Frames JPEG-encoded for the stream.", fn=lambda: broadcaster.encoded_frames)
+
+def update_frame(frame, overlay=None):
+    """
+    Publishes the latest raw frame and its overlay. The overlay is only drawn
+    if someone watches the stream. Ownership passes to the streamer: don't
+    draw on the frame afterwards.
+    """
+    broadcaster.publish(frame, overlay)
 
 def get_frame():
-    """Thread-safe frame getter for snapshots."""
-    global outputFrame, lock
-    with lock:
-        if outputFrame is None: return None
-        return outputFrame.copy()
-
-def generate():
-    global outputFrame, lock
-    while True:
-        with lock:
-            if outputFrame is None:
+    """Thread-safe annotated frame getter for snapshots."""
+    frame, overlay = broadcaster.latest()
+    if frame is None: return None
+    try:
+        # Fresh annotator: the snapshot outlives the broadcaster's reusable buffer
+        return FrameAnnotator().render(frame, overlay)
+    finally:
+        frames.release(frame)
+
+def _query_float(request, name, default=None):
+    try:
+        return float(request.query[name])
+    except (KeyError, ValueError):
+        return default
+
+def _query_int(request, name, default=None):
+    value = _query_float(request, name)
+    return default if value is None else int(value)
+
+def _rendition(request):
+    """The rendition asked for with ?rendition=<name> or ?width=N; None if the name is unknown."""
+    return broadcaster.rendition(request.query.get("rendition"), _query_int(request, "width"))
+
+def _unknown_rendition():
+    names = ", ".join(broadcaster.renditions)
+    return web.Response(status=400, text=f"Unknown rendition. Available: {names}.\n")
+
+@routes.get("/")
+async def index(request):
+    return web.Response(text="<h1>Smart Human Detector Live Stream</h1><img src='/video_feed'>", content_type="text/html")
+
+@routes.get("/video_feed")
+async def video_feed(request):
+    """MJPEG stream: ?fps=N (up to STREAM_FPS) and ?rendition=<name> or ?width=N per client."""
+    rendition = _rendition(request)
+    if rendition is None:
+        return _unknown_rendition()
+    if not broadcaster.subscribe(rendition):
+        return web.Response(status=503, text="Too many viewers.\n", headers={'Retry-After': "10"})
+    try:
+        fps = _query_float(request, "fps")
+        fps = max(fps, 0.1) if fps else None
+
+        response = web.StreamResponse(headers={
+            'Content-Type': "multipart/x-mixed-replace; boundary=frame",
+            'Cache-Control': "no-cache",
+        })
+        await response.prepare(request)
+
+        generation = 0
+        loop = asyncio.get_running_loop()
+        while True:
+            if not await broadcaster.wait_frame(generation):
                 continue
-            (flag, encodedImage) = cv2.imencode(".jpg", outputFrame)
-            if not flag:
+            started = loop.time()
+            generation, jpeg = await broadcaster.jpeg(rendition)
+            if jpeg is None:
                 continue
-        
-        yield(b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + 
-              bytearray(encodedImage) + b'\r\n')
-        time.sleep(0.05) # Limit to ~20 FPS
-
-@app.route("/")
-def index():
-    return "<h1>Smart Human Detector Live Stream</h1><img src='/video_feed'>"
-
-@app.route("/video_feed")
-def video_feed():
-    return Response(generate(), mimetype = "multipart/x-mixed-replace; boundary=frame")
-
-def start_server(port=5000):
-    # Disable Flask banner
-    log = logging.getLogger('werkzeug')
-    log.setLevel(logging.ERROR)
-    
-    # Run Flask in a thread
-    t = threading.Thread(target=app.run, kwargs={'host': '0.0.0.0', 'port': port, 'debug': False, 'use_reloader': False})
+
+            # write() waits while the client's socket buffer is full, so a slow
+            # viewer only holds up itself; one that stops reading is dropped
+            chunk = b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n'
+            with stage_timer('stream_write'):
+                await asyncio.wait_for(response.write(chunk), config.STREAM_WRITE_TIMEOUT)
+            rendition.sent_bytes += len(chunk)
+
+            # Limit per-client FPS; frames published meanwhile are skipped
+            rate = min(fps, broadcaster.fps) if fps else broadcaster.fps
+            delay = 1.0 / rate - (loop.time() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+    except (ConnectionError, asyncio.TimeoutError):
+        pass # Viewer went away or stopped reading
+    finally:
+        broadcaster.unsubscribe(rendition)
+    return response
+
+@routes.get("/snapshot")
+async def snapshot(request):
+    """Latest stream frame as a single JPEG (?rendition=<name> or ?width=N)."""
+    rendition = _rendition(request)
+    if rendition is None:
+        return _unknown_rendition()
+    generation, jpeg = await broadcaster.jpeg(rendition)
+    if jpeg is None:
+        return web.Response(status=503, text="Camera not ready.\n")
+    return web.Response(body=jpeg, content_type="image/jpeg", headers={'Cache-Control': "no-cache"})
+
+@routes.get("/healthz")
+async def healthz(request):
+    """200 once the node is ready (model warm, cameras open, first frame detected), 503 until then."""
+    if startup_state is None or startup_state.ready:
+        return web.Response(text="ok\n")
+    return web.json_response(startup_state.to_json(), status=503)
+
+@routes.get("/status")
+async def status(request):
+    return web.json_response({
+        'startup': startup_state.to_json() if startup_state is not None else None,
+        'load_level': load_shedder.level if load_shedder is not None else None,
+        'load_level_name': load_shedder.level_name if load_shedder is not None else None,
+        'viewers': broadcaster.subscribers,
+        'max_viewers': config.STREAM_MAX_VIEWERS,
+        'fps': broadcaster.fps,
+        'quality_cap': broadcaster.quality_cap,
+        'annotate': broadcaster.annotate,
+        'encoded_frames': broadcaster.encoded_frames,
+        'renditions': {name: r.to_json() for name, r in broadcaster.renditions.items()},
+    })
+
+@routes.get("/metrics")
+async def metrics_endpoint(request):
+    return web.Response(body=REGISTRY.render().encode(), headers={'Content-Type': "text/plain; version=0.0.4"})
+
+@routes.get("/profile")
+async def profile(request):
+    """Samples all thread stacks for ?seconds=N and returns them in folded format."""
+    if not config.PROFILER_ENABLED:
+        return web.Response(status=403, text="Profiler disabled.\n")
+    seconds = min(max(_query_float(request, "seconds", 10), 0.1), 60)
+    if not metrics.profiler.start():
+        return web.Response(status=409, text="Profiler already running.\n")
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        # Also when the client disconnects and the handler is cancelled,
+        # or the profiler would stay busy and answer 409 from then on
+        text = metrics.profiler.stop()
+    return web.Response(text=text)
+
+def _list_clips():
+    if not os.path.isdir(config.CLIP_DIR):
+        return []
+    names = [n for n in os.listdir(config.CLIP_DIR) if n.endswith(".mp4")]
+    names.sort(key=lambda n: os.path.getmtime(os.path.join(config.CLIP_DIR, n)), reverse=True)
+    return names
+
+@routes.get("/clips")
+async def clips_index(request):
+    """Saved event clips, newest first."""
+    names = await asyncio.get_running_loop().run_in_executor(None, _list_clips)
+    return web.json_response([{'name': n, 'url': f"/clips/{n}"} for n in names])
+
+@routes.get("/clips/{name}")
+async def clip_file(request):
+    name = request.match_info['name']
+    # Plain file names only: nothing that could escape CLIP_DIR
+    if not name.endswith(".mp4") or os.path.basename(name) != name or name.startswith("."):
+        raise web.HTTPNotFound()
+    path = os.path.join(os.path.abspath(config.CLIP_DIR), name)
+    if not os.path.isfile(path):
+        raise web.HTTPNotFound()
+    return web.FileResponse(path, headers={'Content-Type': "video/mp4"})
+
+@routes.get("/snapshots")
+async def snapshots_index(request):
+    """Recent snapshots from the store's index: ?kind=alert&since=<unix>&until=<unix>&limit=N."""
+    if snapshot_store is None:
+        raise web.HTTPNotFound()
+    entries = snapshot_store.list(since=_query_float(request, "since"),
+                                  until=_query_float(request, "until"),
+                                  kind=request.query.get("kind"),
+                                  limit=min(_query_int(request, "limit", 50), 500))
+    return web.json_response([dict(e.to_json(), url=f"/snapshots/{e.name}") for e in entries])
+
+@routes.get("/snapshots/{name}")
+async def snapshot_file(request):
+    path = snapshot_store.path(request.match_info['name']) if snapshot_store is not None else None
+    if path is None:
+        raise web.HTTPNotFound()
+    return web.FileResponse(os.path.abspath(path), headers={'Content-Type': "image/jpeg", 'Cache-Control': "max-age=3600"})
+
+@routes.get("/history")
+async def history(request):
+    """Occupancy totals and a downsampled series: ?start=<unix>&end=<unix>&points=N&room=<name> (default: last 24 h, every room)."""
+    if event_log is None:
+        raise web.HTTPNotFound()
+    end = _query_float(request, "end", time.time())
+    start = _query_float(request, "start", end - 86400)
+    if start >= end:
+        return web.Response(status=400, text="start must be before end.\n")
+    points = min(max(_query_int(request, "points", 60), 1), 1000)
+    # SQLite reads block, so they run off the event loop
+    result = await asyncio.get_running_loop().run_in_executor(None, event_log.query, start, end, points,
+                                                              request.query.get("room"))
+    return web.json_response(result)
+
+def _serve(loop, port):
+    asyncio.set_event_loop(loop)
+    app = web.Application()
+    app.add_routes(routes)
+    runner = web.AppRunner(app, access_log=None)
+    loop.run_until_complete(runner.setup())
+    loop.run_until_complete(web.TCPSite(runner, '0.0.0.0', port).start())
+    loop.run_forever()
+
+def start_server(port=5000, snapshots=None, history=None, startup=None, shedder=None):
+    global snapshot_store, event_log, startup_state, load_shedder
+    snapshot_store = snapshots # SnapshotStore behind /snapshots (optional)
+    event_log = history # EventLog behind /history (optional)
+    startup_state = startup # startup.Startup behind /healthz (optional)
+    load_shedder = shedder # scheduler.LoadShedder reported by /status (optional)
+
+    # One event loop serves every client; it runs in its own thread
+    loop = asyncio.new_event_loop()
+    broadcaster.loop = loop
+    t = threading.Thread(target=_serve, args=(loop, port), name="streamer")
     t.daemon = True
     t.start()
     logging.info(f"Streamer started on port {port}")
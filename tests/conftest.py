@@ -0,0 +1,67 @@
+import os
+import sys
+import json
+import time
+import socket
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pytest
+
+# The modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def wait_for(predicate, timeout=5.0):
+    """Polls until predicate() is true. Returns its last value."""
+    deadline = time.monotonic() + timeout
+    while True:
+        value = predicate()
+        if value or time.monotonic() >= deadline:
+            return value
+        time.sleep(0.01)
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with self.server.lock:
+            self.server.requests.append((self.path, body))
+        status, reply = self.server.respond(self.path, body)
+        data = json.dumps(reply).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', "application/json")
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+class FakeHTTPServer(ThreadingHTTPServer):
+    """
+    Local stand-in for an HTTP API. Records every POST as (path, body) and
+    answers with respond(path, body) -> (status, JSON reply).
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.respond = lambda path, body: (200, {'ok': True})
+        self.host = f"127.0.0.1:{self.server_address[1]}"
+        threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True).start()
+
+    def bodies(self, suffix=""):
+        with self.lock:
+            return [body for path, body in self.requests if path.endswith(suffix)]
+
+@pytest.fixture
+def http_server():
+    server = FakeHTTPServer()
+    yield server
+    server.shutdown()
+    server.server_close()
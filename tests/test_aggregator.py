@@ -0,0 +1,142 @@
+import asyncio
+import threading
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("requests")
+
+import config
+from aggregator import Aggregator
+from bus import BusPublisher
+from occupancy import Event, ENTER, EXIT, REAPPEAR
+from conftest import free_port, wait_for
+
+class Server:
+    """Runs an Aggregator's serve() on its own event loop thread, so it can be stopped and restarted."""
+    def __init__(self, state_file):
+        self.state_file = state_file
+        self.port = free_port()
+        self.status_port = free_port()
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        self.aggregator = None
+        self._task = None
+
+    def start(self):
+        self.aggregator = Aggregator(state_file=self.state_file)
+
+        async def create():
+            return asyncio.ensure_future(self.aggregator.serve(f"127.0.0.1:{self.port}", self.status_port))
+        self._task = asyncio.run_coroutine_threadsafe(create(), self.loop).result()
+
+    def stop(self):
+        async def cancel():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        asyncio.run_coroutine_threadsafe(cancel(), self.loop).result(5)
+
+    def close(self):
+        if self._task is not None and not self._task.done():
+            self.stop()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'AGGREGATOR_HEARTBEAT_SECONDS', 0.1)
+    monkeypatch.setattr(config, 'AGGREGATOR_RETRY_BASE', 0.05)
+    monkeypatch.setattr(config, 'AGGREGATOR_RETRY_MAX_DELAY', 0.2)
+    monkeypatch.setattr(config, 'AGGREGATOR_ROOMS', {})
+    server = Server(str(tmp_path / "state.json"))
+    server.start()
+    yield server
+    server.close()
+
+@pytest.fixture
+def nodes(server):
+    publishers = [BusPublisher(f"127.0.0.1:{server.port}", node=name) for name in ("a", "b")]
+    assert wait_for(lambda: all(p.connected for p in publishers))
+    yield publishers
+    for publisher in publishers:
+        publisher.close(timeout=0)
+
+def event(kind, t, track=1, duration=None):
+    return Event(kind, track, t, 0, 'door', duration)
+
+def count(server, room="hall"):
+    return server.aggregator.to_json()['rooms'].get(room, {}).get('count')
+
+def test_events_are_acknowledged_and_counted(server, nodes):
+    a, b = nodes
+    a.publish("hall", event(ENTER, 100.0))
+    a.publish("hall", event(REAPPEAR, 100.5)) # Not sent
+    b.publish("kitchen", event(ENTER, 100.0))
+    assert wait_for(lambda: a.pending() == 0 and b.pending() == 0)
+    assert a.acked == 1 and b.acked == 1
+    assert count(server) == 1
+    assert count(server, "kitchen") == 1
+
+def test_same_movement_from_two_nodes_counts_once(server, nodes):
+    a, b = nodes
+    a.publish("hall", event(ENTER, 100.0))
+    assert wait_for(lambda: a.pending() == 0)
+    b.publish("hall", event(ENTER, 100.5, track=7))
+    assert wait_for(lambda: b.pending() == 0)
+    assert count(server) == 1
+    assert server.aggregator.duplicates == 1
+
+    # Two people through the same door: the second report from a is new
+    a.publish("hall", event(ENTER, 101.0, track=2))
+    assert wait_for(lambda: a.pending() == 0)
+    assert count(server) == 2
+
+    a.publish("hall", event(EXIT, 110.0, duration=10.0))
+    assert wait_for(lambda: a.pending() == 0)
+    assert count(server) == 1
+
+def test_heartbeats_report_node_counts(server):
+    publisher = BusPublisher(f"127.0.0.1:{server.port}", node="a", counts=lambda: {"hall": 3})
+    try:
+        assert wait_for(lambda: server.aggregator.to_json()['nodes'].get("a", {}).get('rooms') == {"hall": 3})
+    finally:
+        publisher.close(timeout=0)
+
+def test_events_survive_an_aggregator_restart(server, nodes):
+    a, b = nodes
+    a.publish("hall", event(ENTER, 100.0))
+    assert wait_for(lambda: a.pending() == 0)
+
+    server.stop()
+    assert wait_for(lambda: not a.connected and not b.connected)
+    a.publish("hall", event(ENTER, 200.0, track=2))
+    b.publish("kitchen", event(ENTER, 200.0))
+    assert a.pending() == 1 and b.pending() == 1
+
+    server.start() # Same port and state file
+    assert wait_for(lambda: a.connected and b.connected)
+    assert wait_for(lambda: a.pending() == 0 and b.pending() == 0)
+    assert count(server) == 2 # One restored, one resent
+    assert count(server, "kitchen") == 1
+    assert server.aggregator.repeats == 0
+
+def test_unmapped_rooms_drive_no_lights(server, nodes):
+    a, _ = nodes
+    a.publish("attic", event(ENTER, 100.0))
+    assert wait_for(lambda: a.pending() == 0)
+    assert server.aggregator.rooms["attic"].wled.devices == []
+
+def test_failed_save_is_retried_before_acknowledging(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'AGGREGATOR_ROOMS', {})
+    aggregator = Aggregator(state_file=str(tmp_path / "missing" / "state.json"))
+    aggregator.hello("a", 1, 0.0)
+    assert aggregator.handle("a", {'type': 'event', 'seq': 1, 'room': "lab", 'kind': ENTER, 'time': 0.0}, 0.0) == 1
+    with pytest.raises(OSError):
+        asyncio.run(aggregator.persist()) # The directory doesn't exist yet
+
+    (tmp_path / "missing").mkdir()
+    asyncio.run(aggregator.persist())
+    restored = Aggregator(state_file=aggregator.state_file)
+    assert restored.rooms["lab"].count == 1
+    assert restored.nodes["a"]['last_seq'] == 1
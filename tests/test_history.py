@@ -0,0 +1,71 @@
+import sqlite3
+import pytest
+
+import config
+from history import EventLog
+from occupancy import Event, ENTER, EXIT
+
+HOUR = 3600
+T0 = 1_700_000_000 // HOUR * HOUR # Start of an hour
+
+def event(kind, t, count=1):
+    return Event(kind, 1, t, count, "door", None)
+
+@pytest.fixture
+def log(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'HISTORY_FLUSH_SECONDS', 0.01)
+    logs = []
+
+    def make(path=None):
+        logs.append(EventLog(path or str(tmp_path / "history.db")))
+        return logs[-1]
+    yield make
+    for opened in logs:
+        opened.close()
+
+def test_events_of_every_room_are_kept_apart(log):
+    history = log()
+    history.record(event(ENTER, T0 + 10), "hall")
+    history.record(event(ENTER, T0 + 20), "lab")
+    history.record(event(EXIT, T0 + 30, 0), "lab")
+    history.sample(1, T0 + 10, "hall")
+    history.sample(2, T0 + 20, "lab")
+    history.close()
+
+    assert history.totals(T0, T0 + 60, "hall") == {'entries': 1, 'exits': 0, 'peak_count': 1}
+    assert history.totals(T0, T0 + 60, "lab") == {'entries': 1, 'exits': 1, 'peak_count': 2}
+    assert history.totals(T0, T0 + 60) == {'entries': 2, 'exits': 1, 'peak_count': 2}
+
+def test_series_leaves_out_rollup_rows_before_the_window(log):
+    history = log()
+    history.record(event(ENTER, T0 + 30 * 60), "hall") # Before the window, in the same hour
+    history.record(event(ENTER, T0 + 3 * HOUR + 60), "hall")
+    history.close()
+
+    start = T0 + 45 * 60
+    series = history.series(start, start + 6 * HOUR, points=6, room="hall")
+    assert sum(b['entries'] for b in series) == 1
+    assert series[2]['entries'] == 1 # T0 + 3 h falls in the third hour of the window
+
+def test_database_without_rooms_is_migrated(log, tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE events (t REAL NOT NULL, kind TEXT NOT NULL, track_id INTEGER, count INTEGER, door TEXT, duration REAL);
+        CREATE TABLE samples (t REAL NOT NULL, count INTEGER NOT NULL);
+        CREATE TABLE rollups (
+            res INTEGER NOT NULL, bucket INTEGER NOT NULL,
+            entries INTEGER NOT NULL DEFAULT 0, exits INTEGER NOT NULL DEFAULT 0,
+            max_count INTEGER NOT NULL DEFAULT 0, sum_count INTEGER NOT NULL DEFAULT 0, samples INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (res, bucket)) WITHOUT ROWID;
+    """)
+    conn.execute("INSERT INTO events VALUES (?, ?, 1, 1, 'door', NULL)", (T0 + 10, ENTER))
+    conn.executemany("INSERT INTO rollups (res, bucket, entries) VALUES (?, ?, 1)", [(60, (T0 + 10) // 60), (HOUR, T0 // HOUR)])
+    conn.commit()
+    conn.close()
+
+    history = log(path)
+    history.record(event(ENTER, T0 + 20), "hall")
+    history.close()
+    assert history.totals(T0, T0 + 2 * HOUR)['entries'] == 2
+    assert history.totals(T0, T0 + 2 * HOUR, "hall")['entries'] == 1
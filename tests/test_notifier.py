@@ -0,0 +1,137 @@
+import json
+import threading
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+pytest.importorskip("requests")
+
+import config
+import frames
+from notifier import TelegramNotifier, PRIORITY_COMMAND
+from snapshots import SnapshotStore
+from conftest import wait_for
+
+@pytest.fixture
+def bot(http_server, monkeypatch, tmp_path):
+    """A notifier talking to a fake Bot API, with one worker and a short coalescing window."""
+    monkeypatch.setattr(config, 'TELEGRAM_API_URL', f"http://{http_server.host}")
+    monkeypatch.setattr(config, 'TELEGRAM_CHAT_ID', "42")
+    monkeypatch.setattr(config, 'TELEGRAM_WORKERS', 1)
+    monkeypatch.setattr(config, 'TELEGRAM_COALESCE_SECONDS', 0.2)
+    monkeypatch.setattr(config, 'TELEGRAM_RETRY_BASE', 0.01)
+
+    def make(**settings):
+        for name, value in settings.items():
+            monkeypatch.setattr(config, name, value)
+        return TelegramNotifier(SnapshotStore(str(tmp_path)), token="test")
+    return make
+
+def texts(server):
+    return [json.loads(body)['text'] for body in server.bodies("/sendMessage")]
+
+def hold_first_request(server):
+    """Makes the fake API stall on its first request until the returned event is set."""
+    gate = threading.Event()
+    first = []
+
+    def respond(path, body):
+        if not first:
+            first.append(path)
+            gate.wait(5)
+        return 200, {'ok': True}
+    server.respond = respond
+    return gate
+
+def test_messages_in_a_burst_are_coalesced(bot, http_server):
+    notifier = bot()
+    for text in ("one", "two", "three"):
+        notifier.send_message(text)
+    assert wait_for(lambda: notifier.sent == 1)
+    assert texts(http_server) == ["one\n\ntwo\n\nthree"]
+    assert notifier.coalesced == 2
+
+def test_photos_in_a_burst_become_one_album(bot, http_server):
+    notifier = bot()
+    for i in range(3):
+        notifier.send_photo(np.full((8, 8, 3), i * 50, dtype=np.uint8), f"photo {i}")
+    assert wait_for(lambda: notifier.sent == 1)
+    assert len(http_server.bodies("/sendMediaGroup")) == 1
+    assert http_server.bodies("/sendPhoto") == []
+
+def test_commands_jump_the_alert_queue(bot, http_server):
+    notifier = bot(TELEGRAM_COALESCE_SECONDS=0)
+    gate = hold_first_request(http_server)
+    notifier.send_message("alert 1")
+    assert wait_for(lambda: len(http_server.requests) == 1)
+    notifier.send_message("alert 2")
+    notifier.send_message("alert 3")
+    notifier.send_message("reply", PRIORITY_COMMAND)
+    gate.set()
+    assert wait_for(lambda: notifier.sent == 4)
+    assert texts(http_server) == ["alert 1", "reply", "alert 2", "alert 3"]
+
+def test_full_queue_drops_alerts(bot, http_server):
+    notifier = bot(TELEGRAM_COALESCE_SECONDS=0, TELEGRAM_QUEUE_SIZE=1)
+    gate = hold_first_request(http_server)
+    notifier.send_message("busy")
+    assert wait_for(lambda: len(http_server.requests) == 1)
+    notifier.send_message("queued")
+    notifier.send_message("dropped")
+    assert notifier.dropped == 1
+    gate.set()
+    assert wait_for(lambda: notifier.sent == 2)
+    assert texts(http_server) == ["busy", "queued"]
+
+def test_server_errors_are_retried(bot, http_server):
+    notifier = bot(TELEGRAM_COALESCE_SECONDS=0)
+    replies = [(500, {'ok': False}), (429, {'ok': False, 'parameters': {'retry_after': 0.01}})]
+    http_server.respond = lambda path, body: replies.pop(0) if replies else (200, {'ok': True})
+    notifier.send_message("hello")
+    assert wait_for(lambda: notifier.sent == 1)
+    assert texts(http_server) == ["hello"] * 3
+    assert notifier.failed == 0
+
+def test_client_errors_are_not_retried(bot, http_server):
+    notifier = bot(TELEGRAM_COALESCE_SECONDS=0)
+    http_server.respond = lambda path, body: (400, {'ok': False})
+    notifier.send_message("hello")
+    assert wait_for(lambda: notifier.failed == 1)
+    assert len(http_server.requests) == 1
+
+def test_dropped_and_muted_photos_release_their_frames(bot, http_server):
+    notifier = bot(TELEGRAM_COALESCE_SECONDS=0, TELEGRAM_QUEUE_SIZE=1)
+    pool = frames.FramePool()
+    gate = hold_first_request(http_server)
+    notifier.send_message("busy")
+    assert wait_for(lambda: len(http_server.requests) == 1)
+
+    for caption in ("queued", "dropped"):
+        buf = pool.wrap(np.zeros((8, 8, 3), dtype=np.uint8))
+        notifier.send_photo(buf.view, caption)
+        frames.release(buf.view) # The producer's reference
+    assert notifier.dropped == 1
+    assert pool.in_use == 1 # Only the queued photo is still held
+
+    notifier.muted = True # The queued photo is skipped rather than sent
+    gate.set()
+    assert wait_for(lambda: pool.in_use == 0)
+    assert http_server.bodies("/sendPhoto") == []
+
+def test_video_owner_is_told_when_each_upload_is_done(bot, http_server, tmp_path):
+    notifier = bot(TELEGRAM_COALESCE_SECONDS=0, TELEGRAM_QUEUE_SIZE=1)
+    done = []
+    gate = hold_first_request(http_server)
+    notifier.send_message("busy")
+    assert wait_for(lambda: len(http_server.requests) == 1)
+
+    for name in ("sent.mp4", "dropped.mp4"):
+        path = tmp_path / name
+        path.write_bytes(b"mp4")
+        notifier.send_video(str(path), on_done=lambda name=name: done.append(name))
+    assert done == ["dropped.mp4"] # Nothing holds the file of a dropped upload
+
+    gate.set()
+    assert wait_for(lambda: len(done) == 2)
+    assert done[1] == "sent.mp4"
+    assert len(http_server.bodies("/sendVideo")) == 1
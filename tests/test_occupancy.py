@@ -0,0 +1,91 @@
+from occupancy import OccupancyTracker, Observation, ENTER, EXIT, REAPPEAR, REACQUIRE, ENTRY_ALERT
+
+def door(tid, center=(0.9, 0.5)):
+    return Observation(tid, center, 'door', False, False)
+
+def inside(tid, center=(0.4, 0.5)):
+    return Observation(tid, center, None, False, False)
+
+def kinds(events):
+    return [e.kind for e in events]
+
+def test_enter_counts_and_schedules_alert():
+    tracker = OccupancyTracker(exit_timeout=1.5, alert_delay=1.0)
+    events = tracker.update([door(1)], 0.0)
+    assert kinds(events) == [ENTER]
+    assert tracker.room_count == 1
+    assert kinds(tracker.update([door(1)], 0.5)) == []
+    assert kinds(tracker.update([door(1)], 1.0)) == [ENTRY_ALERT]
+
+def test_exit_after_timeout():
+    tracker = OccupancyTracker(exit_timeout=1.5)
+    tracker.update([door(1)], 0.0)
+    tracker.update([], 1.0)
+    assert tracker.pending_ids() == (1,)
+    assert EXIT not in kinds(tracker.update([], 2.4))
+    events = tracker.update([], 2.6)
+    assert kinds(events) == [EXIT]
+    assert events[0].count == 0
+    assert events[0].duration == 0.0
+    assert tracker.pending_ids() == ()
+
+def test_lost_inside_room_is_not_an_exit():
+    tracker = OccupancyTracker(exit_timeout=1.5)
+    tracker.update([door(1)], 0.0)
+    tracker.update([inside(1)], 0.5)
+    tracker.update([], 1.0)
+    assert EXIT not in kinds(tracker.update([], 5.0))
+    assert tracker.room_count == 1
+
+def test_same_id_back_before_timeout():
+    tracker = OccupancyTracker(exit_timeout=1.5)
+    tracker.update([door(1)], 0.0)
+    tracker.update([], 1.0)
+    assert kinds(tracker.update([door(1)], 1.5)) == [REACQUIRE]
+    assert EXIT not in kinds(tracker.update([door(1)], 3.0))
+    assert tracker.room_count == 1
+
+def test_new_id_near_pending_exit_is_merged():
+    tracker = OccupancyTracker(exit_timeout=1.5, reacquire_distance=0.25)
+    tracker.update([door(1, (0.9, 0.5))], 0.0)
+    tracker.update([], 1.0)
+    events = tracker.update([door(2, (0.85, 0.5))], 1.2)
+    assert kinds(events) == [REACQUIRE]
+    assert tracker.room_count == 1
+    assert tracker.pending_ids() == ()
+    assert EXIT not in kinds(tracker.update([door(2)], 3.0))
+
+def test_new_id_far_from_pending_exit_is_an_entry():
+    tracker = OccupancyTracker(exit_timeout=1.5, reacquire_distance=0.25)
+    tracker.update([door(1, (0.9, 0.1))], 0.0)
+    tracker.update([], 1.0)
+    assert ENTER in kinds(tracker.update([door(2, (0.9, 0.9))], 1.2))
+    assert tracker.room_count == 2
+
+def test_reacquired_then_lost_again_uses_new_deadline():
+    tracker = OccupancyTracker(exit_timeout=1.5)
+    tracker.update([door(1)], 0.0)
+    tracker.update([], 1.0)
+    tracker.update([door(1)], 1.5)
+    tracker.update([], 2.0)
+    # The first timer (due at 2.5) must not confirm the second loss
+    assert EXIT not in kinds(tracker.update([], 2.6))
+    assert tracker.room_count == 1
+    assert EXIT not in kinds(tracker.update([], 3.4))
+    events = tracker.update([], 3.6)
+    assert kinds(events) == [EXIT]
+    assert tracker.room_count == 0
+
+def test_reappearance_inside_keeps_count():
+    tracker = OccupancyTracker()
+    assert kinds(tracker.update([inside(7)], 0.0)) == [REAPPEAR]
+    assert tracker.room_count == 0
+
+def test_excluded_and_outside_tracks_are_ignored():
+    tracker = OccupancyTracker()
+    events = tracker.update([
+        Observation(1, (0.5, 0.5), None, True, False),
+        Observation(2, (0.1, 0.1), None, False, True),
+    ], 0.0)
+    assert events == []
+    assert tracker.active == {}
@@ -0,0 +1,60 @@
+from startup import Startup
+from conftest import wait_for
+
+def settle(futures):
+    """Waits for every phase, failed or not."""
+    for future in futures:
+        try:
+            future.result(timeout=5)
+        except Exception:
+            pass
+
+def test_ready_after_model_one_camera_and_first_detection():
+    startup = Startup()
+    futures = [
+        startup.run("model", lambda: "detector"),
+        startup.run("camera 0", lambda: True, group="cameras"),
+        startup.run("camera 1", lambda: False, group="cameras"),
+    ]
+    settle(futures)
+    assert not startup.ready # No detection yet
+
+    startup.detected()
+    assert startup.ready
+    state = startup.to_json()
+    assert state['ready']
+    assert state['failed'] == ["camera 1"]
+
+def test_not_ready_when_every_camera_failed():
+    startup = Startup()
+    futures = [
+        startup.run("model", lambda: "detector"),
+        startup.run("camera 0", lambda: False, group="cameras"),
+    ]
+    settle(futures)
+    startup.detected()
+    assert not startup.ready
+
+def test_failed_model_keeps_node_unready():
+    startup = Startup()
+
+    def broken():
+        raise RuntimeError("no weights")
+
+    futures = [
+        startup.run("model", broken),
+        startup.run("camera 0", lambda: True, group="cameras"),
+    ]
+    settle(futures)
+    startup.detected()
+    assert not startup.ready
+    assert startup.to_json()['failed'] == ["model"]
+
+def test_running_phase_is_not_ready():
+    startup = Startup()
+    release = []
+    startup.run("model", lambda: wait_for(lambda: release, timeout=5))
+    startup.detected()
+    assert not startup.ready
+    release.append(True)
+    assert wait_for(lambda: startup.ready)
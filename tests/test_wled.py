@@ -0,0 +1,84 @@
+import json
+import time
+import threading
+import pytest
+
+pytest.importorskip("requests")
+
+import config
+from wled import WLEDController
+from conftest import FakeHTTPServer, wait_for
+
+@pytest.fixture
+def devices(monkeypatch):
+    """Two fake WLED devices, with fast retries."""
+    monkeypatch.setattr(config, 'WLED_RETRY_BASE', 0.05)
+    monkeypatch.setattr(config, 'WLED_RETRY_MAX_DELAY', 0.1)
+    servers = [FakeHTTPServer(), FakeHTTPServer()]
+    yield servers
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def states(server):
+    return [json.loads(body) for body in server.bodies("/json/state")]
+
+def test_repeated_states_are_sent_once(devices):
+    wled = WLEDController([devices[0].host])
+    wled.turn_on(1)
+    wled.turn_on(1)
+    assert wait_for(lambda: wled.pending() == 0 and wled.posted == 1)
+    wled.turn_on(1)
+    time.sleep(0.1)
+    assert len(states(devices[0])) == 1
+    assert wled.skipped == 2
+    wled.close()
+
+def test_brightness_follows_the_count(devices, monkeypatch):
+    monkeypatch.setattr(config, 'WLED_BRIGHTNESS', 100)
+    monkeypatch.setattr(config, 'WLED_BRIGHTNESS_STEP', 50)
+    wled = WLEDController([devices[0].host])
+    wled.turn_on(1)
+    assert wait_for(lambda: wled.posted == 1)
+    wled.turn_on(3)
+    assert wait_for(lambda: wled.posted == 2)
+    assert [s['bri'] for s in states(devices[0])] == [100, 200]
+    wled.close()
+
+def test_slow_device_does_not_hold_up_the_others(devices):
+    slow, fast = devices
+    release = threading.Event()
+
+    def stall(path, body):
+        release.wait(5)
+        return 200, {}
+    slow.respond = stall
+
+    wled = WLEDController([slow.host, fast.host])
+    wled.turn_on(1)
+    assert wait_for(lambda: len(states(fast)) == 1, timeout=1.0)
+    assert wled.pending() == 1 # Still waiting on the slow one
+    release.set()
+    assert wait_for(lambda: wled.pending() == 0)
+    wled.close()
+
+def test_failing_device_is_retried_with_the_newest_state(devices):
+    failing, healthy = devices
+    down = threading.Event()
+    down.set()
+    failing.respond = lambda path, body: (503, {}) if down.is_set() else (200, {})
+
+    wled = WLEDController([failing.host, healthy.host])
+    wled.turn_on(1)
+    assert wait_for(lambda: len(states(healthy)) == 1)
+    assert wait_for(lambda: len(states(failing)) >= 2) # Retried
+    assert wled.stats()['unreachable'] == [failing.host]
+
+    wled.turn_off()
+    assert wait_for(lambda: len(states(healthy)) == 2)
+    down.clear()
+    assert wait_for(lambda: wled.pending() == 0)
+    # Once back, the device gets the latest state, not the stale one
+    assert states(failing)[-1]['on'] is False
+    assert wled.stats()['unreachable'] == []
+    wled.close()
@@ -0,0 +1,161 @@
+import time
+import random
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+import config
+from metrics import REGISTRY, observe_stage
+
+def brightness_for(count):
+    """Brightness for a room with `count` people (None leaves the device's own setting)."""
+    if config.WLED_BRIGHTNESS is None:
+        return None
+    extra = max(0, count - 1) * config.WLED_BRIGHTNESS_STEP
+    return max(1, min(255, config.WLED_BRIGHTNESS + extra))
+
+class _Device:
+    """One WLED device: the state we want it in and the state it last acknowledged."""
+    def __init__(self, host):
+        self.host = host
+        self.url = f"http://{host}/json/state"
+        self.desired = None
+        self.acked = None # Unknown until the first successful post
+        self.version = 0 # Bumped on every new desired state
+        self.failing = False
+        self.thread = None
+
+class WLEDController:
+    """
+    Drives one or more WLED devices through their JSON API, off the frame loop.
+    turn_on()/turn_off() only record the desired state and return immediately.
+    Each device has its own worker thread, so a slow or offline ESP32 never
+    delays the others, and all of them share one keep-alive HTTP session.
+    Only the newest state is ever sent: posts that would not change anything
+    are skipped, and a failed post is retried with backoff until it lands or
+    a newer state replaces it.
+    """
+    def __init__(self, hosts=None, name=None):
+        hosts = config.WLED_HOSTS if hosts is None else hosts
+        self.devices = [_Device(host) for host in hosts]
+        self._cond = threading.Condition()
+        self._running = True
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max(1, len(self.devices)), pool_maxsize=1)
+        self.session.mount("http://", adapter)
+
+        # Stats
+        self.posted = 0
+        self.skipped = 0
+        self.failed = 0
+
+        labels = {'camera': name} if name else {}
+        REGISTRY.counter("wled_posts_total", "State updates delivered to WLED devices.", fn=lambda: self.posted, **labels)
+        REGISTRY.counter("wled_skipped_total", "State updates skipped because nothing changed.", fn=lambda: self.skipped, **labels)
+        REGISTRY.counter("wled_failed_total", "Failed WLED post attempts.", fn=lambda: self.failed, **labels)
+        REGISTRY.gauge("wled_devices_unreachable", "WLED devices whose last post failed.",
+                       fn=lambda: sum(d.failing for d in self.devices), **labels)
+
+        for device in self.devices:
+            device.thread = threading.Thread(target=self._device_thread, args=(device,),
+                                             name=f"wled-{device.host}", daemon=True)
+            device.thread.start()
+
+    # --- Public API ---
+
+    def turn_on(self, count=1):
+        """Lights on, at a brightness that follows the number of people in the room."""
+        state = {'on': True, 'transition': config.WLED_TRANSITION}
+        bri = brightness_for(count)
+        if bri is not None:
+            state['bri'] = bri
+        self._set(state)
+
+    def turn_off(self):
+        self._set({'on': False, 'transition': config.WLED_TRANSITION})
+
+    def pending(self):
+        """Devices not yet in the desired state."""
+        with self._cond:
+            return sum(1 for d in self.devices if d.desired is not None and d.desired != d.acked)
+
+    def stats(self):
+        return {
+            'posted': self.posted,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'unreachable': [d.host for d in self.devices if d.failing],
+        }
+
+    def close(self, timeout=2.0):
+        """Gives in-flight updates up to `timeout` seconds to land, then stops the workers."""
+        deadline = time.monotonic() + timeout
+        while self.pending() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self.session.close()
+
+    # --- Workers ---
+
+    def _set(self, state):
+        with self._cond:
+            for device in self.devices:
+                if state == device.desired:
+                    self.skipped += 1
+                    continue
+                device.desired = state
+                device.version += 1
+            self._cond.notify_all()
+
+    def _device_thread(self, device):
+        attempt = 0
+        while True:
+            with self._cond:
+                while self._running and (device.desired is None or device.desired == device.acked):
+                    attempt = 0
+                    self._cond.wait()
+                if not self._running:
+                    return
+                state, version = device.desired, device.version
+
+            ok = self._post(device, state)
+
+            with self._cond:
+                if ok:
+                    attempt = 0
+                    device.acked = state
+                    if device.failing:
+                        device.failing = False
+                        logging.info(f"WLED {device.host} reachable again.")
+                    continue
+                device.acked = None # Unknown after a failure
+                if device.version != version:
+                    continue # Newer state already waiting, send that instead
+
+                attempt += 1
+                delay = min(config.WLED_RETRY_MAX_DELAY,
+                            config.WLED_RETRY_BASE * (2 ** (attempt - 1))) * (0.5 + random.random())
+                # Wake early if the state changes or we are stopped
+                self._cond.wait_for(lambda: not self._running or device.version != version, timeout=delay)
+
+    def _post(self, device, state):
+        try:
+            started = time.perf_counter()
+            response = self.session.post(device.url, json=state, timeout=config.WLED_TIMEOUT)
+            observe_stage('wled_post', time.perf_counter() - started)
+            if response.status_code == 200:
+                self.posted += 1
+                logging.info(f"WLED {device.host} -> {state}")
+                return True
+            error = f"HTTP {response.status_code}"
+        except requests.RequestException as e:
+            error = str(e)
+
+        self.failed += 1
+        if not device.failing:
+            device.failing = True
+            logging.error(f"Failed to update WLED {device.host}: {error}. Retrying in the background.")
+        return False
@@ -0,0 +1,163 @@
+import os
+import json
+import logging
+import cv2
+import numpy as np
+import config
+
+DOOR_CONFIG_FILE = "door_config.json"
+
+# Zone types
+DOOR = "door" # Entries start and exits end here
+EXCLUDE = "exclude" # Detections here are ignored (TV, mirror, window...)
+INSIDE = "inside" # Where people may reappear after occlusion (optional)
+ZONE_TYPES = (DOOR, EXCLUDE, INSIDE)
+
+def rect_to_polygon(rect):
+    x1, y1, x2, y2 = rect
+    return [[x1, y1], [x2, y1], [x2, y2], [x1, y2]]
+
+class Zone:
+    __slots__ = ('name', 'type', 'points')
+
+    def __init__(self, name, type, points):
+        self.name = name
+        self.type = type
+        self.points = np.asarray(points, dtype=np.float32) # Proportional (0.0 - 1.0) polygon
+
+    def bounds(self):
+        """Proportional bounding box [x1, y1, x2, y2]."""
+        x1, y1 = self.points.min(axis=0)
+        x2, y2 = self.points.max(axis=0)
+        return [float(x1), float(y1), float(x2), float(y2)]
+
+    def to_json(self):
+        return {'name': self.name, 'type': self.type, 'points': self.points.tolist()}
+
+class ZoneConfig:
+    """
+    Named polygon zones (doors, exclusion areas, inside areas) loaded from
+    door_config.json. Point lookups go through a per-resolution label mask
+    (one bit per zone) that is built once per frame size and only rebuilt
+    when the zones change, so classifying every track center is a single
+    NumPy gather.
+
+    The old single-door format ({"rect": [...]}) still loads as one door zone,
+    and `rect` keeps working for the debug window's click-and-drag editing
+    (it edits the first door).
+    """
+    def __init__(self, path=DOOR_CONFIG_FILE):
+        self.path = path
+        self.zones = [Zone("door", DOOR, rect_to_polygon(config.DOOR_RECT))]
+        self.version = 0
+
+        # Debug window drag state
+        self.dragging = False
+        self.start_point = None
+        self.current_drag_rect = None
+
+        self._cache = {}
+        self._cache_version = -1
+
+    # --- Config ---
+
+    def load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+                zones = [Zone(z['name'], z.get('type', DOOR), z['points']) for z in data.get('zones', [])]
+                if not zones:
+                    zones = [Zone("door", DOOR, rect_to_polygon(data.get("rect", config.DOOR_RECT)))]
+                for zone in zones:
+                    if zone.type not in ZONE_TYPES:
+                        raise ValueError(f"Unknown zone type '{zone.type}' for zone '{zone.name}'")
+                self.zones = zones
+                self.version += 1
+            except Exception as e:
+                logging.error(f"Failed to load door config: {e}")
+
+    def save(self):
+        try:
+            with open(self.path, 'w') as f:
+                json.dump({"rect": self.rect, "zones": [z.to_json() for z in self.zones]}, f)
+        except Exception as e:
+            logging.error(f"Failed to save door config: {e}")
+
+    @property
+    def rect(self):
+        """Bounding box of the first door zone (legacy single-door API)."""
+        for zone in self.zones:
+            if zone.type == DOOR:
+                return zone.bounds()
+        return list(config.DOOR_RECT)
+
+    @rect.setter
+    def rect(self, rect):
+        for i, zone in enumerate(self.zones):
+            if zone.type == DOOR:
+                self.zones[i] = Zone(zone.name, DOOR, rect_to_polygon(rect))
+                break
+        else:
+            self.zones.insert(0, Zone("door", DOOR, rect_to_polygon(rect)))
+        self.version += 1
+
+    def door_rects(self):
+        """Proportional bounding boxes of all door zones."""
+        return [zone.bounds() for zone in self.zones if zone.type == DOOR]
+
+    def overlay_zones(self):
+        """(name, type, proportional points) for drawing."""
+        return tuple((zone.name, zone.type, zone.points) for zone in self.zones)
+
+    # --- Lookups ---
+
+    def _lookup(self, width, height):
+        """Label mask for this frame size: bit i is set where zone i covers the pixel."""
+        if self._cache_version != self.version:
+            self._cache.clear()
+            self._cache_version = self.version
+
+        entry = self._cache.get((width, height))
+        if entry is None:
+            dtype = np.uint8 if len(self.zones) <= 8 else np.uint32
+            mask = np.zeros((height, width), dtype=dtype)
+            scratch = np.zeros((height, width), dtype=np.uint8)
+            type_bits = dict.fromkeys(ZONE_TYPES, 0)
+            scale = np.array([width, height], dtype=np.float32)
+
+            for i, zone in enumerate(self.zones):
+                bit = 1 << i
+                polygon = np.round(zone.points * scale).astype(np.int32)
+                scratch[:] = 0
+                cv2.fillPoly(scratch, [polygon], 1)
+                mask[scratch > 0] |= dtype(bit)
+                type_bits[zone.type] |= bit
+
+            entry = (mask, type_bits)
+            self._cache[(width, height)] = entry
+        return entry
+
+    def classify(self, centers, width, height):
+        """
+        Zone membership of many points at once.
+        Args:
+            centers: (N, 2) pixel coordinates.
+        Returns:
+            (N,) int array of zone bits, and {type: bitmask} to test them against.
+        """
+        mask, type_bits = self._lookup(width, height)
+        centers = np.asarray(centers, dtype=np.int64).reshape(-1, 2)
+        xs = np.clip(centers[:, 0], 0, width - 1)
+        ys = np.clip(centers[:, 1], 0, height - 1)
+        return mask[ys, xs].astype(np.int64), type_bits
+
+    def zone_name(self, bits, zone_type):
+        """Name of the first zone of `zone_type` set in `bits` (or None)."""
+        for i, zone in enumerate(self.zones):
+            if zone.type == zone_type and bits & (1 << i):
+                return zone.name
+        return None
+
+    def has_type(self, zone_type):
+        return any(zone.type == zone_type for zone in self.zones)